@@ -1,7 +1,7 @@
 from typing import Generator, Optional
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from app.database import SessionLocal
 from app.core.security import verify_token
 from app.models.user import User
@@ -10,12 +10,15 @@ from uuid import UUID
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
 
-def get_db() -> Generator:
+def get_db(request: Request) -> Generator:
     """
     Database session dependency.
     Yields a database session and ensures cleanup.
+    Request context is attached to the session for audit logging.
     """
     db = SessionLocal()
+    db.info["ip_address"] = request.client.host if request.client else None
+    db.info["user_agent"] = request.headers.get("user-agent")
     try:
         yield db
     finally:
@@ -54,7 +57,8 @@ def get_current_user(
     except ValueError:
         raise credentials_exception
 
-    user = db.query(User).filter(User.id == user_uuid).first()
+    # Role is loaded with the user: the admin checks read it on every request
+    user = db.query(User).options(joinedload(User.role)).filter(User.id == user_uuid).first()
     if user is None:
         raise credentials_exception
 
@@ -64,6 +68,7 @@ def get_current_user(
             detail="User account is inactive"
         )
 
+    db.info["user_id"] = user.id
     return user
 
 
@@ -163,8 +168,9 @@ def get_optional_current_user(
     except ValueError:
         return None
 
-    user = db.query(User).filter(User.id == user_uuid).first()
+    user = db.query(User).options(joinedload(User.role)).filter(User.id == user_uuid).first()
     if user and user.is_active:
+        db.info["user_id"] = user.id
         return user
 
     return None
@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, timedelta, timezone
+from typing import Optional
+from uuid import UUID
 
 from app.api.deps import get_db, get_current_admin_user
 from app.models.user import User
-from app.models.wizard import Wizard
+from app.models.wizard import Wizard, OptionSet
 from app.models.analytics import AnalyticsEvent
+from app.services.dashboard_cache import dashboard_stats_cache
+from app.services.option_popularity import get_option_set_popularity, apply_recommendations
 
 router = APIRouter()
 
@@ -16,28 +18,11 @@ def get_dashboard_stats(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_admin_user)
 ):
-    """Get overall dashboard statistics."""
-    # Total counts
-    total_wizards = db.query(func.count(Wizard.id)).filter(Wizard.is_deleted == False).scalar()
-    published_wizards = db.query(func.count(Wizard.id)).filter(
-        Wizard.is_deleted == False,
-        Wizard.is_published == True
-    ).scalar()
-    total_users = db.query(func.count(User.id)).scalar()
-
-    # Recent activity (last 7 days)
-    week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-    wizards_created_this_week = db.query(func.count(Wizard.id)).filter(
-        Wizard.created_at >= week_ago,
-        Wizard.is_deleted == False
-    ).scalar()
-
-    return {
-        "total_wizards": total_wizards,
-        "published_wizards": published_wizards,
-        "wizards_created_this_week": wizards_created_this_week,
-        "total_users": total_users
-    }
+    """
+    Get overall dashboard statistics.
+    Served from a stale-while-revalidate cache; as_of tells when the numbers were computed.
+    """
+    return dashboard_stats_cache.get(db)
 
 
 @router.get("/wizards/performance")
@@ -47,7 +32,7 @@ def get_wizard_performance(
     current_user: User = Depends(get_current_admin_user)
 ):
     """Get wizard statistics."""
-    wizards = db.query(Wizard).filter(Wizard.is_deleted == False).all()
+    wizards = db.query(Wizard).filter(Wizard.is_active == True).all()
 
     performance_data = []
     for wizard in wizards:
@@ -61,3 +46,48 @@ def get_wizard_performance(
     # Sort by created_at
     performance_data.sort(key=lambda x: x["created_at"], reverse=True)
     return performance_data[:limit]
+
+
+@router.get("/option-sets/{option_set_id}/popularity")
+def get_option_set_popularity_stats(
+    option_set_id: UUID,
+    days: Optional[int] = Query(None, ge=1, le=3650, description="Only count the last N days"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Get selection count and share per option of an option set."""
+    option_set = db.query(OptionSet).filter(OptionSet.id == option_set_id).first()
+    if not option_set:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Option set not found"
+        )
+
+    options = get_option_set_popularity(db, option_set_id, days=days)
+    return {
+        "option_set_id": str(option_set_id),
+        "option_set_name": option_set.name,
+        "days": days,
+        "total_selections": sum(o["selection_count"] for o in options),
+        "options": options,
+    }
+
+
+@router.post("/option-sets/{option_set_id}/popularity/apply-recommended")
+def apply_option_set_recommendations(
+    option_set_id: UUID,
+    top_n: int = Query(1, ge=1, le=20, description="Number of options to mark as recommended"),
+    days: Optional[int] = Query(None, ge=1, le=3650, description="Only count the last N days"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Mark the most chosen options of an option set as recommended (Admin only)."""
+    option_set = db.query(OptionSet).filter(OptionSet.id == option_set_id).first()
+    if not option_set:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Option set not found"
+        )
+
+    recommended = apply_recommendations(db, option_set_id, top_n=top_n, days=days)
+    return {"option_set_id": str(option_set_id), "recommended_option_ids": recommended}
@@ -0,0 +1,57 @@
+"""
+Bundle API Endpoints
+
+Admin bulk export and import of templates and wizards as gzip-compressed NDJSON bundles.
+"""
+from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.api.deps import get_db, get_current_admin_user
+from app.models.user import User
+from app.services.wizard_bundle import stream_bundle, import_bundle
+
+router = APIRouter()
+
+
+@router.get("/export")
+def export_bundle(
+    templates: bool = Query(True, description="Include active templates"),
+    wizards: bool = Query(True, description="Include active wizards with their full structure"),
+    current_user: User = Depends(get_current_admin_user),
+):
+    """
+    Stream a gzip-compressed NDJSON bundle of templates and/or wizards (Admin only).
+    """
+    if not templates and not wizards:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Select at least one of templates or wizards"
+        )
+
+    return StreamingResponse(
+        stream_bundle(include_templates=templates, include_wizards=wizards),
+        media_type="application/gzip",
+        headers={"Content-Disposition": 'attachment; filename="wizard-bundle.ndjson.gz"'},
+    )
+
+
+@router.post("/import")
+def import_bundle_file(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user),
+):
+    """
+    Import a bundle (gzip-compressed or plain NDJSON) of templates and wizards (Admin only).
+    Records whose template name or wizard name already exists are skipped, so re-importing is safe.
+    Imported wizards are owned by the importing admin.
+    """
+    try:
+        return import_bundle(db, file.file, owner_id=current_user.id)
+    except (ValueError, OSError) as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid bundle: {e}"
+        )
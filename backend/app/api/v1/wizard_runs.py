@@ -4,6 +4,7 @@ Wizard Run API Endpoints
 REST API for wizard run execution, progress tracking, and storage.
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from uuid import UUID
@@ -13,6 +14,7 @@ import shutil
 
 from app.api.deps import get_db, get_current_user, get_optional_current_user
 from app.models.user import User
+from app.models.wizard_run import WizardRun
 from app.crud.wizard_run import (
     wizard_run_crud,
     wizard_run_step_response_crud,
@@ -40,8 +42,14 @@ from app.schemas.wizard_run import (
     WizardRunComparisonCreate,
     WizardRunComparisonResponse,
     WizardRunProgressUpdate,
+    WizardRunExportRequest,
+    WizardRunNextStepResponse,
     WizardRunStats,
 )
+from app.schemas.wizard import PriceQuoteResponse
+from app.services.run_export import stream_runs_ndjson, stream_runs_csv
+from app.services.flow_engine import flow_rule_engine
+from app.services.run_archive import run_archive_service
 
 router = APIRouter()
 
@@ -139,6 +147,75 @@ def get_wizard_run_stats(
     return WizardRunStats(**stats)
 
 
+@router.post("/export")
+def export_wizard_runs(
+    export_request: WizardRunExportRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Stream an export of a single run, a user's runs or all runs of a wizard, archived runs included
+    (after the others). json streams JSON Lines (one run per line), csv streams one row per option set response.
+    Memory stays flat regardless of the number of runs exported.
+    """
+    is_admin = current_user.role.name in ["admin", "super_admin"]
+
+    if export_request.format == "pdf":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="PDF export is not supported for streaming exports; use json or csv"
+        )
+
+    if export_request.run_id:
+        run = wizard_run_crud.get(db, run_id=export_request.run_id)
+        if not run:
+            archived = run_archive_service.get_archived_run(db, export_request.run_id)
+            run = archived.run if archived else None
+        if not run:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Wizard run not found"
+            )
+        if run.user_id and run.user_id != current_user.id and not is_admin:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to export this wizard run"
+            )
+        scope = f"run-{export_request.run_id}"
+    elif export_request.user_id:
+        if export_request.user_id != current_user.id and not is_admin:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to export runs of another user"
+            )
+        scope = f"user-{export_request.user_id}"
+    else:
+        if not is_admin:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not enough permissions"
+            )
+        scope = f"wizard-{export_request.wizard_id}"
+
+    stream_kwargs = dict(
+        run_id=export_request.run_id,
+        user_id=export_request.user_id,
+        wizard_id=export_request.wizard_id,
+        include_metadata=export_request.include_metadata,
+        include_files=export_request.include_files,
+    )
+    if export_request.format == "csv":
+        content, media_type, extension = stream_runs_csv(**stream_kwargs), "text/csv", "csv"
+    else:
+        content, media_type, extension = stream_runs_ndjson(**stream_kwargs), "application/x-ndjson", "jsonl"
+
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="wizard-runs-{scope}.{extension}"'},
+    )
+
+
 @router.get("/{run_id}", response_model=WizardRunDetailResponse)
 def get_wizard_run(
     run_id: UUID,
@@ -150,11 +227,15 @@ def get_wizard_run(
     Supports anonymous access via share links (handled by get_optional_current_user).
     """
     run = wizard_run_crud.get(db, run_id=run_id)
+    archived = None
     if not run:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Wizard run not found"
-        )
+        archived = run_archive_service.get_archived_run(db, run_id)
+        if archived is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Wizard run not found"
+            )
+        run = archived.run
 
     # Check authorization if user is authenticated
     if current_user and run.user_id and run.user_id != current_user.id:
@@ -163,6 +244,14 @@ def get_wizard_run(
             detail="Not authorized to access this wizard run"
         )
 
+    if archived is not None:
+        return WizardRunDetailResponse(
+            **run.__dict__,
+            step_responses=archived.step_responses,
+            option_set_responses=archived.option_set_responses,
+            file_uploads=archived.file_uploads,
+        )
+
     # Get all related responses
     step_responses = wizard_run_step_response_crud.get_multi_by_run(db, run_id=run_id)
     option_set_responses = wizard_run_option_set_response_crud.get_multi_by_run(db, run_id=run_id)
@@ -176,6 +265,91 @@ def get_wizard_run(
     )
 
 
+@router.get("/{run_id}/price", response_model=PriceQuoteResponse)
+def get_run_price(
+    run_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_optional_current_user),
+):
+    """Current price of a run and its per option set contributions (maintained as responses are saved)."""
+    run = db.query(WizardRun.user_id, WizardRun.calculated_price, WizardRun.price_breakdown)\
+        .filter(WizardRun.id == run_id).first()
+    if not run:
+        archived = run_archive_service.get_archived_run(db, run_id)
+        run = archived.run if archived else None
+    if not run:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Wizard run not found"
+        )
+
+    if current_user and run.user_id and run.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this wizard run"
+        )
+
+    option_sets = (run.price_breakdown or {}).get("option_sets", {})
+    return {
+        "calculated_price": run.calculated_price,
+        "option_sets": {
+            option_set_id: {"amount": amount, "multiplier": multiplier}
+            for option_set_id, (amount, multiplier) in option_sets.items()
+        },
+    }
+
+
+@router.get("/{run_id}/next-step", response_model=WizardRunNextStepResponse)
+def get_next_step(
+    run_id: UUID,
+    from_step_id: Optional[UUID] = Query(None, description="Step being left (defaults to the run's current step)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_optional_current_user),
+):
+    """
+    Resolve the next step of a run from the wizard's flow rules and the run's saved answers.
+    Falls back to step order when no rule leaving the step matches.
+    """
+    run = wizard_run_crud.get(db, run_id=run_id)
+    archived = None
+    if not run:
+        archived = run_archive_service.get_archived_run(db, run_id)
+        run = archived.run if archived else None
+    if not run:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Wizard run not found"
+        )
+
+    if current_user and run.user_id and run.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this wizard run"
+        )
+
+    if from_step_id is None:
+        flow = flow_rule_engine.get_flow(db, run.wizard_id)
+        index = run.current_step_index or 0
+        if index >= len(flow.step_sequence):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Run has no current step"
+            )
+        from_step_id = flow.step_sequence[index]
+
+    if archived is not None:
+        answers = flow_rule_engine.answers_from_responses(db, archived.option_set_responses)
+    else:
+        answers = flow_rule_engine.load_answers(db, run_id)
+    try:
+        return flow_rule_engine.resolve_next_step(db, run.wizard_id, from_step_id, answers)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
 @router.post("/", response_model=WizardRunResponse, status_code=status.HTTP_201_CREATED)
 def create_wizard_run(
     run_in: WizardRunCreate,
@@ -198,7 +372,7 @@ def update_wizard_run(
     current_user: User = Depends(get_current_user),
 ):
     """Update a wizard run."""
-    run = wizard_run_crud.get(db, run_id=run_id)
+    run = wizard_run_crud.get_for_write(db, run_id=run_id)
     if not run:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -222,7 +396,7 @@ def update_run_progress(
     current_user: User = Depends(get_optional_current_user),
 ):
     """Update wizard run progress (auto-save during execution)."""
-    run = wizard_run_crud.get(db, run_id=run_id)
+    run = wizard_run_crud.get_for_write(db, run_id=run_id)
     if not run:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -246,7 +420,7 @@ def complete_wizard_run(
     current_user: User = Depends(get_optional_current_user),
 ):
     """Complete a wizard run."""
-    run = wizard_run_crud.get(db, run_id=run_id)
+    run = wizard_run_crud.get_for_write(db, run_id=run_id)
     if not run:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -276,7 +450,7 @@ def abandon_wizard_run(
     current_user: User = Depends(get_current_user),
 ):
     """Mark a wizard run as abandoned."""
-    run = wizard_run_crud.get(db, run_id=run_id)
+    run = wizard_run_crud.get_for_write(db, run_id=run_id)
     if not run:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -299,7 +473,7 @@ def delete_wizard_run(
     current_user: User = Depends(get_current_user),
 ):
     """Delete a wizard run."""
-    run = wizard_run_crud.get(db, run_id=run_id)
+    run = wizard_run_crud.get_for_write(db, run_id=run_id)
     if not run:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -334,6 +508,8 @@ def create_step_response(
             detail="Run ID in body must match run ID in URL"
         )
 
+    # Responses of an archived run are written to the restored run
+    run_archive_service.restore(db, run_id)
     return wizard_run_step_response_crud.create(db, obj_in=step_response_in)
 
 
@@ -362,7 +538,7 @@ def clear_all_responses(
     current_user: User = Depends(get_optional_current_user),
 ):
     """Delete all step and option set responses for a wizard run (for updates)."""
-    run = wizard_run_crud.get(db, run_id=run_id)
+    run = wizard_run_crud.get_for_write(db, run_id=run_id)
     if not run:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -398,6 +574,8 @@ def create_option_set_response(
             detail="Run ID in body must match run ID in URL"
         )
 
+    # Responses of an archived run are written to the restored run
+    run_archive_service.restore(db, run_id)
     return wizard_run_option_set_response_crud.create(db, obj_in=option_set_response_in)
 
 
@@ -433,7 +611,7 @@ async def upload_file_to_run(
 ):
     """Upload a file for a wizard run option set response."""
     # Verify run exists
-    run = wizard_run_crud.get(db, run_id=run_id)
+    run = wizard_run_crud.get_for_write(db, run_id=run_id)
     if not run:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -489,7 +667,7 @@ def create_run_share(
             detail="Run ID in body must match run ID in URL"
         )
 
-    run = wizard_run_crud.get(db, run_id=run_id)
+    run = wizard_run_crud.get_for_write(db, run_id=run_id)
     if not run:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -513,9 +691,18 @@ def get_run_by_share_token(
     """Access a wizard run via share token (public endpoint)."""
     share = wizard_run_share_crud.get_by_token(db, share_token=share_token)
     if not share:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Invalid or expired share link"
+        # Shares of archived runs live in the archive document (access is not counted there)
+        archived = run_archive_service.get_archived_run_by_share_token(db, share_token)
+        if archived is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Invalid or expired share link"
+            )
+        return WizardRunDetailResponse(
+            **archived.run.__dict__,
+            step_responses=archived.step_responses,
+            option_set_responses=archived.option_set_responses,
+            file_uploads=archived.file_uploads,
         )
 
     # Increment access count
@@ -554,8 +741,9 @@ def create_run_comparison(
 ):
     """Create a comparison of multiple wizard runs."""
     # Verify all runs exist and belong to user
+    runs = wizard_run_crud.get_many(db, run_ids=comparison_in.run_ids)
     for run_id in comparison_in.run_ids:
-        run = wizard_run_crud.get(db, run_id=run_id)
+        run = runs.get(run_id)
         if not run:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
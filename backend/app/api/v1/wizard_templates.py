@@ -3,7 +3,8 @@ Wizard Template API Endpoints
 
 REST API for wizard template management, ratings, and cloning.
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from uuid import UUID
@@ -12,23 +13,38 @@ import math
 from app.api.deps import get_db, get_current_user, get_current_admin_user
 from app.models.user import User
 from app.crud.wizard_template import wizard_template_crud, wizard_template_rating_crud
-from app.crud.wizard import wizard_crud
 from app.schemas.wizard_template import (
     WizardTemplateCreate,
     WizardTemplateUpdate,
     WizardTemplateResponse,
     WizardTemplateListResponse,
+    WizardTemplateSearchResponse,
+    WizardTemplateSimilarResult,
     WizardTemplateRatingCreate,
-    WizardTemplateRatingUpdate,
     WizardTemplateRatingResponse,
     WizardTemplateStats,
     WizardTemplateCloneRequest,
     WizardTemplateCloneResponse,
 )
 from app.schemas.wizard import WizardCreate
+from app.services.template_feed_cache import template_feed_cache
+from app.services.wizard_materializer import materialize_wizard
+from app.services.template_similarity import template_similarity_index
 
 router = APIRouter()
 
+_template_list_adapter = TypeAdapter(List[WizardTemplateResponse])
+
+
+def _serialize_templates(templates) -> bytes:
+    """Serialize ORM templates exactly as the response_model would."""
+    validated = _template_list_adapter.validate_python(templates, from_attributes=True)
+    return _template_list_adapter.dump_json(validated, by_alias=True)
+
+
+def _json_response(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
 
 # ============================================================================
 # Template CRUD Endpoints
@@ -46,24 +62,71 @@ def list_templates(
 ):
     """
     Get list of wizard templates with filtering and pagination.
+    The unfiltered list is served from the feed cache.
+    Public endpoint - no authentication required.
+    """
+    def build_page() -> WizardTemplateListResponse:
+        templates, total = wizard_template_crud.get_multi(
+            db,
+            skip=skip,
+            limit=limit,
+            category=category,
+            difficulty_level=difficulty_level,
+            is_system_template=is_system_template,
+            is_active=True,
+            search=search,
+        )
+
+        total_pages = math.ceil(total / limit) if limit > 0 else 0
+        current_page = (skip // limit) + 1 if limit > 0 else 1
+
+        return WizardTemplateListResponse(
+            templates=templates,
+            total=total,
+            page=current_page,
+            page_size=limit,
+            total_pages=total_pages,
+        )
+
+    if category or difficulty_level or is_system_template is not None or search:
+        return build_page()
+
+    return _json_response(template_feed_cache.get_or_build(
+        ("list", skip, limit),
+        lambda: build_page().model_dump_json(by_alias=True).encode(),
+    ))
+
+
+@router.get("/search", response_model=WizardTemplateSearchResponse)
+def search_templates(
+    q: str = Query(..., min_length=1, max_length=200),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    category: Optional[str] = None,
+    difficulty_level: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Search templates by name, description, category and tags.
+    Results are ranked by relevance, tolerate typos in the name and include
+    highlighted fragments (matches wrapped in <mark>).
     Public endpoint - no authentication required.
     """
-    templates, total = wizard_template_crud.get_multi(
+    results, total = wizard_template_crud.search(
         db,
+        q=q,
         skip=skip,
         limit=limit,
         category=category,
         difficulty_level=difficulty_level,
-        is_system_template=is_system_template,
-        is_active=True,
-        search=search,
     )
 
     total_pages = math.ceil(total / limit) if limit > 0 else 0
     current_page = (skip // limit) + 1 if limit > 0 else 1
 
-    return WizardTemplateListResponse(
-        templates=templates,
+    return WizardTemplateSearchResponse(
+        query=q,
+        results=results,
         total=total,
         page=current_page,
         page_size=limit,
@@ -77,7 +140,10 @@ def get_popular_templates(
     db: Session = Depends(get_db),
 ):
     """Get most popular templates by usage count."""
-    return wizard_template_crud.get_popular(db, limit=limit)
+    return _json_response(template_feed_cache.get_or_build(
+        ("popular", limit),
+        lambda: _serialize_templates(wizard_template_crud.get_popular(db, limit=limit)),
+    ))
 
 
 @router.get("/top-rated", response_model=List[WizardTemplateResponse])
@@ -86,7 +152,10 @@ def get_top_rated_templates(
     db: Session = Depends(get_db),
 ):
     """Get top rated templates."""
-    return wizard_template_crud.get_top_rated(db, limit=limit)
+    return _json_response(template_feed_cache.get_or_build(
+        ("top_rated", limit),
+        lambda: _serialize_templates(wizard_template_crud.get_top_rated(db, limit=limit)),
+    ))
 
 
 @router.get("/categories/{category}", response_model=List[WizardTemplateResponse])
@@ -95,7 +164,10 @@ def get_templates_by_category(
     db: Session = Depends(get_db),
 ):
     """Get all templates in a specific category."""
-    return wizard_template_crud.get_by_category(db, category=category)
+    return _json_response(template_feed_cache.get_or_build(
+        ("category", category),
+        lambda: _serialize_templates(wizard_template_crud.get_by_category(db, category=category)),
+    ))
 
 
 @router.get("/{template_id}", response_model=WizardTemplateResponse)
@@ -113,6 +185,28 @@ def get_template(
     return template
 
 
+@router.get("/{template_id}/similar", response_model=List[WizardTemplateSimilarResult])
+def get_similar_templates(
+    template_id: UUID,
+    limit: int = Query(5, ge=1, le=50),
+    db: Session = Depends(get_db),
+):
+    """
+    Get templates similar to a template ("more like this").
+    Served from the precomputed neighbor index, most similar first.
+    """
+    similar = template_similarity_index.get_similar(db, template_id, limit=limit)
+    if not similar and not wizard_template_crud.get(db, template_id=template_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Template not found"
+        )
+    return [
+        WizardTemplateSimilarResult(template=template, score=score)
+        for template, score in similar
+    ]
+
+
 @router.post("/", response_model=WizardTemplateResponse, status_code=status.HTTP_201_CREATED)
 def create_template(
     template_in: WizardTemplateCreate,
@@ -201,28 +295,29 @@ def clone_template_to_wizard(
     if clone_request.customizations:
         wizard_structure.update(clone_request.customizations)
 
-    # Create wizard from template
-    wizard_data = WizardCreate(
-        name=clone_request.wizard_name,
-        description=clone_request.wizard_description or template.template_description,
-        category_id=wizard_structure.get('category_id'),
-        icon=template.icon,
-        difficulty_level=template.difficulty_level,
-        estimated_time=template.estimated_time,
-        is_published=False,  # Start as unpublished
-        **wizard_structure
+    # Create wizard from template; request and template fields take precedence over the structure
+    wizard_data = WizardCreate(**{
+        **wizard_structure,
+        "name": clone_request.wizard_name,
+        "description": clone_request.wizard_description or template.template_description,
+        "category_id": wizard_structure.get('category_id'),
+        "icon": template.icon,
+        "difficulty_level": template.difficulty_level,
+        "estimated_time": template.estimated_time,
+        "is_published": False,  # Start as unpublished
+    })
+
+    # Materialize the whole tree with one multi-row INSERT per table
+    wizard_id = materialize_wizard(
+        db, wizard_data, created_by=current_user.id, raw_structure=wizard_structure
     )
 
-    # Create the wizard
-    from app.crud.wizard import wizard_crud
-    wizard = wizard_crud.create(db, obj_in=wizard_data, creator_id=current_user.id)
-
     # Increment template usage count
     wizard_template_crud.increment_usage_count(db, template_id=clone_request.template_id)
 
     return WizardTemplateCloneResponse(
-        wizard_id=wizard.id,
-        message=f"Template '{template.template_name}' successfully cloned to wizard '{wizard.name}'"
+        wizard_id=wizard_id,
+        message=f"Template '{template.template_name}' successfully cloned to wizard '{wizard_data.name}'"
     )
 
 
@@ -263,15 +358,12 @@ def get_template_stats(
             detail="Template not found"
         )
 
-    rating_distribution = wizard_template_rating_crud.get_rating_distribution(db, template_id=template_id)
-    total_ratings = sum(rating_distribution.values())
-
     return WizardTemplateStats(
         template_id=template_id,
         usage_count=template.usage_count,
         average_rating=template.average_rating,
-        total_ratings=total_ratings,
-        rating_distribution=rating_distribution,
+        total_ratings=template.rating_count,
+        rating_distribution=template.rating_distribution,
     )
 
 
@@ -301,26 +393,15 @@ def create_template_rating(
             detail="Template ID in body must match template ID in URL"
         )
 
-    # Check if user already rated this template
-    existing_rating = wizard_template_rating_crud.get_by_user_and_template(
-        db, user_id=current_user.id, template_id=template_id
+    # Insert or replace the user's rating (unique per user and template)
+    return wizard_template_rating_crud.upsert(
+        db,
+        template_id=template_id,
+        user_id=current_user.id,
+        rating=rating_in.rating,
+        review_text=rating_in.review_text,
     )
 
-    if existing_rating:
-        # Update existing rating
-        rating_update = WizardTemplateRatingUpdate(
-            rating=rating_in.rating,
-            review_text=rating_in.review_text
-        )
-        return wizard_template_rating_crud.update(
-            db, db_obj=existing_rating, obj_in=rating_update
-        )
-    else:
-        # Create new rating
-        return wizard_template_rating_crud.create(
-            db, obj_in=rating_in, user_id=current_user.id
-        )
-
 
 @router.delete("/{template_id}/ratings", status_code=status.HTTP_204_NO_CONTENT)
 def delete_template_rating(
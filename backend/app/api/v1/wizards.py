@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from uuid import UUID
@@ -10,9 +11,17 @@ from app.schemas.wizard import (
     WizardCategoryCreate, WizardCategoryResponse,
     StepCreate, StepUpdate, StepResponse,
     FlowRuleCreate, FlowRuleUpdate, FlowRuleResponse,
-    OptionDependencyCreate, OptionDependencyResponse
+    OptionDependencyCreate, OptionDependencyResponse,
+    OptionStateRequest, WizardOptionStateResponse,
+    PriceQuoteRequest, PriceQuoteResponse,
+    WizardVersionResponse, BackgroundJobResponse
 )
 from app.models.user import User
+from app.models.wizard import Wizard, WizardVersion
+from app.services.flow_engine import compile_condition
+from app.services.option_dependency_graph import dependency_graph_compiler
+from app.services.pricing_engine import pricing_engine
+from app.services.wizard_versions import checkout_tree
 
 router = APIRouter()
 
@@ -92,14 +101,13 @@ def get_wizard_protection_status(
     """
     from app.services.wizard_protection import WizardProtectionService
 
-    wizard = wizard_crud.get(db, wizard_id)
-    if not wizard:
+    status_info = WizardProtectionService.get_wizard_state(db, wizard_id)
+    if status_info is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Wizard not found"
         )
 
-    status_info = WizardProtectionService.get_wizard_state(db, wizard_id)
     return status_info
 
 
@@ -130,6 +138,69 @@ def get_wizard(
     return wizard
 
 
+@router.post("/{wizard_id}/option-state", response_model=WizardOptionStateResponse)
+def evaluate_option_state(
+    wizard_id: UUID,
+    state_in: OptionStateRequest,
+    db: Session = Depends(get_db),
+    current_user: Optional[User] = Depends(get_optional_current_user)
+):
+    """
+    Evaluate option dependencies for a set of selected options.
+    Returns visibility and disabled state per option and required/disabled state per option set.
+    """
+    # Publication check only; the compiled graph does not need the loaded tree, but a
+    # new version's option rows must exist before it is compiled
+    is_published = db.query(Wizard.is_published).filter(Wizard.id == wizard_id).scalar()
+    is_admin = current_user is not None and current_user.role.name in ["admin", "super_admin"]
+    if is_published is None or (not is_published and not is_admin):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Wizard not found"
+        )
+
+    checkout_tree(db, wizard_id)
+    graph = dependency_graph_compiler.get_graph(db, wizard_id)
+    return graph.evaluate(state_in.selected_option_ids)
+
+
+@router.post("/{wizard_id}/price-quote", response_model=PriceQuoteResponse)
+def get_price_quote(
+    wizard_id: UUID,
+    quote_in: PriceQuoteRequest,
+    db: Session = Depends(get_db),
+    current_user: Optional[User] = Depends(get_optional_current_user)
+):
+    """Price a set of selected options from the wizard's option price rules."""
+    is_published = db.query(Wizard.is_published).filter(Wizard.id == wizard_id).scalar()
+    is_admin = current_user is not None and current_user.role.name in ["admin", "super_admin"]
+    if is_published is None or (not is_published and not is_admin):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Wizard not found"
+        )
+
+    checkout_tree(db, wizard_id)
+    return pricing_engine.quote(db, wizard_id, quote_in.selected_option_ids)
+
+
+@router.post("/{wizard_id}/recompute-prices")
+def recompute_wizard_prices(
+    wizard_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Recompute calculated_price of every run of a wizard after pricing changes (Admin only)."""
+    if not db.query(Wizard.id).filter(Wizard.id == wizard_id).first():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Wizard not found"
+        )
+
+    runs_updated = pricing_engine.recompute_wizard(db, wizard_id)
+    return {"message": f"Recomputed prices of {runs_updated} run(s)", "runs_updated": runs_updated}
+
+
 @router.put("/{wizard_id}", response_model=WizardResponse)
 def update_wizard(
     wizard_id: UUID,
@@ -141,8 +212,8 @@ def update_wizard(
     """Update wizard (Admin only) with protection checks."""
     from app.services.wizard_protection import WizardProtectionService
 
-    wizard = wizard_crud.get(db, wizard_id)
-    if not wizard:
+    # Existence, archive flag and run counts come from one memoized query
+    if WizardProtectionService.get_wizard_state(db, wizard_id) is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Wizard not found"
@@ -156,19 +227,45 @@ def update_wizard(
             detail=reason
         )
 
-    # If there's a warning and user hasn't forced, return warning
+    # If there's a warning and user hasn't forced, return warning, unless the
+    # update provably leaves every existing response intact
     if reason and not force:
+        impact = WizardProtectionService.analyze_edit_impact(db, wizard_id, wizard_in)
+        if impact["runs"]["affected"]:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=jsonable_encoder({
+                    "message": f"Warning: {impact['runs']['affected']} run(s) have responses this update would remove or invalidate",
+                    "requires_confirmation": True,
+                    "hint": "Add force=true to confirm and proceed",
+                    "impact": impact,
+                })
+            )
+
+    wizard = wizard_crud.update(db, db.get(Wizard, wizard_id), wizard_in)
+    return wizard
+
+
+@router.post("/{wizard_id}/edit-impact")
+def get_wizard_edit_impact(
+    wizard_id: UUID,
+    wizard_in: WizardUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Preview which runs and responses a proposed update would orphan or invalidate (Admin only).
+    Nothing is saved.
+    """
+    from app.services.wizard_protection import WizardProtectionService
+
+    if not db.query(Wizard.id).filter(Wizard.id == wizard_id).first():
         raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail={
-                "message": reason,
-                "requires_confirmation": True,
-                "hint": "Add force=true to confirm and proceed"
-            }
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Wizard not found"
         )
 
-    wizard = wizard_crud.update(db, wizard, wizard_in)
-    return wizard
+    return WizardProtectionService.analyze_edit_impact(db, wizard_id, wizard_in)
 
 
 @router.put("/{wizard_id}/publish")
@@ -200,8 +297,7 @@ def delete_wizard(
     """Soft delete wizard (Admin only) with protection checks."""
     from app.services.wizard_protection import WizardProtectionService
 
-    wizard = wizard_crud.get(db, wizard_id)
-    if not wizard:
+    if WizardProtectionService.get_wizard_state(db, wizard_id) is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Wizard not found"
@@ -215,7 +311,7 @@ def delete_wizard(
             detail=reason
         )
 
-    wizard_crud.soft_delete(db, wizard)
+    wizard_crud.soft_delete(db, db.get(Wizard, wizard_id))
     return {"message": "Wizard deleted successfully", "warning": reason if reason else None}
 
 
@@ -278,7 +374,8 @@ def create_wizard_version(
     versioned_wizard = WizardProtectionService.create_wizard_version(
         db=db,
         wizard_id=wizard_id,
-        new_name=new_name
+        new_name=new_name,
+        created_by=current_user.id,
     )
 
     if not versioned_wizard:
@@ -287,7 +384,68 @@ def create_wizard_version(
             detail="Failed to create wizard version"
         )
 
-    return versioned_wizard
+    # The service leaves the new version's rows to be written on first use; the
+    # response carries the full tree, so write them now
+    return wizard_crud.get(db, versioned_wizard.id)
+
+
+@router.get("/{wizard_id}/versions", response_model=List[WizardVersionResponse])
+def list_wizard_versions(
+    wizard_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """List the snapshots of a wizard, newest first (Admin only)."""
+    return db.query(WizardVersion)\
+        .filter(WizardVersion.wizard_id == wizard_id)\
+        .order_by(WizardVersion.sequence.desc())\
+        .all()
+
+
+@router.post("/{wizard_id}/versions", response_model=WizardVersionResponse, status_code=status.HTTP_201_CREATED)
+def snapshot_wizard_version(
+    wizard_id: UUID,
+    label: Optional[str] = Query(None, max_length=255),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Record a snapshot of the wizard's current tree (Admin only).
+    Only steps changed since the last snapshot are hashed and stored; returns the
+    last snapshot if nothing changed.
+    """
+    from app.services.wizard_versions import snapshot_wizard
+
+    version = snapshot_wizard(db, wizard_id, label=label, created_by=current_user.id)
+    if not version:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Wizard not found"
+        )
+    return version
+
+
+@router.get("/versions/diff")
+def diff_wizard_versions(
+    from_version_id: UUID,
+    to_version_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Structural diff between two snapshots, e.g. of a wizard and its new version (Admin only).
+    Unchanged subtrees are recognized by hash and never loaded.
+    """
+    from app.services.wizard_versions import diff_versions
+
+    from_version = db.get(WizardVersion, from_version_id)
+    to_version = db.get(WizardVersion, to_version_id)
+    if not from_version or not to_version:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Version not found"
+        )
+    return diff_versions(db, from_version, to_version)
 
 
 @router.post("/{wizard_id}/archive")
@@ -347,7 +505,7 @@ def unarchive_wizard(
     return {"message": "Wizard unarchived successfully"}
 
 
-@router.post("/{wizard_id}/delete-all-runs")
+@router.post("/{wizard_id}/delete-all-runs", response_model=BackgroundJobResponse, status_code=status.HTTP_202_ACCEPTED)
 def delete_all_wizard_runs(
     wizard_id: UUID,
     confirm: bool = Query(False, description="Must be true to confirm deletion"),
@@ -356,7 +514,8 @@ def delete_all_wizard_runs(
 ):
     """
     Delete all runs for a wizard (use for in-use wizards before modification).
-    Requires confirmation parameter.
+    Requires confirmation parameter. Deletion runs in the background; poll
+    /wizards/deletion-jobs/{job_id} for progress.
     """
     from app.services.wizard_protection import WizardProtectionService
 
@@ -366,23 +525,40 @@ def delete_all_wizard_runs(
             detail="Must set confirm=true to delete all runs"
         )
 
-    wizard = wizard_crud.get(db, wizard_id)
-    if not wizard:
+    # Check wizard state - should not delete runs from published wizards
+    state_info = WizardProtectionService.get_wizard_state(db, wizard_id)
+    if state_info is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Wizard not found"
         )
 
-    # Check wizard state - should not delete runs from published wizards
-    state_info = WizardProtectionService.get_wizard_state(db, wizard_id)
     if state_info["state"] == "published":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Cannot delete runs from published wizard with stored data"
         )
 
-    count = WizardProtectionService.delete_all_runs_for_wizard(db, wizard_id)
-    return {"message": f"Deleted {count} run(s) successfully", "count": count}
+    job = WizardProtectionService.delete_all_runs_for_wizard(db, wizard_id, requested_by=current_user.id)
+    return job
+
+
+@router.get("/deletion-jobs/{job_id}", response_model=BackgroundJobResponse)
+def get_deletion_job(
+    job_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Get status and progress of a run deletion job (Admin only)."""
+    from app.services.run_deletion import run_deletion_service
+
+    job = run_deletion_service.get_job(db, job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job
 
 
 # Step endpoints
@@ -473,6 +649,17 @@ def delete_step(
 
 
 # Flow Rule endpoints
+def _validate_flow_rule_condition(condition: dict) -> None:
+    """Reject conditions the flow engine cannot compile."""
+    try:
+        compile_condition(condition)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid flow rule condition: {e}"
+        )
+
+
 @router.get("/{wizard_id}/flow-rules", response_model=List[FlowRuleResponse])
 def get_wizard_flow_rules(
     wizard_id: UUID,
@@ -511,6 +698,8 @@ def create_flow_rule(
             detail="Wizard ID mismatch"
         )
 
+    _validate_flow_rule_condition(rule_in.condition)
+
     rule = flow_rule_crud.create(db, obj_in=rule_in)
     return rule
 
@@ -546,6 +735,9 @@ def update_flow_rule(
             detail="Flow rule not found"
         )
 
+    if rule_in.condition is not None:
+        _validate_flow_rule_condition(rule_in.condition)
+
     rule = flow_rule_crud.update(db, rule, rule_in)
     return rule
 
@@ -608,8 +800,14 @@ def create_option_dependency(
             detail="Depends on option not found"
         )
 
-    # Create the dependency
-    dependency = option_dependency_crud.create(db, obj_in=dependency_in, option_id=option_id)
+    # Create the dependency (rejects cycles and contradicting edges)
+    try:
+        dependency = option_dependency_crud.create(db, obj_in=dependency_in, option_id=option_id)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     return dependency
 
 
@@ -69,6 +69,43 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = "./uploads"
     ALLOWED_EXTENSIONS: List[str] = ["jpg", "jpeg", "png", "pdf", "doc", "docx"]
 
+    # Admin dashboard cache (stale-while-revalidate)
+    DASHBOARD_CACHE_TTL: int = 60  # seconds a snapshot is served as fresh
+    DASHBOARD_CACHE_MAX_STALE: int = 300  # extra seconds served stale while refreshing
+
+    # Wizard run counters are buffered in memory and flushed periodically
+    WIZARD_COUNTER_FLUSH_INTERVAL: float = 5.0  # seconds
+
+    # Audit log writer (background, batched)
+    AUDIT_QUEUE_MAX_SIZE: int = 10000  # entries buffered before new ones are dropped
+    AUDIT_BATCH_SIZE: int = 500
+    AUDIT_FLUSH_INTERVAL: float = 2.0  # seconds
+
+    # Template gallery feed cache
+    TEMPLATE_FEED_CACHE_TTL: float = 30.0  # seconds; safety net on top of write invalidation
+    TEMPLATE_FEED_CACHE_MAX_ENTRIES: int = 256
+
+    # Similar templates index
+    TEMPLATE_SIMILAR_TOP_K: int = 10  # neighbors stored per template
+
+    # Background run deletion (delete-all-runs)
+    RUN_DELETION_BATCH_SIZE: int = 500  # runs deleted per transaction
+    RUN_DELETION_BATCH_PAUSE: float = 0.2  # seconds between batches
+    RUN_DELETION_STALE_AFTER: int = 300  # seconds without progress before a running job is resumed
+
+    # Stale run sweeper (marks inactive in-progress runs abandoned)
+    RUN_ABANDON_AFTER_HOURS: int = 72  # default inactivity threshold; wizards may override; 0 = only wizards that set one
+    RUN_SWEEP_BATCH_SIZE: int = 500  # runs marked per transaction
+    RUN_SWEEP_INTERVAL: int = 600  # seconds between sweeps
+
+    # Run archive (cold tier for old completed/abandoned runs)
+    RUN_ARCHIVE_AFTER_DAYS: int = 365  # days since last access before a run is archived; 0 disables
+    RUN_ARCHIVE_BATCH_SIZE: int = 200  # runs archived per transaction
+    RUN_ARCHIVE_INTERVAL: int = 3600  # seconds between archive passes
+
+    # Per-request SQL statistics (X-DB-Queries / X-DB-Time headers outside production)
+    SQL_N_PLUS_ONE_THRESHOLD: int = 5  # executions of one statement shape in a request logged as likely N+1; 0 disables
+
     # Rate Limiting
     RATE_LIMIT_REQUESTS: int = 100
     RATE_LIMIT_PERIOD: int = 60  # seconds
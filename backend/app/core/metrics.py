@@ -0,0 +1,322 @@
+"""
+Prometheus Metrics
+
+Process-local metrics rendered in the Prometheus text format (0.0.4), without a
+client library:
+1. An ASGI middleware records per-route latency histograms, status counts and
+   in-flight requests; routes are labeled by their path template, never the raw path
+2. Pool events count DB connection checkouts and time the wait for a connection
+3. Gauges that are cheap to read (threadpool usage, pool size, cache hit counts)
+   are sampled when /metrics is scraped instead of being maintained per request
+
+Each worker process keeps its own metrics; scrape every worker (or run one).
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+import anyio.to_thread
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic counter per label set."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        if not values and not self.labels:
+            values = [((), 0)]
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+            for label_values, value in values
+        ]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down (no labels)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value -= amount
+
+    def render(self) -> List[str]:
+        return self._header() + [f"{self.name} {_format_value(self._value)}"]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram per label set."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List] = {}  # label values -> [bucket counts (+Inf last), sum, count]
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = [(label_values, list(counts), total, count) for label_values, (counts, total, count) in self._series.items()]
+        lines = self._header()
+        bucket_labels = self.labels + ("le",)
+        for label_values, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels, label_values + (_format_value(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {count}")
+        return lines
+
+
+class SampledGauge(_Metric):
+    """Gauge (or counter) whose values are read from a callback at scrape time."""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str], sample: Callable[[], Iterable[Tuple[LabelValues, float]]], kind: str = "gauge"):
+        super().__init__(name, documentation, labels)
+        self.kind = kind
+        self._sample = sample
+
+    def render(self) -> List[str]:
+        try:
+            samples = list(self._sample())
+        except Exception as e:
+            print(f"[WARN] Could not sample metric {self.name}: {e}")
+            samples = []
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+            for label_values, value in samples
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests_total = registry.register(Counter(
+    "http_requests_total", "HTTP requests by method, route template and status code.", ("method", "route", "status"),
+))
+http_request_duration_seconds = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route template.", ("method", "route"),
+))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served.",
+))
+threadpool_saturated_requests_total = registry.register(Counter(
+    "threadpool_saturated_requests_total", "Requests that arrived while every worker thread was busy.",
+))
+db_pool_checkouts_total = registry.register(Counter(
+    "db_pool_checkouts_total", "Connections checked out of the database pool.",
+))
+db_pool_wait_seconds = registry.register(Histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a database pool connection.", buckets=POOL_WAIT_BUCKETS,
+))
+
+
+def _threadpool_samples():
+    """Usage of the threadpool that runs sync endpoints and dependencies (event loop thread only)."""
+    try:
+        limiter = anyio.to_thread.current_default_thread_limiter()
+    except RuntimeError:
+        return []  # Not called from the event loop
+    return [(("busy",), limiter.borrowed_tokens), (("limit",), limiter.total_tokens)]
+
+
+registry.register(SampledGauge(
+    "threadpool_threads", "Worker threads in use (busy) and available in total (limit).", ("state",), _threadpool_samples,
+))
+
+
+def _threadpool_saturated() -> bool:
+    try:
+        limiter = anyio.to_thread.current_default_thread_limiter()
+    except RuntimeError:
+        return False
+    return limiter.borrowed_tokens >= limiter.total_tokens
+
+
+# ---------------------------------------------------------------------------
+# Caches
+# ---------------------------------------------------------------------------
+
+_caches: Dict[str, object] = {}
+
+
+def register_cache(name: str, cache) -> None:
+    """Expose a cache that counts ``hits`` and ``misses`` attributes."""
+    _caches[name] = cache
+
+
+def _cache_counter(attribute: str):
+    def sample():
+        return [((name,), getattr(cache, attribute, 0)) for name, cache in _caches.items()]
+    return sample
+
+
+def _cache_hit_ratios():
+    ratios = []
+    for name, cache in _caches.items():
+        hits, misses = getattr(cache, "hits", 0), getattr(cache, "misses", 0)
+        ratios.append(((name,), round(hits / (hits + misses), 6) if hits + misses else 0.0))
+    return ratios
+
+
+registry.register(SampledGauge("cache_hits_total", "Cache hits by cache.", ("cache",), _cache_counter("hits"), kind="counter"))
+registry.register(SampledGauge("cache_misses_total", "Cache misses by cache.", ("cache",), _cache_counter("misses"), kind="counter"))
+registry.register(SampledGauge("cache_hit_ratio", "Lifetime hit ratio by cache.", ("cache",), _cache_hit_ratios))
+
+
+# ---------------------------------------------------------------------------
+# Database pool
+# ---------------------------------------------------------------------------
+
+def instrument_engine(engine: Engine) -> None:
+    """Count pool checkouts, time pool waits and sample the pool size at scrape time."""
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return connect(*args, **kwargs)
+        finally:
+            db_pool_wait_seconds.observe(time.perf_counter() - started)
+
+    pool.connect = timed_connect
+    event.listen(pool, "checkout", lambda *args: db_pool_checkouts_total.inc())
+
+    def pool_samples():
+        samples = [(("checked_out",), pool.checkedout())]
+        if hasattr(pool, "size"):
+            samples += [(("size",), pool.size()), (("overflow",), max(pool.overflow(), 0)), (("idle",), pool.checkedin())]
+        return samples
+
+    registry.register(SampledGauge(
+        "db_pool_connections", "Database pool connections by state.", ("state",), pool_samples,
+    ))
+
+
+# ---------------------------------------------------------------------------
+# Middleware
+# ---------------------------------------------------------------------------
+
+def route_template(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no per-request task or body buffering)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+        if _threadpool_saturated():
+            threadpool_saturated_requests_total.inc()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            method, route = scope["method"], route_template(scope)
+            http_request_duration_seconds.observe(time.perf_counter() - started, method, route)
+            http_requests_total.inc(method, route, str(status_code))
+
+
+def render_metrics() -> str:
+    return registry.render()
@@ -0,0 +1,144 @@
+"""
+Per-Request SQL Statistics
+
+Counts the statements each HTTP request executes and the time spent in them:
+1. Engine cursor events add every statement to the collector of the current request,
+   held in a context variable (sync endpoints run in the threadpool with a copy of
+   the request's context, so they report to the same collector)
+2. Statements are grouped by shape (bind parameters and expanded IN lists collapsed);
+   a shape executed SQL_N_PLUS_ONE_THRESHOLD times or more in one request is logged
+   as a likely N+1
+3. Outside production, responses carry X-DB-Queries and X-DB-Time (milliseconds)
+   headers; per-route totals always feed the /metrics histograms
+
+Statements outside a request (background workers, startup) are not counted.
+"""
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+from app.core import metrics
+
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 500)
+QUERY_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s")  # psycopg2 (pyformat) bind parameters
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+db_queries_per_request = metrics.registry.register(metrics.Histogram(
+    "db_queries_per_request", "SQL statements executed per HTTP request by route template.",
+    ("route",), buckets=QUERY_COUNT_BUCKETS,
+))
+db_time_per_request_seconds = metrics.registry.register(metrics.Histogram(
+    "db_time_per_request_seconds", "Time spent executing SQL per HTTP request by route template.",
+    ("route",), buckets=QUERY_TIME_BUCKETS,
+))
+db_n_plus_one_requests_total = metrics.registry.register(metrics.Counter(
+    "db_n_plus_one_requests_total", "Requests that repeated one statement shape at least the N+1 threshold.",
+    ("route",),
+))
+
+
+def statement_shape(statement: str) -> str:
+    """Statement with bind parameters replaced by ? and IN lists collapsed to one ?."""
+    shape = _PLACEHOLDER.sub("?", statement)
+    shape = _PLACEHOLDER_LIST.sub("?", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+class RequestQueryStats:
+    """Statements executed on behalf of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated_shapes(self, threshold: int):
+        """(shape, executions) pairs repeated at least threshold times, most repeated first."""
+        if threshold <= 0:
+            return []
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+_current: ContextVar[Optional[RequestQueryStats]] = ContextVar("request_query_stats", default=None)
+
+
+def instrument_queries(engine: Engine) -> None:
+    """Time every statement executed on the engine and add it to the current request."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _current.get()
+        started = conn.info.get("query_started")
+        if stats is not None and started:
+            stats.record(statement, time.perf_counter() - started.pop())
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # A failed statement never reaches after_cursor_execute
+        conn = exception_context.connection
+        if conn is not None and _current.get() is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+
+class QueryStatsMiddleware:
+    """Pure ASGI middleware that opens a collector per request and reports it."""
+
+    def __init__(self, app, expose_headers: Optional[bool] = None, n_plus_one_threshold: Optional[int] = None):
+        self.app = app
+        self.expose_headers = settings.ENVIRONMENT != "production" if expose_headers is None else expose_headers
+        self.n_plus_one_threshold = (
+            settings.SQL_N_PLUS_ONE_THRESHOLD if n_plus_one_threshold is None else n_plus_one_threshold
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestQueryStats()
+        token = _current.set(stats)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start" and self.expose_headers:
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-db-queries", str(stats.count).encode()),
+                    (b"x-db-time", f"{stats.duration * 1000:.1f}".encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current.reset(token)
+            self._report(scope, stats)
+
+    def _report(self, scope, stats: RequestQueryStats) -> None:
+        route = metrics.route_template(scope)
+        if stats.count:
+            db_queries_per_request.observe(stats.count, route)
+            db_time_per_request_seconds.observe(stats.duration, route)
+
+        repeated = stats.repeated_shapes(self.n_plus_one_threshold)
+        if repeated:
+            db_n_plus_one_requests_total.inc(route)
+            shape, count = repeated[0]
+            print(f"[WARN] Likely N+1 in {scope['method']} {route}: {count}x {shape[:300]}")
@@ -1,5 +1,6 @@
 from typing import Optional, List
 from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func
 from uuid import UUID
 from datetime import datetime
 
@@ -13,6 +14,12 @@ from app.schemas.wizard import (
     FlowRuleCreate, FlowRuleUpdate,
     OptionDependencyCreate
 )
+from app.services.wizard_materializer import materialize_wizard
+from app.services.wizard_cloner import clone_wizard_tree
+from app.services.wizard_reconciler import reconcile_wizard_steps
+from app.services.wizard_versions import checkout_tree
+from app.services.flow_engine import flow_rule_engine
+from app.services.option_dependency_graph import validate_new_dependency
 
 
 class WizardCategoryCRUD:
@@ -33,6 +40,8 @@ class WizardCategoryCRUD:
 class WizardCRUD:
     def get(self, db: Session, wizard_id: UUID) -> Optional[Wizard]:
         """Get wizard by ID with all related data"""
+        # A new version's steps are written on first read
+        checkout_tree(db, wizard_id)
         return db.query(Wizard).options(
             joinedload(Wizard.steps).joinedload(Step.option_sets).joinedload(OptionSet.options).joinedload(Option.dependencies),
             joinedload(Wizard.category)
@@ -59,34 +68,9 @@ class WizardCRUD:
         return query.order_by(Wizard.created_at.desc()).offset(skip).limit(limit).all()
 
     def create(self, db: Session, obj_in: WizardCreate, created_by: UUID) -> Wizard:
-        """Create new wizard with steps and options"""
-        wizard_data = obj_in.model_dump(exclude={"steps"})
-        db_wizard = Wizard(**wizard_data, created_by=created_by)
-        db.add(db_wizard)
-        db.flush()  # Get wizard ID
-
-        # Create steps
-        for step_data in obj_in.steps:
-            step_dict = step_data.model_dump(exclude={"option_sets"})
-            db_step = Step(**step_dict, wizard_id=db_wizard.id)
-            db.add(db_step)
-            db.flush()
-
-            # Create option sets
-            for option_set_data in step_data.option_sets:
-                option_set_dict = option_set_data.model_dump(exclude={"options"})
-                db_option_set = OptionSet(**option_set_dict, step_id=db_step.id)
-                db.add(db_option_set)
-                db.flush()
-
-                # Create options
-                for option_data in option_set_data.options:
-                    db_option = Option(**option_data.model_dump(), option_set_id=db_option_set.id)
-                    db.add(db_option)
-
-        db.commit()
-        db.refresh(db_wizard)
-        return self.get(db, db_wizard.id)
+        """Create new wizard with steps and options (one multi-row INSERT per table)"""
+        wizard_id = materialize_wizard(db, obj_in, created_by)
+        return self.get(db, wizard_id)
 
     def update(self, db: Session, db_obj: Wizard, obj_in: WizardUpdate) -> Wizard:
         """Update wizard with nested steps, option_sets, and options"""
@@ -96,35 +80,10 @@ class WizardCRUD:
         for field in update_data:
             setattr(db_obj, field, update_data[field])
 
-        # Handle steps update if provided
+        # Reconcile steps by ID (only changed rows are written, IDs are preserved)
+        checkout_tree(db, db_obj.id, commit=False)
         if obj_in.steps is not None:
-            wizard_id = db_obj.id
-
-            # Delete existing steps (CASCADE will handle option_sets and options)
-            db.query(Step).filter(Step.wizard_id == wizard_id).delete()
-            db.commit()
-
-            # Refresh the wizard object to clear deleted Step references from memory
-            db.refresh(db_obj)
-
-            # Create new steps
-            for step_data in obj_in.steps:
-                step_dict = step_data.model_dump(exclude={"option_sets"})
-                db_step = Step(**step_dict, wizard_id=db_obj.id)
-                db.add(db_step)
-                db.flush()
-
-                # Create option sets
-                for option_set_data in step_data.option_sets:
-                    option_set_dict = option_set_data.model_dump(exclude={"options"})
-                    db_option_set = OptionSet(**option_set_dict, step_id=db_step.id)
-                    db.add(db_option_set)
-                    db.flush()
-
-                    # Create options
-                    for option_data in option_set_data.options:
-                        db_option = Option(**option_data.model_dump(), option_set_id=db_option_set.id)
-                        db.add(db_option)
+            reconcile_wizard_steps(db, db_obj.id, obj_in.steps)
 
         db_obj.updated_at = datetime.utcnow()
         db.add(db_obj)
@@ -154,17 +113,21 @@ class WizardCRUD:
         return wizard
 
     def increment_session_count(self, db: Session, wizard: Wizard) -> Wizard:
-        """Increment total session count"""
-        wizard.total_sessions += 1
-        db.add(wizard)
+        """Increment total session count atomically (UPDATE ... SET x = x + 1)"""
+        db.query(Wizard).filter(Wizard.id == wizard.id).update(
+            {Wizard.total_sessions: func.coalesce(Wizard.total_sessions, 0) + 1},
+            synchronize_session=False
+        )
         db.commit()
         db.refresh(wizard)
         return wizard
 
     def increment_completed_count(self, db: Session, wizard: Wizard) -> Wizard:
-        """Increment completed session count"""
-        wizard.completed_sessions += 1
-        db.add(wizard)
+        """Increment completed session count atomically (UPDATE ... SET x = x + 1)"""
+        db.query(Wizard).filter(Wizard.id == wizard.id).update(
+            {Wizard.completed_sessions: func.coalesce(Wizard.completed_sessions, 0) + 1},
+            synchronize_session=False
+        )
         db.commit()
         db.refresh(wizard)
         return wizard
@@ -182,10 +145,13 @@ class WizardCRUD:
         wizard_id: UUID,
         new_name: str,
         created_by: UUID,
-        new_description: Optional[str] = None
+        new_description: Optional[str] = None,
+        parent_wizard_id: Optional[UUID] = None,
+        version_number: int = 1
     ) -> Optional[Wizard]:
         """
         Clone an existing wizard with all its steps, option sets, options, and dependencies.
+        The copy runs entirely in SQL (INSERT ... SELECT per table) without loading the source tree.
 
         Args:
             db: Database session
@@ -193,129 +159,26 @@ class WizardCRUD:
             new_name: Name for the new wizard
             created_by: UUID of the user creating the clone
             new_description: Optional description override
+            parent_wizard_id: Parent wizard when the clone is a new version
+            version_number: Version number of the clone
 
         Returns:
             The cloned wizard with all relationships, or None if source wizard not found
         """
-        import uuid
-
-        # Get the source wizard with all relationships
-        source_wizard = self.get(db, wizard_id)
-        if not source_wizard:
-            return None
-
-        # Create new wizard (copy basic fields)
-        new_wizard = Wizard(
-            id=uuid.uuid4(),
-            name=new_name,
-            description=new_description or source_wizard.description,
-            category_id=source_wizard.category_id,
-            created_by=created_by,
-            icon=source_wizard.icon,
-            cover_image=source_wizard.cover_image,
-            is_published=False,  # Clones start unpublished
-            is_active=True,
-            allow_templates=source_wizard.allow_templates,
-            require_login=source_wizard.require_login,
-            allow_anonymous=source_wizard.allow_anonymous,
-            auto_save=source_wizard.auto_save,
-            auto_save_interval=source_wizard.auto_save_interval,
-            estimated_time=source_wizard.estimated_time,
-            difficulty_level=source_wizard.difficulty_level,
-            tags=source_wizard.tags,
-            lifecycle_state='draft',  # New wizard starts as draft
-            version_number=1
+        new_wizard_id = clone_wizard_tree(
+            db,
+            wizard_id,
+            new_name,
+            created_by,
+            new_description=new_description,
+            parent_wizard_id=parent_wizard_id,
+            version_number=version_number,
         )
-        db.add(new_wizard)
-        db.flush()
-
-        # Map old IDs to new IDs for relationship reconstruction
-        step_id_map = {}
-        option_set_id_map = {}
-        option_id_map = {}
-
-        # Clone steps
-        for source_step in source_wizard.steps:
-            new_step = Step(
-                id=uuid.uuid4(),
-                wizard_id=new_wizard.id,
-                name=source_step.name,
-                description=source_step.description,
-                help_text=source_step.help_text,
-                step_order=source_step.step_order,
-                is_required=source_step.is_required,
-                is_skippable=source_step.is_skippable,
-                allow_back_navigation=source_step.allow_back_navigation,
-                layout=source_step.layout,
-                custom_styles=source_step.custom_styles,
-                validation_rules=source_step.validation_rules
-            )
-            db.add(new_step)
-            db.flush()
-            step_id_map[source_step.id] = new_step.id
-
-            # Clone option sets for this step
-            for source_option_set in source_step.option_sets:
-                new_option_set = OptionSet(
-                    id=uuid.uuid4(),
-                    step_id=new_step.id,
-                    name=source_option_set.name,
-                    description=source_option_set.description,
-                    selection_type=source_option_set.selection_type,
-                    is_required=source_option_set.is_required,
-                    min_selections=source_option_set.min_selections,
-                    max_selections=source_option_set.max_selections,
-                    min_value=source_option_set.min_value,
-                    max_value=source_option_set.max_value,
-                    regex_pattern=source_option_set.regex_pattern,
-                    custom_validation=source_option_set.custom_validation,
-                    display_order=source_option_set.display_order,
-                    placeholder=source_option_set.placeholder,
-                    help_text=source_option_set.help_text,
-                    step_increment=source_option_set.step_increment
-                )
-                db.add(new_option_set)
-                db.flush()
-                option_set_id_map[source_option_set.id] = new_option_set.id
-
-                # Clone options for this option set
-                for source_option in source_option_set.options:
-                    new_option = Option(
-                        id=uuid.uuid4(),
-                        option_set_id=new_option_set.id,
-                        label=source_option.label,
-                        value=source_option.value,
-                        description=source_option.description,
-                        display_order=source_option.display_order,
-                        icon=source_option.icon,
-                        image_url=source_option.image_url,
-                        is_default=source_option.is_default,
-                        is_recommended=source_option.is_recommended,
-                        is_active=source_option.is_active,
-                        option_metadata=source_option.option_metadata
-                    )
-                    db.add(new_option)
-                    db.flush()
-                    option_id_map[source_option.id] = new_option.id
-
-        # Clone option dependencies (now that all options exist)
-        for source_step in source_wizard.steps:
-            for source_option_set in source_step.option_sets:
-                for source_option in source_option_set.options:
-                    for source_dependency in source_option.dependencies:
-                        new_dependency = OptionDependency(
-                            id=uuid.uuid4(),
-                            option_id=option_id_map[source_dependency.option_id],
-                            depends_on_option_id=option_id_map[source_dependency.depends_on_option_id],
-                            dependency_type=source_dependency.dependency_type
-                        )
-                        db.add(new_dependency)
-
-        db.commit()
-        db.refresh(new_wizard)
+        if not new_wizard_id:
+            return None
 
         # Return the cloned wizard with all relationships loaded
-        return self.get(db, new_wizard.id)
+        return self.get(db, new_wizard_id)
 
 
 class StepCRUD:
@@ -429,6 +292,7 @@ class FlowRuleCRUD:
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
+        flow_rule_engine.invalidate(db_obj.wizard_id)
         return db_obj
 
     def update(self, db: Session, db_obj: FlowRule, obj_in: FlowRuleUpdate) -> FlowRule:
@@ -439,11 +303,14 @@ class FlowRuleCRUD:
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
+        flow_rule_engine.invalidate(db_obj.wizard_id)
         return db_obj
 
     def delete(self, db: Session, db_obj: FlowRule) -> None:
+        wizard_id = db_obj.wizard_id
         db.delete(db_obj)
         db.commit()
+        flow_rule_engine.invalidate(wizard_id)
 
 
 class OptionDependencyCRUD:
@@ -457,7 +324,13 @@ class OptionDependencyCRUD:
         ).all()
 
     def create(self, db: Session, obj_in: OptionDependencyCreate, option_id: UUID) -> OptionDependency:
-        """Create a new option dependency"""
+        """
+        Create a new option dependency.
+
+        Raises:
+            ValueError: If the dependency would create a cycle or is otherwise invalid
+        """
+        validate_new_dependency(db, option_id, obj_in.depends_on_option_id, obj_in.dependency_type.value)
         db_obj = OptionDependency(**obj_in.model_dump(), option_id=option_id)
         db.add(db_obj)
         db.commit()
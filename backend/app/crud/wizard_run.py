@@ -29,6 +29,11 @@ from app.schemas.wizard_run import (
     WizardRunShareCreate,
     WizardRunComparisonCreate,
 )
+from app.services.wizard_counters import wizard_counter_service
+from app.services.run_archive import run_archive_service
+from app.services import option_popularity  # noqa: F401 - keeps option_selection_counts in sync on flush
+from app.services import pricing_engine  # noqa: F401 - keeps calculated_price in sync on flush
+from app.services import wizard_lifecycle  # noqa: F401 - keeps wizard lifecycle state in sync on flush
 
 
 class WizardRunCRUD:
@@ -38,6 +43,19 @@ class WizardRunCRUD:
         """Get a wizard run by ID."""
         return db.query(WizardRun).filter(WizardRun.id == run_id).first()
 
+    def get_many(self, db: Session, run_ids: List[UUID]) -> Dict[UUID, WizardRun]:
+        """Get wizard runs by ID in one query, keyed by ID (missing runs are left out)."""
+        if not run_ids:
+            return {}
+        return {run.id: run for run in db.query(WizardRun).filter(WizardRun.id.in_(run_ids))}
+
+    def get_for_write(self, db: Session, run_id: UUID) -> Optional[WizardRun]:
+        """Get a wizard run by ID, restoring it from the archive first if it was archived."""
+        run = self.get(db, run_id)
+        if run is None and run_archive_service.restore(db, run_id):
+            run = self.get(db, run_id)
+        return run
+
     def get_multi(
         self,
         db: Session,
@@ -127,6 +145,8 @@ class WizardRunCRUD:
         """Create a new wizard run."""
         # Get wizard to set total_steps
         from app.models.wizard import Wizard
+        from app.services.wizard_versions import checkout_tree
+        checkout_tree(db, obj_in.wizard_id)
         wizard = db.query(Wizard).filter(Wizard.id == obj_in.wizard_id).first()
         total_steps = len(wizard.steps) if wizard else 0
 
@@ -143,6 +163,7 @@ class WizardRunCRUD:
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
+        wizard_counter_service.record_run_started(db_obj.wizard_id)
         return db_obj
 
     def update(
@@ -190,6 +211,7 @@ class WizardRunCRUD:
         """Complete a wizard run."""
         obj = db.query(WizardRun).filter(WizardRun.id == run_id).first()
         if obj:
+            newly_completed = obj.status != 'completed'
             obj.status = 'completed'
             obj.progress_percentage = 100
             obj.completed_at = datetime.now(timezone.utc)
@@ -203,6 +225,11 @@ class WizardRunCRUD:
             db.add(obj)
             db.commit()
             db.refresh(obj)
+            if newly_completed:
+                wizard_counter_service.record_run_completed(
+                    obj.wizard_id,
+                    (obj.completed_at - obj.started_at).total_seconds() if obj.started_at else 0,
+                )
         return obj
 
     def abandon(self, db: Session, run_id: UUID) -> Optional[WizardRun]:
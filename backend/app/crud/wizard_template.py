@@ -4,7 +4,8 @@ Wizard Template CRUD Operations
 Database operations for wizard templates and ratings.
 """
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, literal, case, cast, Numeric
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from typing import List, Optional, Dict, Any
 from uuid import UUID
 
@@ -15,6 +16,33 @@ from app.schemas.wizard_template import (
     WizardTemplateRatingCreate,
     WizardTemplateRatingUpdate,
 )
+from app.services.template_feed_cache import template_feed_cache
+from app.services.template_similarity import template_similarity_index
+
+
+# Highlight options for ts_headline
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2"
+
+# Weight of trigram name similarity relative to ts_rank_cd in the relevance score
+TRIGRAM_RANK_WEIGHT = 0.5
+
+# Template fields that feed the similar-templates feature vectors
+SIMILARITY_FIELDS = {
+    'template_name', 'template_description', 'category', 'difficulty_level',
+    'tags', 'wizard_structure', 'is_active',
+}
+
+
+def _search_terms(search: str):
+    """Build the tsquery, the match filter and the relevance score for a search string."""
+    ts_query = func.websearch_to_tsquery('english', search)
+    name_similarity = func.word_similarity(search, WizardTemplate.template_name)
+    match = (
+        WizardTemplate.search_vector.op('@@')(ts_query) |
+        literal(search).op('<%')(WizardTemplate.template_name)
+    )
+    rank = func.ts_rank_cd(WizardTemplate.search_vector, ts_query) + name_similarity * TRIGRAM_RANK_WEIGHT
+    return ts_query, match, rank
 
 
 class WizardTemplateCRUD:
@@ -51,24 +79,73 @@ class WizardTemplateCRUD:
             query = query.filter(WizardTemplate.difficulty_level == difficulty_level)
         if is_system_template is not None:
             query = query.filter(WizardTemplate.is_system_template == is_system_template)
+        order_by = [desc(WizardTemplate.average_rating), desc(WizardTemplate.usage_count)]
         if search:
-            search_pattern = f"%{search}%"
-            query = query.filter(
-                (WizardTemplate.template_name.ilike(search_pattern)) |
-                (WizardTemplate.template_description.ilike(search_pattern))
-            )
+            _, match, rank = _search_terms(search)
+            query = query.filter(match)
+            order_by.insert(0, desc(rank))
 
         # Get total count
         total = query.count()
 
         # Apply pagination and ordering
-        templates = query.order_by(desc(WizardTemplate.average_rating), desc(WizardTemplate.usage_count))\
+        templates = query.order_by(*order_by)\
             .offset(skip)\
             .limit(limit)\
             .all()
 
         return templates, total
 
+    def search(
+        self,
+        db: Session,
+        *,
+        q: str,
+        skip: int = 0,
+        limit: int = 20,
+        category: Optional[str] = None,
+        difficulty_level: Optional[str] = None,
+    ) -> tuple[List[Dict[str, Any]], int]:
+        """
+        Relevance-ranked full-text search with trigram typo tolerance.
+        Returns tuple of (results, total_count); each result holds the template,
+        its relevance score and highlighted name/description fragments.
+        """
+        ts_query, match, rank = _search_terms(q)
+
+        query = db.query(WizardTemplate).filter(WizardTemplate.is_active == True, match)
+        if category:
+            query = query.filter(WizardTemplate.category == category)
+        if difficulty_level:
+            query = query.filter(WizardTemplate.difficulty_level == difficulty_level)
+
+        total = query.count()
+
+        rank_column = rank.label('rank')
+        rows = query.with_entities(
+            WizardTemplate,
+            rank_column,
+            func.ts_headline('english', WizardTemplate.template_name, ts_query, HEADLINE_OPTIONS).label('name_highlight'),
+            func.ts_headline(
+                'english', func.coalesce(WizardTemplate.template_description, ''), ts_query, HEADLINE_OPTIONS
+            ).label('description_highlight'),
+        )\
+            .order_by(desc(rank_column), desc(WizardTemplate.average_rating))\
+            .offset(skip)\
+            .limit(limit)\
+            .all()
+
+        results = [
+            {
+                "template": template,
+                "rank": float(rank_value or 0),
+                "name_highlight": name_highlight,
+                "description_highlight": description_highlight,
+            }
+            for template, rank_value, name_highlight, description_highlight in rows
+        ]
+        return results, total
+
     def get_popular(self, db: Session, limit: int = 10) -> List[WizardTemplate]:
         """Get most popular templates by usage count."""
         return db.query(WizardTemplate)\
@@ -120,6 +197,8 @@ class WizardTemplateCRUD:
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
+        template_feed_cache.invalidate()
+        template_similarity_index.schedule_refresh(db_obj.id)
         return db_obj
 
     def update(
@@ -143,6 +222,9 @@ class WizardTemplateCRUD:
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
+        template_feed_cache.invalidate()
+        if SIMILARITY_FIELDS.intersection(update_data):
+            template_similarity_index.schedule_refresh(db_obj.id)
         return db_obj
 
     def delete(self, db: Session, *, template_id: UUID) -> Optional[WizardTemplate]:
@@ -153,6 +235,8 @@ class WizardTemplateCRUD:
             db.add(obj)
             db.commit()
             db.refresh(obj)
+            template_feed_cache.invalidate()
+            template_similarity_index.schedule_refresh(template_id)
         return obj
 
     def hard_delete(self, db: Session, *, template_id: UUID) -> bool:
@@ -161,6 +245,8 @@ class WizardTemplateCRUD:
         if obj:
             db.delete(obj)
             db.commit()
+            template_feed_cache.invalidate()
+            template_similarity_index.schedule_refresh(template_id)
             return True
         return False
 
@@ -172,22 +258,68 @@ class WizardTemplateCRUD:
             db.add(obj)
             db.commit()
             db.refresh(obj)
+            template_feed_cache.invalidate()
         return obj
 
     def update_average_rating(self, db: Session, template_id: UUID) -> Optional[WizardTemplate]:
-        """Recalculate and update average rating from all ratings."""
-        avg_rating = db.query(func.avg(WizardTemplateRating.rating))\
-            .filter(WizardTemplateRating.template_id == template_id)\
-            .scalar()
+        """
+        Recompute all rating aggregates from the ratings table.
+        Rating writes maintain the aggregates incrementally; this is only a repair path.
+        """
+        sums = db.query(
+            func.count(WizardTemplateRating.id),
+            func.coalesce(func.sum(WizardTemplateRating.rating), 0),
+            *[func.count(WizardTemplateRating.id).filter(WizardTemplateRating.rating == stars) for stars in range(1, 6)],
+        ).filter(WizardTemplateRating.template_id == template_id).one()
+        rating_count, rating_sum, *buckets = sums
 
         obj = db.query(WizardTemplate).filter(WizardTemplate.id == template_id).first()
         if obj:
-            obj.average_rating = round(float(avg_rating or 0), 2)
+            obj.rating_count = rating_count
+            obj.rating_sum = rating_sum
+            for stars, bucket in zip(range(1, 6), buckets):
+                setattr(obj, f"rating_{stars}_count", bucket)
+            obj.average_rating = round(rating_sum / rating_count, 2) if rating_count else 0
             db.add(obj)
             db.commit()
             db.refresh(obj)
+            template_feed_cache.invalidate()
         return obj
 
+    def apply_rating_delta(
+        self, db: Session, template_id: UUID, *, added: Optional[int] = None, removed: Optional[int] = None
+    ) -> None:
+        """
+        Fold one rating change into the template aggregates with a single atomic UPDATE.
+        Does not commit; callers run it in the same transaction as the rating write.
+
+        Args:
+            added: Star value that now counts (new or updated rating)
+            removed: Star value that no longer counts (deleted or replaced rating)
+        """
+        count_delta = (1 if added else 0) - (1 if removed else 0)
+        sum_delta = (added or 0) - (removed or 0)
+        new_count = WizardTemplate.rating_count + count_delta
+        new_sum = WizardTemplate.rating_sum + sum_delta
+
+        values = {
+            WizardTemplate.rating_count: new_count,
+            WizardTemplate.rating_sum: new_sum,
+            # SET expressions see the pre-update row, so this averages the new totals
+            WizardTemplate.average_rating: case(
+                (new_count > 0, func.round(cast(new_sum, Numeric) / new_count, 2)),
+                else_=0,
+            ),
+        }
+        for stars, delta in ((added, 1), (removed, -1)):
+            if stars:
+                column = getattr(WizardTemplate, f"rating_{stars}_count")
+                values[column] = values.get(column, column) + delta
+
+        db.query(WizardTemplate).filter(WizardTemplate.id == template_id).update(
+            values, synchronize_session=False
+        )
+
 
 class WizardTemplateRatingCRUD:
     """CRUD operations for WizardTemplateRating model."""
@@ -229,72 +361,99 @@ class WizardTemplateRatingCRUD:
             .limit(limit)\
             .all()
 
+    def upsert(
+        self, db: Session, *, template_id: UUID, user_id: UUID, rating: int, review_text: Optional[str] = None
+    ) -> WizardTemplateRating:
+        """
+        Create or replace a user's rating for a template.
+        The rating row and the template aggregates change in one transaction.
+        """
+        inserted_id = db.execute(
+            pg_insert(WizardTemplateRating)
+            .values(template_id=template_id, user_id=user_id, rating=rating, review_text=review_text)
+            .on_conflict_do_nothing(constraint='uq_wizard_template_ratings_template_user')
+            .returning(WizardTemplateRating.id)
+        ).scalar()
+
+        if inserted_id:
+            wizard_template_crud.apply_rating_delta(db, template_id, added=rating)
+            rating_id = inserted_id
+        else:
+            # Existing rating: lock it so concurrent re-rates apply their deltas in order
+            existing = db.query(WizardTemplateRating)\
+                .filter(
+                    WizardTemplateRating.template_id == template_id,
+                    WizardTemplateRating.user_id == user_id
+                )\
+                .with_for_update()\
+                .one()
+            previous_rating = existing.rating
+            existing.rating = rating
+            existing.review_text = review_text
+            db.flush()
+            if previous_rating != rating:
+                wizard_template_crud.apply_rating_delta(db, template_id, added=rating, removed=previous_rating)
+            rating_id = existing.id
+
+        db.commit()
+        template_feed_cache.invalidate()
+        return self.get(db, rating_id)
+
     def create(
         self, db: Session, obj_in: WizardTemplateRatingCreate, user_id: UUID
     ) -> WizardTemplateRating:
-        """Create a new rating."""
-        db_obj = WizardTemplateRating(
+        """Create a new rating (replaces the user's existing rating, if any)."""
+        return self.upsert(
+            db,
             template_id=obj_in.template_id,
             user_id=user_id,
             rating=obj_in.rating,
             review_text=obj_in.review_text,
         )
-        db.add(db_obj)
-        db.commit()
-        db.refresh(db_obj)
-
-        # Update template average rating
-        wizard_template_crud.update_average_rating(db, obj_in.template_id)
-
-        return db_obj
 
     def update(
         self, db: Session, *, db_obj: WizardTemplateRating, obj_in: WizardTemplateRatingUpdate
     ) -> WizardTemplateRating:
         """Update a rating."""
         update_data = obj_in.model_dump(exclude_unset=True)
+        previous_rating = db_obj.rating
 
         for field, value in update_data.items():
             setattr(db_obj, field, value)
 
         db.add(db_obj)
+        db.flush()
+        if db_obj.rating != previous_rating:
+            wizard_template_crud.apply_rating_delta(
+                db, db_obj.template_id, added=db_obj.rating, removed=previous_rating
+            )
         db.commit()
         db.refresh(db_obj)
-
-        # Update template average rating
-        wizard_template_crud.update_average_rating(db, db_obj.template_id)
+        template_feed_cache.invalidate()
 
         return db_obj
 
     def delete(self, db: Session, *, rating_id: UUID) -> bool:
         """Delete a rating."""
-        obj = db.query(WizardTemplateRating).filter(WizardTemplateRating.id == rating_id).first()
-        if obj:
-            template_id = obj.template_id
-            db.delete(obj)
-            db.commit()
-            # Update template average rating
-            wizard_template_crud.update_average_rating(db, template_id)
-            return True
-        return False
+        deleted = db.execute(
+            WizardTemplateRating.__table__.delete()
+            .where(WizardTemplateRating.id == rating_id)
+            .returning(WizardTemplateRating.template_id, WizardTemplateRating.rating)
+        ).first()
+        if not deleted:
+            return False
+
+        wizard_template_crud.apply_rating_delta(db, deleted.template_id, removed=deleted.rating)
+        db.commit()
+        template_feed_cache.invalidate()
+        return True
 
     def get_rating_distribution(self, db: Session, template_id: UUID) -> Dict[int, int]:
-        """Get distribution of ratings (1-5 stars) for a template."""
-        ratings = db.query(
-            WizardTemplateRating.rating,
-            func.count(WizardTemplateRating.id).label('count')
-        ).filter(
-            WizardTemplateRating.template_id == template_id
-        ).group_by(
-            WizardTemplateRating.rating
-        ).all()
-
-        # Initialize all ratings to 0
-        distribution = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-        for rating, count in ratings:
-            distribution[rating] = count
-
-        return distribution
+        """Get distribution of ratings (1-5 stars) for a template from its stored buckets."""
+        template = db.query(WizardTemplate).filter(WizardTemplate.id == template_id).first()
+        if not template:
+            return {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+        return template.rating_distribution
 
 
 # Create singleton instances
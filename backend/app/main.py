@@ -1,8 +1,21 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from app.config import settings
-from app.api.v1 import auth, users, wizards, analytics, wizard_templates, wizard_runs
-from app.database import init_db
+from app.api.v1 import auth, users, wizards, analytics, wizard_templates, wizard_runs, bundles
+from app.core import metrics, query_stats
+from app.database import init_db, engine
+from app.services.wizard_counters import wizard_counter_service
+from app.services.audit_log import audit_log_writer
+from app.services.template_similarity import template_similarity_index
+from app.services.run_deletion import run_deletion_service
+from app.services.run_archive import run_archive_service
+from app.services.run_sweeper import stale_run_sweeper
+from app.services.dashboard_cache import dashboard_stats_cache
+from app.services.template_feed_cache import template_feed_cache
+from app.services.flow_engine import flow_rule_engine
+from app.services.option_dependency_graph import dependency_graph_compiler
+from app.services.pricing_engine import pricing_engine
 
 # Create FastAPI application
 app = FastAPI(
@@ -23,6 +36,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request SQL statistics
+app.add_middleware(query_stats.QueryStatsMiddleware)
+query_stats.instrument_queries(engine)
+
+# Request metrics (outermost, so CORS preflights and errors are measured too)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+metrics.register_cache("dashboard_stats", dashboard_stats_cache)
+metrics.register_cache("template_feed", template_feed_cache)
+metrics.register_cache("flow_rules", flow_rule_engine)
+metrics.register_cache("dependency_graph", dependency_graph_compiler)
+metrics.register_cache("price_rules", pricing_engine)
+
 # Include API routers
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["Authentication"])
 app.include_router(users.router, prefix="/api/v1/users", tags=["Users"])
@@ -30,6 +56,7 @@ app.include_router(wizards.router, prefix="/api/v1/wizards", tags=["Wizards"])
 app.include_router(wizard_templates.router, prefix="/api/v1/wizard-templates", tags=["Wizard Templates"])
 app.include_router(wizard_runs.router, prefix="/api/v1/wizard-runs", tags=["Wizard Runs"])
 app.include_router(analytics.router, prefix="/api/v1/analytics", tags=["Analytics"])
+app.include_router(bundles.router, prefix="/api/v1/bundles", tags=["Bundles"])
 
 from fastapi.staticfiles import StaticFiles
 import os
@@ -59,6 +86,12 @@ def health_check():
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint (async, so threadpool usage is read on the event loop)."""
+    return Response(content=metrics.render_metrics(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.on_event("startup")
 async def startup_event():
     """Application startup event."""
@@ -75,6 +108,15 @@ async def startup_event():
     print("Initializing database tables...")
     init_db()
     print("Database tables initialized successfully")
+    template_similarity_index.ensure_built()
+
+    # Background workers
+    template_similarity_index.start()
+    wizard_counter_service.start()
+    audit_log_writer.start()
+    run_deletion_service.start()
+    run_archive_service.start()
+    stale_run_sweeper.start()
 
 
 @app.on_event("shutdown")
@@ -82,6 +124,14 @@ async def shutdown_event():
     """Application shutdown event."""
     print(f"Shutting down {settings.APP_NAME}")
 
+    # Flush buffered state before the process exits
+    stale_run_sweeper.stop()
+    run_archive_service.stop()
+    run_deletion_service.stop()
+    template_similarity_index.stop()
+    wizard_counter_service.stop()
+    audit_log_writer.stop()
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,13 +1,14 @@
 from app.models.user import User, UserRole
-from app.models.wizard import Wizard, WizardCategory, Step, OptionSet, Option, OptionDependency, FlowRule
-from app.models.analytics import AnalyticsEvent, AuditLog, SystemSetting
-from app.models.wizard_template import WizardTemplate, WizardTemplateRating
+from app.models.wizard import Wizard, WizardCategory, Step, OptionSet, Option, OptionDependency, FlowRule, WizardTreeNode, WizardVersion
+from app.models.analytics import AnalyticsEvent, AuditLog, SystemSetting, OptionSelectionCount, BackgroundJob
+from app.models.wizard_template import WizardTemplate, WizardTemplateRating, WizardTemplateSimilarity
 from app.models.wizard_run import (
     WizardRun,
     WizardRunStepResponse,
     WizardRunOptionSetResponse,
     WizardRunFileUpload,
     WizardRunShare,
+    WizardRunArchive,
     WizardRunComparison
 )
 
@@ -21,15 +22,21 @@ __all__ = [
     "Option",
     "OptionDependency",
     "FlowRule",
+    "WizardTreeNode",
+    "WizardVersion",
     "AnalyticsEvent",
     "AuditLog",
     "SystemSetting",
+    "OptionSelectionCount",
+    "BackgroundJob",
     "WizardTemplate",
     "WizardTemplateRating",
+    "WizardTemplateSimilarity",
     "WizardRun",
     "WizardRunStepResponse",
     "WizardRunOptionSetResponse",
     "WizardRunFileUpload",
     "WizardRunShare",
+    "WizardRunArchive",
     "WizardRunComparison",
 ]
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime, timezone
-from sqlalchemy import Column, String, Boolean, ForeignKey, DateTime, Text
+from sqlalchemy import Column, String, Boolean, ForeignKey, DateTime, Text, Date, Integer, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB, INET
 from app.database import Base
 
@@ -75,3 +75,51 @@ class SystemSetting(Base):
 
     def __repr__(self):
         return f"<SystemSetting(key={self.key})>"
+
+
+class OptionSelectionCount(Base):
+    """
+    Incrementally maintained number of responses selecting an option, per day.
+    The day is the (UTC) day the option set response was created.
+    """
+    __tablename__ = "option_selection_counts"
+
+    option_id = Column(UUID(as_uuid=True), ForeignKey("options.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    option_set_id = Column(UUID(as_uuid=True), ForeignKey("option_sets.id", ondelete="CASCADE"), nullable=False)
+    selection_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("idx_option_selection_counts_option_set_day", "option_set_id", "day"),
+    )
+
+    def __repr__(self):
+        return f"<OptionSelectionCount(option_id={self.option_id}, day={self.day}, count={self.selection_count})>"
+
+
+class BackgroundJob(Base):
+    """Long-running maintenance job (e.g. chunked run deletion) and its progress."""
+    __tablename__ = "background_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    job_type = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, completed, failed
+    params = Column(JSONB, default={})
+
+    # Progress
+    total = Column(Integer)
+    processed = Column(Integer, nullable=False, default=0, server_default='0')
+    error = Column(Text)
+
+    created_by = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    started_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))  # Heartbeat while running
+    finished_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        Index("idx_background_jobs_status", "status"),
+    )
+
+    def __repr__(self):
+        return f"<BackgroundJob(type={self.job_type}, status={self.status})>"
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime, timezone
-from sqlalchemy import Column, String, Boolean, ForeignKey, DateTime, Text, Integer, Numeric, CheckConstraint
+from sqlalchemy import Column, String, Boolean, ForeignKey, DateTime, Text, Integer, Numeric, CheckConstraint, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -44,6 +44,7 @@ class Wizard(Base):
     allow_anonymous = Column(Boolean, default=False)
     auto_save = Column(Boolean, default=True)
     auto_save_interval = Column(Integer, default=30)
+    abandon_after_hours = Column(Integer)  # Inactivity before in-progress runs are abandoned; NULL uses the global default
 
     # Metadata
     estimated_time = Column(Integer)  # minutes
@@ -60,13 +61,19 @@ class Wizard(Base):
     published_at = Column(DateTime(timezone=True))
 
     # Lifecycle protection fields
-    lifecycle_state = Column(String(20), default='draft')
+    lifecycle_state = Column(String(20), default='draft')  # Maintained with the counters below on run writes
+    run_count = Column(Integer, nullable=False, default=0, server_default='0')
+    stored_run_count = Column(Integer, nullable=False, default=0, server_default='0')
+    in_progress_run_count = Column(Integer, nullable=False, default=0, server_default='0')
+    completed_run_count = Column(Integer, nullable=False, default=0, server_default='0')
     first_run_at = Column(DateTime(timezone=True))
     first_stored_run_at = Column(DateTime(timezone=True))
     is_archived = Column(Boolean, default=False)
     archived_at = Column(DateTime(timezone=True))
     version_number = Column(Integer, default=1)
     parent_wizard_id = Column(UUID(as_uuid=True), ForeignKey("wizards.id", ondelete="SET NULL"))
+    # Snapshot the tree was created from while its step rows are not written yet (see wizard_versions.checkout_tree)
+    pending_version_id = Column(UUID(as_uuid=True), ForeignKey("wizard_versions.id", ondelete="SET NULL", use_alter=True))
 
     __table_args__ = (
         CheckConstraint(difficulty_level.in_(['easy', 'medium', 'hard']), name='check_difficulty_level'),
@@ -245,3 +252,45 @@ class FlowRule(Base):
 
     def __repr__(self):
         return f"<FlowRule(name={self.name})>"
+
+
+class WizardTreeNode(Base):
+    """
+    Immutable node of a wizard version tree, stored once per content hash.
+    Versions (and wizards) with identical subtrees share the same nodes.
+    """
+    __tablename__ = "wizard_tree_nodes"
+
+    hash = Column(String(64), primary_key=True)  # SHA-256 of kind, content and child hashes
+    kind = Column(String(20), nullable=False)
+    content = Column(JSONB, nullable=False)  # Node fields plus "children": [child hashes]
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        CheckConstraint(kind.in_(['wizard', 'step', 'option_set', 'option']), name='check_tree_node_kind'),
+    )
+
+    def __repr__(self):
+        return f"<WizardTreeNode(kind={self.kind}, hash={self.hash[:12]})>"
+
+
+class WizardVersion(Base):
+    """Snapshot of a wizard's tree: a reference to its root node."""
+    __tablename__ = "wizard_versions"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    wizard_id = Column(UUID(as_uuid=True), ForeignKey("wizards.id", ondelete="CASCADE"), nullable=False)
+    sequence = Column(Integer, nullable=False)  # 1, 2, ... per wizard
+    label = Column(String(255))
+    root_hash = Column(String(64), ForeignKey("wizard_tree_nodes.hash"), nullable=False)
+    step_stamps = Column(JSONB, default={})  # step_id -> {"stamp", "hash"}; lets the next snapshot skip unchanged steps
+    new_node_count = Column(Integer, default=0)  # Nodes this snapshot added (the rest are shared)
+    created_by = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        UniqueConstraint('wizard_id', 'sequence', name='uq_wizard_versions_wizard_sequence'),
+    )
+
+    def __repr__(self):
+        return f"<WizardVersion(wizard_id={self.wizard_id}, sequence={self.sequence})>"
@@ -3,7 +3,7 @@ Wizard Run Models
 
 Models for the Run Wizard and Store Wizard systems.
 """
-from sqlalchemy import Column, String, Integer, Boolean, DECIMAL, TIMESTAMP, Text, ARRAY, ForeignKey, CheckConstraint
+from sqlalchemy import Column, String, Integer, Boolean, DECIMAL, TIMESTAMP, Text, ARRAY, ForeignKey, CheckConstraint, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
@@ -32,6 +32,7 @@ class WizardRun(Base):
     completed_at = Column(TIMESTAMP(timezone=True))
     last_accessed_at = Column(TIMESTAMP(timezone=True), default=lambda: datetime.now(timezone.utc))
     calculated_price = Column(DECIMAL(10, 2))
+    price_breakdown = Column(JSONB)  # Per option set (amount, multiplier) maintained by the pricing engine
     is_stored = Column(Boolean, default=False)
     is_favorite = Column(Boolean, default=False)
     tags = Column(ARRAY(Text))
@@ -51,6 +52,16 @@ class WizardRun(Base):
             status.in_(['in_progress', 'completed', 'abandoned']),
             name='check_status'
         ),
+        # Stale run sweep: in-progress runs by last access
+        Index(
+            'idx_wizard_runs_in_progress_last_accessed', 'last_accessed_at',
+            postgresql_where=status == 'in_progress'
+        ),
+        # Archive candidates: completed/abandoned runs by last access
+        Index(
+            'idx_wizard_runs_archive_candidates', 'last_accessed_at',
+            postgresql_where=status.in_(['completed', 'abandoned'])
+        ),
     )
 
     def __repr__(self):
@@ -98,6 +109,12 @@ class WizardRunOptionSetResponse(Base):
     created_at = Column(TIMESTAMP(timezone=True), default=lambda: datetime.now(timezone.utc))
     updated_at = Column(TIMESTAMP(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
+    # Indexes
+    __table_args__ = (
+        # Containment lookups: selected_options @> ARRAY[option_id]
+        Index('idx_wizard_run_option_set_responses_selected_options', 'selected_options', postgresql_using='gin'),
+    )
+
     # Relationships
     run = relationship("WizardRun", back_populates="option_set_responses")
     step_response = relationship("WizardRunStepResponse", back_populates="option_set_responses")
@@ -164,6 +181,34 @@ class WizardRunShare(Base):
         return f"<WizardRunShare(id={self.id}, run_id={self.run_id}, share_type={self.share_type})>"
 
 
+class WizardRunArchive(Base):
+    """
+    Archived wizard run: a completed or abandoned run moved out of the hot tables.
+    The run and all its rows (responses, uploads, shares) are kept as one JSONB document.
+    """
+    __tablename__ = "wizard_run_archives"
+
+    id = Column(UUID(as_uuid=True), primary_key=True)  # ID of the archived run
+    wizard_id = Column(UUID(as_uuid=True), ForeignKey('wizards.id', ondelete='CASCADE'), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='SET NULL'))
+    status = Column(String(20), nullable=False)
+    started_at = Column(TIMESTAMP(timezone=True))
+    completed_at = Column(TIMESTAMP(timezone=True))
+    last_accessed_at = Column(TIMESTAMP(timezone=True))
+    archived_at = Column(TIMESTAMP(timezone=True), default=lambda: datetime.now(timezone.utc))
+    share_tokens = Column(ARRAY(Text))  # Tokens of the run's shares, for share links to archived runs
+    document = Column(JSONB, nullable=False)
+
+    # Indexes
+    __table_args__ = (
+        Index('idx_wizard_run_archives_wizard_id', 'wizard_id'),
+        Index('idx_wizard_run_archives_share_tokens', 'share_tokens', postgresql_using='gin'),
+    )
+
+    def __repr__(self):
+        return f"<WizardRunArchive(id={self.id}, wizard_id={self.wizard_id}, status={self.status})>"
+
+
 class WizardRunComparison(Base):
     """
     Wizard Run Comparison model for comparing multiple wizard runs.
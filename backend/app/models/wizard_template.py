@@ -3,15 +3,26 @@ Wizard Template Models
 
 Models for the Wizard Template Gallery system.
 """
-from sqlalchemy import Column, String, Integer, Boolean, DECIMAL, TIMESTAMP, Text, ARRAY, ForeignKey, CheckConstraint
-from sqlalchemy.dialects.postgresql import UUID, JSONB
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Integer, Float, Boolean, DECIMAL, TIMESTAMP, Text, ARRAY, ForeignKey, CheckConstraint, UniqueConstraint, Computed, Index, DDL, event
+from sqlalchemy.dialects.postgresql import UUID, JSONB, TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime, timezone
 import uuid
 
 from app.database import Base
 
 
+# Weighted full-text document: name (A) > description (B) > category and tags (C).
+# wizard_template_tags_text is an IMMUTABLE wrapper, since array_to_string itself
+# is only STABLE and cannot be used in a generated column.
+TEMPLATE_SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english', coalesce(template_name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(template_description, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(category, '')), 'C') || "
+    "setweight(to_tsvector('english', wizard_template_tags_text(tags)), 'C')"
+)
+
+
 class WizardTemplate(Base):
     """
     Wizard Template model for storing reusable wizard configurations.
@@ -36,9 +47,21 @@ class WizardTemplate(Base):
     updated_at = Column(TIMESTAMP(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     usage_count = Column(Integer, default=0)
     average_rating = Column(DECIMAL(3, 2), default=0)
+
+    # Rating aggregates, maintained in the same transaction as each rating write
+    rating_sum = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_count = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_1_count = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_2_count = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_3_count = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_4_count = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_5_count = Column(Integer, nullable=False, default=0, server_default='0')
     wizard_structure = Column(JSONB, nullable=False)  # Complete wizard configuration
     is_active = Column(Boolean, default=True)
 
+    # Full-text search document, maintained by PostgreSQL (never loaded into the ORM object)
+    search_vector = deferred(Column(TSVECTOR, Computed(TEMPLATE_SEARCH_VECTOR_SQL, persisted=True)))
+
     # Relationships
     ratings = relationship("WizardTemplateRating", back_populates="template", cascade="all, delete-orphan")
 
@@ -48,12 +71,34 @@ class WizardTemplate(Base):
             difficulty_level.in_(['easy', 'medium', 'hard']),
             name='check_difficulty'
         ),
+        Index('idx_wizard_templates_search_vector', 'search_vector', postgresql_using='gin'),
+        # Typo-tolerant name matching (pg_trgm)
+        Index(
+            'idx_wizard_templates_name_trgm', 'template_name',
+            postgresql_using='gin', postgresql_ops={'template_name': 'gin_trgm_ops'}
+        ),
     )
 
+    @property
+    def rating_distribution(self) -> dict:
+        """Distribution of ratings (1-5 stars) from the stored buckets."""
+        return {stars: getattr(self, f"rating_{stars}_count") or 0 for stars in range(1, 6)}
+
     def __repr__(self):
         return f"<WizardTemplate(id={self.id}, name={self.template_name}, category={self.category})>"
 
 
+event.listen(
+    WizardTemplate.__table__,
+    "before_create",
+    DDL("""
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE OR REPLACE FUNCTION wizard_template_tags_text(text[]) RETURNS text
+            LANGUAGE sql IMMUTABLE AS $$ SELECT coalesce(array_to_string($1, ' '), '') $$;
+    """),
+)
+
+
 class WizardTemplateRating(Base):
     """
     Wizard Template Rating model for user ratings and reviews.
@@ -74,9 +119,31 @@ class WizardTemplateRating(Base):
     # Constraints
     __table_args__ = (
         CheckConstraint('rating >= 1 AND rating <= 5', name='check_rating_range'),
-        # Unique constraint: one rating per user per template
-        # Using tuple syntax for unique constraint
+        # One rating per user per template (target of the rating upsert)
+        UniqueConstraint('template_id', 'user_id', name='uq_wizard_template_ratings_template_user'),
     )
 
     def __repr__(self):
         return f"<WizardTemplateRating(template_id={self.template_id}, user_id={self.user_id}, rating={self.rating})>"
+
+
+class WizardTemplateSimilarity(Base):
+    """
+    Precomputed top-k "similar templates" neighbors of a template.
+    Maintained by the template similarity service whenever templates change.
+    """
+    __tablename__ = "wizard_template_similarities"
+
+    template_id = Column(UUID(as_uuid=True), ForeignKey('wizard_templates.id', ondelete='CASCADE'), primary_key=True)
+    similar_template_id = Column(UUID(as_uuid=True), ForeignKey('wizard_templates.id', ondelete='CASCADE'), primary_key=True)
+    rank = Column(Integer, nullable=False)  # 1 = most similar
+    score = Column(Float, nullable=False)  # cosine similarity in [0, 1]
+
+    __table_args__ = (
+        Index('idx_wizard_template_similarities_rank', 'template_id', 'rank'),
+        # Finds the templates whose neighbor lists contain a changed template
+        Index('idx_wizard_template_similarities_similar', 'similar_template_id'),
+    )
+
+    def __repr__(self):
+        return f"<WizardTemplateSimilarity(template_id={self.template_id}, similar={self.similar_template_id}, score={self.score})>"
@@ -31,6 +31,9 @@ from app.schemas.wizard_template import (
     WizardTemplateUpdate,
     WizardTemplateResponse,
     WizardTemplateListResponse,
+    WizardTemplateSearchResult,
+    WizardTemplateSearchResponse,
+    WizardTemplateSimilarResult,
     WizardTemplateRatingCreate,
     WizardTemplateRatingUpdate,
     WizardTemplateRatingResponse,
@@ -59,6 +62,7 @@ from app.schemas.wizard_run import (
     WizardRunComparisonResponse,
     WizardRunProgressUpdate,
     WizardRunExportRequest,
+    WizardRunNextStepResponse,
     WizardRunStats,
 )
 
@@ -94,6 +98,9 @@ __all__ = [
     "WizardTemplateUpdate",
     "WizardTemplateResponse",
     "WizardTemplateListResponse",
+    "WizardTemplateSearchResult",
+    "WizardTemplateSearchResponse",
+    "WizardTemplateSimilarResult",
     "WizardTemplateRatingCreate",
     "WizardTemplateRatingUpdate",
     "WizardTemplateRatingResponse",
@@ -121,5 +128,6 @@ __all__ = [
     "WizardRunComparisonResponse",
     "WizardRunProgressUpdate",
     "WizardRunExportRequest",
+    "WizardRunNextStepResponse",
     "WizardRunStats",
 ]
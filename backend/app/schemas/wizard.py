@@ -33,6 +33,44 @@ class OptionDependencyResponse(OptionDependencyBase):
         from_attributes = True
 
 
+class OptionStateRequest(BaseModel):
+    """Selected options to evaluate dependencies against."""
+    selected_option_ids: List[UUID] = []
+
+
+class OptionState(BaseModel):
+    visible: bool
+    disabled: bool
+
+
+class OptionSetState(BaseModel):
+    required: bool
+    disabled: bool
+    has_visible_options: bool
+
+
+class WizardOptionStateResponse(BaseModel):
+    """Dependency-evaluated state of every active option and option set of a wizard."""
+    options: Dict[UUID, OptionState]
+    option_sets: Dict[UUID, OptionSetState]
+
+
+class PriceQuoteRequest(BaseModel):
+    """Selected options to price."""
+    selected_option_ids: List[UUID] = []
+
+
+class OptionSetPrice(BaseModel):
+    amount: float
+    multiplier: float
+
+
+class PriceQuoteResponse(BaseModel):
+    """Price of a selection (or run) with its per option set contributions."""
+    calculated_price: Optional[Decimal] = None  # None when the wizard has no priced options
+    option_sets: Dict[UUID, OptionSetPrice] = {}
+
+
 # Category Schemas
 class WizardCategoryBase(BaseModel):
     name: str = Field(..., max_length=100)
@@ -69,7 +107,7 @@ class OptionBase(BaseModel):
 
 
 class OptionCreate(OptionBase):
-    pass
+    id: Optional[UUID] = None  # Existing option ID; preserved by structural updates
 
 
 class OptionUpdate(BaseModel):
@@ -114,6 +152,7 @@ class OptionSetBase(BaseModel):
 
 
 class OptionSetCreate(OptionSetBase):
+    id: Optional[UUID] = None  # Existing option set ID; preserved by structural updates
     options: List[OptionCreate] = []
 
 
@@ -154,6 +193,7 @@ class StepBase(BaseModel):
 
 
 class StepCreate(StepBase):
+    id: Optional[UUID] = None  # Existing step ID; preserved by structural updates
     option_sets: List[OptionSetCreate] = []
 
 
@@ -191,6 +231,7 @@ class WizardBase(BaseModel):
     allow_anonymous: bool = False
     auto_save: bool = True
     auto_save_interval: int = 30
+    abandon_after_hours: Optional[int] = Field(None, ge=1)
     estimated_time: Optional[int] = None
     difficulty_level: Optional[str] = Field(None, pattern="^(easy|medium|hard)$")
     tags: List[str] = []
@@ -210,6 +251,7 @@ class WizardUpdate(BaseModel):
     allow_templates: Optional[bool] = None
     require_login: Optional[bool] = None
     auto_save: Optional[bool] = None
+    abandon_after_hours: Optional[int] = Field(None, ge=1)
     estimated_time: Optional[int] = None
     difficulty_level: Optional[str] = None
     tags: Optional[List[str]] = None
@@ -246,6 +288,8 @@ class WizardListResponse(BaseModel):
     tags: List[str] = []
     total_sessions: int
     completed_sessions: int
+    lifecycle_state: Optional[str] = None
+    run_count: int = 0
     category: Optional[WizardCategoryResponse] = None
     created_at: datetime
 
@@ -286,3 +330,35 @@ class FlowRuleResponse(FlowRuleBase):
 
     class Config:
         from_attributes = True
+
+
+# Wizard Version Schemas
+class WizardVersionResponse(BaseModel):
+    id: UUID
+    wizard_id: UUID
+    sequence: int
+    label: Optional[str] = None
+    root_hash: str
+    new_node_count: int = 0
+    created_by: Optional[UUID] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+# Background Job Schemas
+class BackgroundJobResponse(BaseModel):
+    id: UUID
+    job_type: str
+    status: str
+    params: Dict[str, Any] = {}
+    total: Optional[int] = None
+    processed: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -3,7 +3,7 @@ Wizard Run Schemas
 
 Pydantic schemas for request/response validation of wizard runs.
 """
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from uuid import UUID
@@ -298,8 +298,13 @@ class WizardRunProgressUpdate(BaseModel):
 
 
 class WizardRunExportRequest(BaseModel):
-    """Schema for exporting wizard run."""
-    run_id: UUID
+    """
+    Schema for exporting wizard runs.
+    Exactly one scope must be given: a single run, a user's runs or all runs of a wizard.
+    """
+    run_id: Optional[UUID] = None
+    user_id: Optional[UUID] = None
+    wizard_id: Optional[UUID] = None
     format: str = Field(default='json', pattern="^(json|pdf|csv)$")
     include_metadata: bool = True
     include_files: bool = False
@@ -311,6 +316,22 @@ class WizardRunExportRequest(BaseModel):
             raise ValueError('format must be json, pdf, or csv')
         return v
 
+    @model_validator(mode='after')
+    def validate_scope(self):
+        scopes = [self.run_id, self.user_id, self.wizard_id]
+        if sum(scope is not None for scope in scopes) != 1:
+            raise ValueError('exactly one of run_id, user_id or wizard_id must be provided')
+        return self
+
+
+class WizardRunNextStepResponse(BaseModel):
+    """Schema for server-side next-step resolution from flow rules."""
+    from_step_id: UUID
+    next_step_id: Optional[UUID] = None
+    next_step_index: Optional[int] = None
+    matched_rule_id: Optional[UUID] = None  # None when following step order
+    is_last_step: bool
+
 
 class WizardRunStats(BaseModel):
     """Schema for wizard run statistics."""
@@ -82,6 +82,30 @@ class WizardTemplateListResponse(BaseModel):
     total_pages: int
 
 
+class WizardTemplateSearchResult(BaseModel):
+    """Schema for a single ranked search hit."""
+    template: WizardTemplateResponse
+    rank: float
+    name_highlight: Optional[str] = None
+    description_highlight: Optional[str] = None
+
+
+class WizardTemplateSearchResponse(BaseModel):
+    """Schema for paginated, relevance-ranked template search results."""
+    query: str
+    results: List[WizardTemplateSearchResult]
+    total: int
+    page: int
+    page_size: int
+    total_pages: int
+
+
+class WizardTemplateSimilarResult(BaseModel):
+    """Schema for a single "similar template" neighbor."""
+    template: WizardTemplateResponse
+    score: float  # cosine similarity in [0, 1]
+
+
 class WizardTemplateRatingBase(BaseModel):
     """Base wizard template rating schema."""
     rating: int = Field(..., ge=1, le=5)
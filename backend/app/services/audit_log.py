@@ -0,0 +1,242 @@
+"""
+Audit Log Service
+
+Records audit_logs entries off the request path:
+1. SessionLocal flush hooks capture create/update/delete of audited models
+2. Captured entries are enqueued only once the transaction commits
+3. A background writer bulk-inserts them in batches, and drains on shutdown
+
+The queue is bounded; when it is full new entries are dropped (and counted)
+rather than blocking a write endpoint.
+"""
+import queue
+import threading
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from sqlalchemy import event, insert, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.analytics import AuditLog
+from app.models.user import User, UserRole
+from app.models.wizard import Wizard, WizardCategory, Step, OptionSet, Option, OptionDependency, FlowRule
+from app.models.wizard_template import WizardTemplate
+from app.models.wizard_run import WizardRun, WizardRunShare
+
+
+# Response rows are written on every auto-save and are deliberately not audited
+AUDITED_MODELS = (
+    User, UserRole,
+    Wizard, WizardCategory, Step, OptionSet, Option, OptionDependency, FlowRule,
+    WizardTemplate,
+    WizardRun, WizardRunShare,
+)
+
+# Never copied into audit records
+REDACTED_COLUMNS = {"password_hash"}
+
+# Bookkeeping columns that would only add noise to update records
+IGNORED_UPDATE_COLUMNS = {"updated_at", "last_accessed_at"}
+
+_PENDING_KEY = "audit_pending"
+
+
+def _json_safe(value: Any) -> Any:
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [_json_safe(v) for v in value]
+    return value
+
+
+def _column_values(obj, loaded_only: bool = False) -> Dict[str, Any]:
+    state = inspect(obj)
+    return {
+        attr.key: _json_safe(state.dict[attr.key] if loaded_only else getattr(obj, attr.key))
+        for attr in state.mapper.column_attrs
+        if attr.key not in REDACTED_COLUMNS and (not loaded_only or attr.key in state.dict)
+    }
+
+
+def _changed_values(obj) -> tuple[Dict[str, Any], Dict[str, Any]]:
+    old_values, new_values = {}, {}
+    for attr in inspect(obj).mapper.column_attrs:
+        if attr.key in REDACTED_COLUMNS or attr.key in IGNORED_UPDATE_COLUMNS:
+            continue
+        history = get_history(obj, attr.key)
+        if not history.has_changes():
+            continue
+        old_values[attr.key] = _json_safe(history.deleted[0]) if history.deleted else None
+        new_values[attr.key] = _json_safe(history.added[0]) if history.added else None
+    return old_values, new_values
+
+
+def _capture(session: Session, flush_context) -> None:
+    """Capture audited changes after the flush (IDs and defaults are assigned by then)."""
+    pending: List[Dict[str, Any]] = session.info.setdefault(_PENDING_KEY, [])
+    context = {
+        "user_id": session.info.get("user_id"),
+        "ip_address": session.info.get("ip_address"),
+        "user_agent": session.info.get("user_agent"),
+    }
+    now = datetime.now(timezone.utc)
+
+    for obj in session.new:
+        if isinstance(obj, AUDITED_MODELS):
+            pending.append({
+                **context, "action": "create", "resource_type": obj.__tablename__,
+                "resource_id": obj.id, "old_values": None, "new_values": _column_values(obj),
+                "created_at": now,
+            })
+
+    for obj in session.dirty:
+        if isinstance(obj, AUDITED_MODELS) and session.is_modified(obj, include_collections=False):
+            old_values, new_values = _changed_values(obj)
+            if new_values:
+                pending.append({
+                    **context, "action": "update", "resource_type": obj.__tablename__,
+                    "resource_id": obj.id, "old_values": old_values, "new_values": new_values,
+                    "created_at": now,
+                })
+
+    for obj in session.deleted:
+        if isinstance(obj, AUDITED_MODELS):
+            pending.append({
+                **context, "action": "delete", "resource_type": obj.__tablename__,
+                "resource_id": obj.id, "old_values": _column_values(obj, loaded_only=True), "new_values": None,
+                "created_at": now,
+            })
+
+
+def record(
+    session: Session,
+    action: str,
+    resource_type: str,
+    resource_id: UUID,
+    new_values: Optional[Dict[str, Any]] = None,
+    old_values: Optional[Dict[str, Any]] = None,
+) -> None:
+    """
+    Add an audit entry for a change made with Core/bulk statements, which bypass
+    the flush hooks. Like captured entries, it is only written if the transaction commits.
+    """
+    session.info.setdefault(_PENDING_KEY, []).append({
+        "user_id": session.info.get("user_id"),
+        "ip_address": session.info.get("ip_address"),
+        "user_agent": session.info.get("user_agent"),
+        "action": action,
+        "resource_type": resource_type,
+        "resource_id": resource_id,
+        "old_values": _json_safe(old_values) if old_values is not None else None,
+        "new_values": _json_safe(new_values) if new_values is not None else None,
+        "created_at": datetime.now(timezone.utc),
+    })
+
+
+def _enqueue_committed(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        audit_log_writer.enqueue_many(pending)
+
+
+def _discard(session: Session, *args) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+class AuditLogWriter:
+    """Bounded queue drained by a background thread that bulk-inserts audit rows."""
+
+    def __init__(self, max_queue_size: int, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue_size)
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    def enqueue_many(self, entries: List[Dict[str, Any]]) -> None:
+        """Queue entries without blocking; entries that do not fit are dropped."""
+        for entry in entries:
+            try:
+                self._queue.put_nowait(entry)
+            except queue.Full:
+                self.dropped += 1
+
+    def _drain(self, block: bool) -> List[Dict[str, Any]]:
+        batch: List[Dict[str, Any]] = []
+        try:
+            if block:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        if not batch:
+            return
+        db = SessionLocal()
+        try:
+            db.execute(insert(AuditLog), batch)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"[WARN] Failed to write {len(batch)} audit log entries: {e}")
+        finally:
+            db.close()
+
+    def flush(self) -> None:
+        """Write everything currently queued."""
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            self._write(self._drain(block=True))
+
+    def start(self) -> None:
+        """Start the background writer thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the writer and flush all remaining entries."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+        self.flush()
+        if self.dropped:
+            print(f"[WARN] {self.dropped} audit log entries were dropped because the queue was full")
+
+
+audit_log_writer = AuditLogWriter(
+    max_queue_size=settings.AUDIT_QUEUE_MAX_SIZE,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+)
+
+event.listen(SessionLocal, "after_flush", _capture)
+event.listen(SessionLocal, "after_commit", _enqueue_committed)
+event.listen(SessionLocal, "after_rollback", _discard)
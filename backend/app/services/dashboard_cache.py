@@ -0,0 +1,133 @@
+"""
+Dashboard Statistics Cache
+
+Stale-while-revalidate cache for the admin dashboard:
+1. Fresh: served straight from memory
+2. Stale: served from memory while a single background refresh runs
+3. Expired/empty: recomputed synchronously, one caller at a time
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.user import User
+from app.models.wizard import Wizard
+
+
+def compute_dashboard_stats(db: Session) -> Dict:
+    """
+    Compute dashboard statistics with one aggregate query per table.
+
+    Args:
+        db: Database session
+
+    Returns:
+        Dictionary of dashboard counters
+    """
+    week_ago = datetime.now(timezone.utc) - timedelta(days=7)
+
+    wizard_counts = db.execute(
+        select(
+            func.count(Wizard.id),
+            func.count(Wizard.id).filter(Wizard.is_published == True),
+            func.count(Wizard.id).filter(Wizard.created_at >= week_ago),
+        ).where(Wizard.is_active == True)
+    ).one()
+    total_users = db.query(func.count(User.id)).scalar()
+
+    return {
+        "total_wizards": wizard_counts[0],
+        "published_wizards": wizard_counts[1],
+        "wizards_created_this_week": wizard_counts[2],
+        "total_users": total_users,
+    }
+
+
+class DashboardStatsCache:
+    """
+    Process-local stale-while-revalidate cache for dashboard statistics.
+
+    A single refresh lock guarantees that concurrent requests never
+    recompute the statistics together.
+    """
+
+    def __init__(self, ttl: int, max_stale: int):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._refresh_lock = threading.Lock()
+        self._value: Optional[Dict] = None
+        self._fetched_at: float = 0.0
+        self.hits = 0  # served from memory (fresh or stale)
+        self.misses = 0  # recomputed synchronously
+
+    def _age(self) -> float:
+        return time.monotonic() - self._fetched_at
+
+    def _store(self, stats: Dict) -> Dict:
+        value = {**stats, "as_of": datetime.now(timezone.utc).isoformat()}
+        self._value = value
+        self._fetched_at = time.monotonic()
+        return value
+
+    def _refresh_in_background(self) -> None:
+        """Recompute with a dedicated session; caller must hold the refresh lock."""
+        db = SessionLocal()
+        try:
+            self._store(compute_dashboard_stats(db))
+        except Exception as e:
+            print(f"[WARN] Dashboard stats refresh failed: {e}")
+        finally:
+            db.close()
+            self._refresh_lock.release()
+
+    def get(self, db: Session) -> Dict:
+        """
+        Get dashboard statistics, recomputing only when needed.
+
+        Args:
+            db: Request database session, used for synchronous recomputation
+
+        Returns:
+            Dashboard statistics including an ``as_of`` timestamp
+        """
+        value = self._value
+        if value is not None:
+            age = self._age()
+            if age < self.ttl:
+                self.hits += 1
+                return value
+            if age < self.ttl + self.max_stale:
+                # Stale: hand back the old numbers and let one thread refresh them
+                if self._refresh_lock.acquire(blocking=False):
+                    threading.Thread(
+                        target=self._refresh_in_background,
+                        name="dashboard-stats-refresh",
+                        daemon=True,
+                    ).start()
+                self.hits += 1
+                return value
+
+        # Empty or expired: recompute synchronously, one caller at a time
+        with self._refresh_lock:
+            if self._value is not None and self._age() < self.ttl:
+                self.hits += 1
+                return self._value
+            self.misses += 1
+            return self._store(compute_dashboard_stats(db))
+
+    def invalidate(self) -> None:
+        """Drop the cached statistics so the next read recomputes them."""
+        self._value = None
+        self._fetched_at = 0.0
+
+
+dashboard_stats_cache = DashboardStatsCache(
+    ttl=settings.DASHBOARD_CACHE_TTL,
+    max_stale=settings.DASHBOARD_CACHE_MAX_STALE,
+)
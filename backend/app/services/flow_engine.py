@@ -0,0 +1,317 @@
+"""
+Flow Rule Engine
+
+Resolves the next step of a wizard run on the server:
+1. A wizard's active flow rules are compiled once into predicates, grouped by
+   from_step_id and sorted by priority (highest first)
+2. Compiled flows are cached per wizard and keyed by a version token of its
+   steps and rules, so edits from any worker are picked up on the next lookup
+3. Resolution evaluates only the rules leaving the current step; without a
+   match the run continues with the next step in step_order
+
+Condition format (JSONB):
+    {}                                            always true
+    {"all": [cond, ...]} / {"any": [...]} / {"not": cond}
+    {"option_set_id": ..., "operator": ..., "value": ...}
+    {"option_id": ..., "operator": "selected" | "not_selected"}
+    {"conditions": [{"field_id", "operator", "value", "logic": "AND" | "OR"}, ...]}
+
+The last form evaluates left to right. Leaf operators are equals, not_equals,
+in, not_in, contains, not_contains, greater_than, greater_or_equal,
+less_than, less_or_equal, is_empty and is_not_empty. A single/multiple select
+answer matches a value by option ID or by option value.
+"""
+import threading
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.wizard import Step, Option, FlowRule
+from app.models.wizard_run import WizardRunOptionSetResponse
+
+FLOW_CACHE_MAX_WIZARDS = 512
+
+
+@dataclass
+class Answer:
+    """A run's answer to one option set, normalized for rule evaluation."""
+    value: Any = None
+    selected: Set[str] = field(default_factory=set)  # selected option IDs and option values
+
+
+Answers = Dict[str, Answer]  # keyed by option set ID (str)
+Predicate = Callable[[Answers], bool]
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_empty(answer: Optional[Answer]) -> bool:
+    return answer is None or (not answer.selected and answer.value in (None, "", [], {}))
+
+
+def _values(answer: Answer) -> Set[str]:
+    values = set(answer.selected)
+    if isinstance(answer.value, list):
+        values.update(str(v) for v in answer.value)
+    elif answer.value is not None:
+        values.add(str(answer.value))
+    return values
+
+
+def _compare(operator: str, expected: Any) -> Callable[[Optional[Answer]], bool]:
+    if operator == "is_empty":
+        return _is_empty
+    if operator == "is_not_empty":
+        return lambda answer: not _is_empty(answer)
+
+    if operator in ("equals", "not_equals"):
+        target = str(expected)
+        matches = lambda answer: answer is not None and target in _values(answer)
+        return matches if operator == "equals" else (lambda answer: not matches(answer))
+
+    if operator in ("in", "not_in"):
+        if not isinstance(expected, list):
+            raise ValueError(f"'{operator}' expects a list value")
+        targets = {str(v) for v in expected}
+        matches = lambda answer: answer is not None and bool(targets & _values(answer))
+        return matches if operator == "in" else (lambda answer: not matches(answer))
+
+    if operator in ("contains", "not_contains"):
+        target = str(expected).lower()
+        def matches(answer):
+            if answer is None:
+                return False
+            return any(target in value.lower() for value in _values(answer))
+        return matches if operator == "contains" else (lambda answer: not matches(answer))
+
+    comparisons = {
+        "greater_than": lambda a, b: a > b,
+        "greater_or_equal": lambda a, b: a >= b,
+        "less_than": lambda a, b: a < b,
+        "less_or_equal": lambda a, b: a <= b,
+    }
+    if operator in comparisons:
+        bound = _number(expected)
+        if bound is None:
+            raise ValueError(f"'{operator}' expects a numeric value")
+        compare = comparisons[operator]
+        def matches(answer):
+            actual = _number(answer.value) if answer is not None else None
+            return actual is not None and compare(actual, bound)
+        return matches
+
+    raise ValueError(f"Unknown operator '{operator}'")
+
+
+def compile_condition(condition: Any) -> Predicate:
+    """
+    Compile a JSON condition into a predicate over a run's answers.
+
+    Raises:
+        ValueError: If the condition is malformed
+    """
+    if not condition:
+        return lambda answers: True
+    if not isinstance(condition, dict):
+        raise ValueError("Condition must be an object")
+
+    if "all" in condition or "any" in condition:
+        key = "all" if "all" in condition else "any"
+        if not isinstance(condition[key], list):
+            raise ValueError(f"'{key}' expects a list of conditions")
+        parts = [compile_condition(part) for part in condition[key]]
+        combine = all if key == "all" else any
+        return lambda answers: combine(part(answers) for part in parts)
+
+    if "not" in condition:
+        inner = compile_condition(condition["not"])
+        return lambda answers: not inner(answers)
+
+    if "conditions" in condition:
+        if not isinstance(condition["conditions"], list):
+            raise ValueError("'conditions' expects a list")
+        chain: List[Tuple[str, Predicate]] = []
+        for part in condition["conditions"]:
+            if not isinstance(part, dict) or "field_id" not in part:
+                raise ValueError("Each entry in 'conditions' needs a field_id")
+            leaf = {"option_set_id": part["field_id"], "operator": part.get("operator"), "value": part.get("value")}
+            chain.append((str(part.get("logic", "AND")).upper(), compile_condition(leaf)))
+
+        def evaluate_chain(answers: Answers) -> bool:
+            result = True
+            for index, (logic, predicate) in enumerate(chain):
+                if index == 0:
+                    result = predicate(answers)
+                elif logic == "OR":
+                    result = result or predicate(answers)
+                else:
+                    result = result and predicate(answers)
+            return result
+        return evaluate_chain
+
+    operator = condition.get("operator")
+    if "option_id" in condition:
+        option_id = str(condition["option_id"])
+        if operator not in ("selected", "not_selected"):
+            raise ValueError("option_id conditions support 'selected' and 'not_selected'")
+        selected = lambda answers: any(option_id in answer.selected for answer in answers.values())
+        return selected if operator == "selected" else (lambda answers: not selected(answers))
+
+    if "option_set_id" in condition:
+        option_set_id = str(condition["option_set_id"])
+        compare = _compare(operator, condition.get("value"))
+        return lambda answers: compare(answers.get(option_set_id))
+
+    raise ValueError("Condition needs all/any/not/conditions, option_set_id or option_id")
+
+
+@dataclass
+class CompiledFlow:
+    """Flow rules of one wizard version, ready for evaluation."""
+    version: Hashable
+    step_sequence: List[UUID]
+    step_index: Dict[UUID, int]
+    rules_by_step: Dict[UUID, List[Tuple[UUID, UUID, Predicate]]]  # (rule_id, to_step_id, predicate)
+
+
+class FlowRuleEngine:
+    """Compiles and caches flow rules per wizard and resolves next steps."""
+
+    def __init__(self, max_wizards: int):
+        self.max_wizards = max_wizards
+        self._lock = threading.Lock()
+        self._flows: "OrderedDict[UUID, CompiledFlow]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _version(self, db: Session, wizard_id: UUID) -> Hashable:
+        """Cheap token that changes whenever the wizard's steps or flow rules change."""
+        rules = db.query(func.count(FlowRule.id), func.max(FlowRule.updated_at))\
+            .filter(FlowRule.wizard_id == wizard_id).one()
+        steps = db.query(func.count(Step.id), func.max(Step.updated_at), func.sum(Step.step_order))\
+            .filter(Step.wizard_id == wizard_id).one()
+        return tuple(rules) + tuple(steps)
+
+    def _compile(self, db: Session, wizard_id: UUID, version: Hashable) -> CompiledFlow:
+        step_sequence = [
+            step_id for (step_id,) in
+            db.query(Step.id).filter(Step.wizard_id == wizard_id).order_by(Step.step_order)
+        ]
+        rules = db.query(FlowRule)\
+            .filter(FlowRule.wizard_id == wizard_id, FlowRule.is_active == True)\
+            .order_by(FlowRule.priority.desc(), FlowRule.created_at)\
+            .all()
+
+        rules_by_step: Dict[UUID, List[Tuple[UUID, UUID, Predicate]]] = defaultdict(list)
+        for rule in rules:
+            try:
+                predicate = compile_condition(rule.condition)
+            except ValueError as e:
+                # Invalid stored rules are skipped rather than breaking navigation
+                print(f"[WARN] Skipping flow rule {rule.id}: {e}")
+                continue
+            rules_by_step[rule.from_step_id].append((rule.id, rule.to_step_id, predicate))
+
+        return CompiledFlow(
+            version=version,
+            step_sequence=step_sequence,
+            step_index={step_id: index for index, step_id in enumerate(step_sequence)},
+            rules_by_step=dict(rules_by_step),
+        )
+
+    def get_flow(self, db: Session, wizard_id: UUID) -> CompiledFlow:
+        """Compiled flow for the wizard's current version (compiled on first use or after edits)."""
+        version = self._version(db, wizard_id)
+        with self._lock:
+            flow = self._flows.get(wizard_id)
+            if flow is not None and flow.version == version:
+                self._flows.move_to_end(wizard_id)
+                self.hits += 1
+                return flow
+
+        self.misses += 1
+        flow = self._compile(db, wizard_id, version)
+        with self._lock:
+            self._flows[wizard_id] = flow
+            self._flows.move_to_end(wizard_id)
+            while len(self._flows) > self.max_wizards:
+                self._flows.popitem(last=False)
+        return flow
+
+    def invalidate(self, wizard_id: UUID) -> None:
+        """Drop a wizard's compiled flow (the version token also catches edits from other workers)."""
+        with self._lock:
+            self._flows.pop(wizard_id, None)
+
+    def load_answers(self, db: Session, run_id: UUID) -> Answers:
+        """Normalize a run's option set responses for rule evaluation."""
+        responses = db.query(
+            WizardRunOptionSetResponse.option_set_id,
+            WizardRunOptionSetResponse.response_value,
+            WizardRunOptionSetResponse.selected_options,
+        ).filter(WizardRunOptionSetResponse.run_id == run_id).all()
+        return self.answers_from_responses(db, responses)
+
+    def answers_from_responses(self, db: Session, responses) -> Answers:
+        """Normalize option set responses (rows or archived instances) for rule evaluation."""
+        selected_ids = {option_id for response in responses for option_id in response.selected_options or []}
+        option_values = dict(
+            db.query(Option.id, Option.value).filter(Option.id.in_(selected_ids)).all()
+        ) if selected_ids else {}
+
+        answers: Answers = {}
+        for response in responses:
+            raw = response.response_value
+            value = raw.get("value", raw) if isinstance(raw, dict) else raw
+            selected = set()
+            for option_id in response.selected_options or []:
+                selected.add(str(option_id))
+                if option_id in option_values:
+                    selected.add(option_values[option_id])
+            answers[str(response.option_set_id)] = Answer(value=value, selected=selected)
+        return answers
+
+    def resolve_next_step(
+        self, db: Session, wizard_id: UUID, from_step_id: UUID, answers: Answers
+    ) -> Dict[str, Any]:
+        """
+        Resolve the step that follows from_step_id for the given answers.
+
+        Returns:
+            Dictionary with next_step_id/next_step_index (None after the last step),
+            matched_rule_id (None when falling through to step order) and is_last_step
+        """
+        flow = self.get_flow(db, wizard_id)
+        if from_step_id not in flow.step_index:
+            raise ValueError("Step does not belong to this wizard")
+
+        next_step_id, matched_rule_id = None, None
+        for rule_id, to_step_id, predicate in flow.rules_by_step.get(from_step_id, []):
+            if predicate(answers):
+                next_step_id, matched_rule_id = to_step_id, rule_id
+                break
+
+        if next_step_id is None:
+            index = flow.step_index[from_step_id] + 1
+            next_step_id = flow.step_sequence[index] if index < len(flow.step_sequence) else None
+
+        next_step_index = flow.step_index.get(next_step_id)
+        return {
+            "from_step_id": from_step_id,
+            "next_step_id": next_step_id,
+            "next_step_index": next_step_index,
+            "matched_rule_id": matched_rule_id,
+            "is_last_step": next_step_id is None,
+        }
+
+
+flow_rule_engine = FlowRuleEngine(max_wizards=FLOW_CACHE_MAX_WIZARDS)
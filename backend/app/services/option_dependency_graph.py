@@ -0,0 +1,246 @@
+"""
+Option Dependency Graph
+
+Compiles a wizard's option dependencies (show_if, hide_if, require_if, disable_if)
+into an adjacency index and evaluates option state on the server:
+1. Edges "option depends on option" are loaded once per wizard version and
+   topologically sorted, so every option is evaluated after the options it depends on
+2. New dependencies are rejected at write time if they would create a cycle, point
+   at another wizard, duplicate an edge or contradict one (show_if vs hide_if)
+3. Evaluation is a single pass in topological order. A selection only counts
+   as "met" if the selected option is itself visible and enabled.
+
+Semantics match the player: show_if/hide_if control option visibility,
+disable_if disables the option and its option set, require_if makes the
+option set required.
+"""
+import threading
+from collections import OrderedDict, defaultdict, deque
+from dataclasses import dataclass
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.wizard import Step, OptionSet, Option, OptionDependency
+
+GRAPH_CACHE_MAX_WIZARDS = 512
+
+CONTRADICTING_TYPES = {"show_if": "hide_if", "hide_if": "show_if"}
+
+
+def _wizard_id_of_option(db: Session, option_id: UUID) -> Optional[UUID]:
+    return db.query(Step.wizard_id)\
+        .join(OptionSet, OptionSet.step_id == Step.id)\
+        .join(Option, Option.option_set_id == OptionSet.id)\
+        .filter(Option.id == option_id)\
+        .scalar()
+
+
+def _wizard_edges(db: Session, wizard_id: UUID) -> List[Tuple[UUID, UUID, str]]:
+    """(option_id, depends_on_option_id, dependency_type) for every dependency of a wizard."""
+    return db.query(OptionDependency.option_id, OptionDependency.depends_on_option_id, OptionDependency.dependency_type)\
+        .join(Option, Option.id == OptionDependency.option_id)\
+        .join(OptionSet, OptionSet.id == Option.option_set_id)\
+        .join(Step, Step.id == OptionSet.step_id)\
+        .filter(Step.wizard_id == wizard_id)\
+        .all()
+
+
+def _reaches(adjacency: Dict[UUID, Set[UUID]], start: UUID, target: UUID) -> bool:
+    stack, seen = [start], set()
+    while stack:
+        node = stack.pop()
+        if node == target:
+            return True
+        if node in seen:
+            continue
+        seen.add(node)
+        stack.extend(adjacency.get(node, ()))
+    return False
+
+
+def validate_new_dependency(db: Session, option_id: UUID, depends_on_option_id: UUID, dependency_type: str) -> None:
+    """
+    Check that adding option_id -> depends_on_option_id keeps the wizard's graph valid.
+
+    Raises:
+        ValueError: If the edge would create a cycle, crosses wizards, or duplicates
+            or contradicts an existing dependency
+    """
+    if option_id == depends_on_option_id:
+        raise ValueError("An option cannot depend on itself")
+
+    wizard_id = _wizard_id_of_option(db, option_id)
+    if wizard_id is None or wizard_id != _wizard_id_of_option(db, depends_on_option_id):
+        raise ValueError("Both options must belong to the same wizard")
+
+    adjacency: Dict[UUID, Set[UUID]] = defaultdict(set)
+    for source, target, existing_type in _wizard_edges(db, wizard_id):
+        adjacency[source].add(target)
+        if (source, target) == (option_id, depends_on_option_id):
+            if existing_type == dependency_type:
+                raise ValueError("This dependency already exists")
+            if CONTRADICTING_TYPES.get(existing_type) == dependency_type:
+                raise ValueError(f"Contradicts the existing '{existing_type}' dependency on the same option")
+
+    # The new edge closes a cycle if the target already (transitively) depends on the source
+    if _reaches(adjacency, depends_on_option_id, option_id):
+        raise ValueError("This dependency would create a cycle")
+
+
+@dataclass
+class DependencyGraph:
+    """Compiled dependency graph of one wizard version."""
+    version: Hashable
+    order: List[UUID]  # options in topological order (dependencies first)
+    cyclic: Set[UUID]  # options on cycles in legacy data; evaluated on raw selections
+    edges: Dict[UUID, List[Tuple[UUID, str]]]  # option -> [(depends_on, type)]
+    option_set_of: Dict[UUID, UUID]
+    option_sets_required: Dict[UUID, bool]
+
+    def evaluate(self, selected_option_ids: Iterable[UUID]) -> Dict[str, Dict]:
+        """
+        Option and option set state for a set of selected options, in one pass.
+
+        Returns:
+            {"options": {id: {"visible", "disabled"}}, "option_sets": {id: {"required", "disabled", "has_visible_options"}}}
+        """
+        selected = set(selected_option_ids)
+        effective: Set[UUID] = set()
+        options: Dict[UUID, Dict[str, bool]] = {}
+        set_required = dict(self.option_sets_required)
+        set_disabled = {option_set_id: False for option_set_id in self.option_sets_required}
+        set_has_visible = {option_set_id: False for option_set_id in self.option_sets_required}
+
+        for option_id in self.order:
+            visible, disabled = True, False
+            option_set_id = self.option_set_of[option_id]
+            for depends_on, dependency_type in self.edges.get(option_id, ()):
+                met = depends_on in (selected if depends_on in self.cyclic else effective)
+                if dependency_type == "show_if" and not met:
+                    visible = False
+                elif dependency_type == "hide_if" and met:
+                    visible = False
+                elif dependency_type == "disable_if" and met:
+                    disabled = True
+                    set_disabled[option_set_id] = True
+                elif dependency_type == "require_if" and met:
+                    set_required[option_set_id] = True
+
+            options[option_id] = {"visible": visible, "disabled": disabled}
+            if visible:
+                set_has_visible[option_set_id] = True
+                if not disabled and option_id in selected:
+                    effective.add(option_id)
+
+        return {
+            "options": options,
+            "option_sets": {
+                option_set_id: {
+                    "required": set_required[option_set_id],
+                    "disabled": set_disabled[option_set_id],
+                    "has_visible_options": set_has_visible[option_set_id],
+                }
+                for option_set_id in self.option_sets_required
+            },
+        }
+
+
+def _topological_order(option_ids: List[UUID], edges: Dict[UUID, List[Tuple[UUID, str]]]) -> Tuple[List[UUID], Set[UUID]]:
+    """Kahn's algorithm; options left over are on (or behind) a cycle."""
+    known = set(option_ids)
+    in_degree = {option_id: 0 for option_id in option_ids}
+    dependents: Dict[UUID, List[UUID]] = defaultdict(list)
+    for option_id, dependencies in edges.items():
+        for depends_on, _ in dependencies:
+            if depends_on in known and option_id in known:
+                in_degree[option_id] += 1
+                dependents[depends_on].append(option_id)
+
+    queue = deque(option_id for option_id in option_ids if in_degree[option_id] == 0)
+    order = []
+    while queue:
+        option_id = queue.popleft()
+        order.append(option_id)
+        for dependent in dependents[option_id]:
+            in_degree[dependent] -= 1
+            if in_degree[dependent] == 0:
+                queue.append(dependent)
+
+    cyclic = {option_id for option_id in option_ids if in_degree[option_id] > 0}
+    return order + [option_id for option_id in option_ids if option_id in cyclic], cyclic
+
+
+class DependencyGraphCompiler:
+    """Compiles and caches dependency graphs per wizard version."""
+
+    def __init__(self, max_wizards: int):
+        self.max_wizards = max_wizards
+        self._lock = threading.Lock()
+        self._graphs: "OrderedDict[UUID, DependencyGraph]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _version(self, db: Session, wizard_id: UUID) -> Hashable:
+        options = db.query(func.count(Option.id), func.max(Option.updated_at), func.max(OptionSet.updated_at))\
+            .join(OptionSet, OptionSet.id == Option.option_set_id)\
+            .join(Step, Step.id == OptionSet.step_id)\
+            .filter(Step.wizard_id == wizard_id).one()
+        dependencies = db.query(func.count(OptionDependency.id), func.max(OptionDependency.created_at))\
+            .join(Option, Option.id == OptionDependency.option_id)\
+            .join(OptionSet, OptionSet.id == Option.option_set_id)\
+            .join(Step, Step.id == OptionSet.step_id)\
+            .filter(Step.wizard_id == wizard_id).one()
+        return tuple(options) + tuple(dependencies)
+
+    def _compile(self, db: Session, wizard_id: UUID, version: Hashable) -> DependencyGraph:
+        option_sets = db.query(OptionSet.id, OptionSet.is_required)\
+            .join(Step, Step.id == OptionSet.step_id)\
+            .filter(Step.wizard_id == wizard_id).all()
+        options = db.query(Option.id, Option.option_set_id)\
+            .join(OptionSet, OptionSet.id == Option.option_set_id)\
+            .join(Step, Step.id == OptionSet.step_id)\
+            .filter(Step.wizard_id == wizard_id, Option.is_active == True)\
+            .order_by(Step.step_order, OptionSet.display_order, Option.display_order).all()
+
+        edges: Dict[UUID, List[Tuple[UUID, str]]] = defaultdict(list)
+        for option_id, depends_on, dependency_type in _wizard_edges(db, wizard_id):
+            edges[option_id].append((depends_on, dependency_type))
+
+        option_ids = [option.id for option in options]
+        order, cyclic = _topological_order(option_ids, edges)
+        if cyclic:
+            print(f"[WARN] Wizard {wizard_id} has {len(cyclic)} options on dependency cycles")
+
+        return DependencyGraph(
+            version=version,
+            order=order,
+            cyclic=cyclic,
+            edges=dict(edges),
+            option_set_of={option.id: option.option_set_id for option in options},
+            option_sets_required={option_set.id: bool(option_set.is_required) for option_set in option_sets},
+        )
+
+    def get_graph(self, db: Session, wizard_id: UUID) -> DependencyGraph:
+        """Compiled graph for the wizard's current version (compiled on first use or after edits)."""
+        version = self._version(db, wizard_id)
+        with self._lock:
+            graph = self._graphs.get(wizard_id)
+            if graph is not None and graph.version == version:
+                self._graphs.move_to_end(wizard_id)
+                self.hits += 1
+                return graph
+
+        self.misses += 1
+        graph = self._compile(db, wizard_id, version)
+        with self._lock:
+            self._graphs[wizard_id] = graph
+            self._graphs.move_to_end(wizard_id)
+            while len(self._graphs) > self.max_wizards:
+                self._graphs.popitem(last=False)
+        return graph
+
+
+dependency_graph_compiler = DependencyGraphCompiler(max_wizards=GRAPH_CACHE_MAX_WIZARDS)
@@ -0,0 +1,183 @@
+"""
+Option Popularity Service
+
+Keeps option_selection_counts in step with wizard_run_option_set_responses:
+1. A before_flush hook diffs selected_options of new, changed and deleted responses
+2. The resulting per-option/day deltas are upserted in the same transaction
+3. Popularity reads are then a small aggregate over the counts table
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import event, text, bindparam, Date, Integer
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from app.database import SessionLocal
+from app.models.wizard import Option
+from app.models.wizard_run import WizardRunOptionSetResponse
+
+
+# Unknown option IDs (selected_options is not FK-checked) are skipped by the join
+UPSERT_SELECTION_COUNT_SQL = text("""
+    INSERT INTO option_selection_counts (option_id, option_set_id, day, selection_count)
+    SELECT o.id, o.option_set_id, :day, :delta
+    FROM options o
+    WHERE o.id = :option_id
+    ON CONFLICT (option_id, day) DO UPDATE
+    SET selection_count = option_selection_counts.selection_count + EXCLUDED.selection_count
+""").bindparams(
+    bindparam("option_id", type_=PG_UUID(as_uuid=True)),
+    bindparam("day", type_=Date),
+    bindparam("delta", type_=Integer),
+)
+
+RELEASE_RUN_SELECTIONS_SQL = text("""
+    INSERT INTO option_selection_counts (option_id, option_set_id, day, selection_count)
+    SELECT o.id, o.option_set_id, (r.created_at AT TIME ZONE 'UTC')::date, -COUNT(*)
+    FROM wizard_run_option_set_responses r
+    CROSS JOIN LATERAL unnest(r.selected_options) AS sel(option_id)
+    JOIN options o ON o.id = sel.option_id
+    WHERE r.run_id = ANY(:run_ids)
+    GROUP BY o.id, o.option_set_id, (r.created_at AT TIME ZONE 'UTC')::date
+    ON CONFLICT (option_id, day) DO UPDATE
+    SET selection_count = option_selection_counts.selection_count + EXCLUDED.selection_count
+""").bindparams(bindparam("run_ids", type_=ARRAY(PG_UUID(as_uuid=True))))
+
+POPULARITY_SQL = text("""
+    SELECT o.id, o.label, o.value, o.is_recommended, COALESCE(SUM(c.selection_count), 0) AS selections
+    FROM options o
+    LEFT JOIN option_selection_counts c
+        ON c.option_id = o.id AND c.day >= :since
+    WHERE o.option_set_id = :option_set_id
+    GROUP BY o.id, o.label, o.value, o.is_recommended, o.display_order
+    ORDER BY selections DESC, o.display_order
+""").bindparams(
+    bindparam("option_set_id", type_=PG_UUID(as_uuid=True)),
+    bindparam("since", type_=Date),
+)
+
+_PENDING_KEY = "option_selection_deltas"
+
+
+def _response_day(response: WizardRunOptionSetResponse) -> date:
+    created_at = response.created_at or datetime.now(timezone.utc)
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.astimezone(timezone.utc).date()
+
+
+def _collect_deltas(session: Session, flush_context, instances) -> None:
+    """Diff selected_options of pending response changes into per-option/day deltas."""
+    deltas: Dict[Tuple[UUID, date], int] = session.info.setdefault(_PENDING_KEY, defaultdict(int))
+
+    for obj in session.new:
+        if isinstance(obj, WizardRunOptionSetResponse):
+            day = _response_day(obj)
+            for option_id in set(obj.selected_options or []):
+                deltas[(option_id, day)] += 1
+
+    for obj in session.dirty:
+        if not isinstance(obj, WizardRunOptionSetResponse):
+            continue
+        history = get_history(obj, "selected_options")
+        if not history.has_changes():
+            continue
+        old = set(history.deleted[0] or []) if history.deleted else set()
+        new = set(history.added[0] or []) if history.added else set()
+        day = _response_day(obj)
+        for option_id in new - old:
+            deltas[(option_id, day)] += 1
+        for option_id in old - new:
+            deltas[(option_id, day)] -= 1
+
+    for obj in session.deleted:
+        if isinstance(obj, WizardRunOptionSetResponse):
+            day = _response_day(obj)
+            for option_id in set(obj.selected_options or []):
+                deltas[(option_id, day)] -= 1
+
+
+def _apply_deltas(session: Session, flush_context) -> None:
+    """Upsert collected deltas on the flush connection, inside the same transaction."""
+    deltas = session.info.pop(_PENDING_KEY, None)
+    if deltas:
+        apply_selection_deltas(session.connection(), deltas)
+
+
+def apply_selection_deltas(connection, deltas: Dict[Tuple[UUID, date], int]) -> None:
+    """Upsert per-option/day selection count deltas."""
+    params = [
+        {"option_id": option_id, "day": day, "delta": delta}
+        for (option_id, day), delta in deltas.items()
+        if delta
+    ]
+    if params:
+        connection.execute(UPSERT_SELECTION_COUNT_SQL, params)
+
+
+def _discard_deltas(session: Session, *args) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+event.listen(SessionLocal, "before_flush", _collect_deltas)
+event.listen(SessionLocal, "after_flush", _apply_deltas)
+event.listen(SessionLocal, "after_rollback", _discard_deltas)
+
+
+def release_run_selections(db: Session, run_ids: List[UUID]) -> None:
+    """
+    Subtract the selections of specific runs.
+    Call before bulk-deleting those runs, which bypasses the ORM flush hooks.
+    """
+    db.execute(RELEASE_RUN_SELECTIONS_SQL, {"run_ids": list(run_ids)})
+
+
+def get_option_set_popularity(db: Session, option_set_id: UUID, days: Optional[int] = None) -> List[Dict]:
+    """
+    Get selection counts and shares for every option of an option set.
+
+    Args:
+        db: Database session
+        option_set_id: UUID of the option set
+        days: Only count responses from the last N days (all time if None)
+
+    Returns:
+        List of options ordered by selection count, with share in [0, 1]
+    """
+    since = date.today() - timedelta(days=days) if days else date.min
+    rows = db.execute(POPULARITY_SQL, {"option_set_id": option_set_id, "since": since}).all()
+    total = sum(max(row.selections, 0) for row in rows)
+
+    return [
+        {
+            "option_id": str(row.id),
+            "label": row.label,
+            "value": row.value,
+            "is_recommended": row.is_recommended,
+            "selection_count": int(row.selections),
+            "share": round(int(row.selections) / total, 4) if total else 0.0,
+        }
+        for row in rows
+    ]
+
+
+def apply_recommendations(db: Session, option_set_id: UUID, top_n: int = 1, days: Optional[int] = None) -> List[str]:
+    """
+    Flag the top N most selected options of an option set as recommended.
+
+    Returns:
+        IDs of the options now marked as recommended
+    """
+    popularity = get_option_set_popularity(db, option_set_id, days=days)
+    recommended = [UUID(p["option_id"]) for p in popularity[:top_n] if p["selection_count"] > 0]
+
+    db.query(Option).filter(Option.option_set_id == option_set_id).update(
+        {Option.is_recommended: Option.id.in_(recommended) if recommended else False},
+        synchronize_session=False
+    )
+    db.commit()
+    return [str(option_id) for option_id in recommended]
@@ -0,0 +1,314 @@
+"""
+Pricing Engine
+
+Computes WizardRun.calculated_price from per-option price rules in option metadata:
+1. A wizard's priced options are compiled once per wizard version into lookup
+   tables (dict for single runs, NumPy arrays for batches)
+2. A before_flush hook folds each saved or deleted option set response into the
+   run's stored price breakdown, so a new price never needs the run's other responses
+3. After pricing changes, all runs of a wizard are recomputed in one vectorized pass
+
+Option metadata keys:
+    "price"             amount added when the option is selected
+    "price_multiplier"  factor (> 0) applied to the total when the option is selected
+
+price = sum(amounts of selected options) * product(multipliers of selected options).
+A wizard without priced options leaves calculated_price empty.
+"""
+import math
+import threading
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import event, func, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from app.database import SessionLocal
+from app.models.wizard import Step, OptionSet, Option
+from app.models.wizard_run import WizardRun, WizardRunOptionSetResponse
+
+PRICING_CACHE_MAX_WIZARDS = 512
+RECOMPUTE_WRITE_BATCH_SIZE = 1000
+CENT = Decimal("0.01")
+
+Contribution = Tuple[float, float]  # (amount, multiplier) of one option set
+
+
+def _number(value) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _price_rule(metadata) -> Optional[Contribution]:
+    if not isinstance(metadata, dict):
+        return None
+    amount = _number(metadata.get("price")) or 0.0
+    multiplier = _number(metadata.get("price_multiplier"))
+    if multiplier is None or multiplier <= 0:
+        multiplier = 1.0
+    if amount == 0.0 and multiplier == 1.0:
+        return None
+    return amount, multiplier
+
+
+def _to_price(amount: float, multiplier: float) -> Decimal:
+    return Decimal(repr(amount * multiplier)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+@dataclass
+class PriceRules:
+    """Compiled price rules of one wizard version."""
+    version: str
+    rules: Dict[UUID, Contribution]
+    option_set_of: Dict[UUID, UUID]
+    position: Dict[UUID, int]  # option -> index into the arrays below
+    amounts: np.ndarray
+    multipliers: np.ndarray
+
+    @property
+    def is_priced(self) -> bool:
+        return bool(self.rules)
+
+    def contribution(self, selected_option_ids: Optional[Iterable[UUID]]) -> Optional[Contribution]:
+        """Combined (amount, multiplier) of a set of selected options; None if none is priced."""
+        amount, multiplier, priced = 0.0, 1.0, False
+        for option_id in set(selected_option_ids or []):
+            rule = self.rules.get(option_id)
+            if rule is not None:
+                amount += rule[0]
+                multiplier *= rule[1]
+                priced = True
+        return (amount, multiplier) if priced else None
+
+    def total(self, contributions: Iterable[Contribution]) -> Optional[Decimal]:
+        if not self.is_priced:
+            return None
+        amount, multiplier = 0.0, 1.0
+        for part_amount, part_multiplier in contributions:
+            amount += part_amount
+            multiplier *= part_multiplier
+        return _to_price(amount, multiplier)
+
+
+class PricingEngine:
+    """Compiles and caches price rules per wizard; maintains run prices."""
+
+    def __init__(self, max_wizards: int):
+        self.max_wizards = max_wizards
+        self._lock = threading.Lock()
+        self._rules: "OrderedDict[UUID, PriceRules]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _version(self, db: Session, wizard_id: UUID) -> str:
+        """Token that changes whenever an option of the wizard is added, edited or removed."""
+        count, last_updated = db.query(func.count(Option.id), func.max(Option.updated_at))\
+            .join(OptionSet, OptionSet.id == Option.option_set_id)\
+            .join(Step, Step.id == OptionSet.step_id)\
+            .filter(Step.wizard_id == wizard_id).one()
+        return f"{count}:{last_updated.isoformat() if last_updated else ''}"
+
+    def _compile(self, db: Session, wizard_id: UUID, version: str) -> PriceRules:
+        options = db.query(Option.id, Option.option_set_id, Option.option_metadata)\
+            .join(OptionSet, OptionSet.id == Option.option_set_id)\
+            .join(Step, Step.id == OptionSet.step_id)\
+            .filter(Step.wizard_id == wizard_id, Option.is_active == True)\
+            .all()
+
+        rules, option_set_of = {}, {}
+        for option in options:
+            rule = _price_rule(option.option_metadata)
+            if rule is not None:
+                rules[option.id] = rule
+                option_set_of[option.id] = option.option_set_id
+
+        option_ids = list(rules)
+        return PriceRules(
+            version=version,
+            rules=rules,
+            option_set_of=option_set_of,
+            position={option_id: i for i, option_id in enumerate(option_ids)},
+            amounts=np.array([rules[o][0] for o in option_ids], dtype=np.float64),
+            multipliers=np.array([rules[o][1] for o in option_ids], dtype=np.float64),
+        )
+
+    def get_rules(self, db: Session, wizard_id: UUID) -> PriceRules:
+        """Compiled rules for the wizard's current version (compiled on first use or after edits)."""
+        version = self._version(db, wizard_id)
+        with self._lock:
+            rules = self._rules.get(wizard_id)
+            if rules is not None and rules.version == version:
+                self._rules.move_to_end(wizard_id)
+                self.hits += 1
+                return rules
+
+        self.misses += 1
+        rules = self._compile(db, wizard_id, version)
+        with self._lock:
+            self._rules[wizard_id] = rules
+            self._rules.move_to_end(wizard_id)
+            while len(self._rules) > self.max_wizards:
+                self._rules.popitem(last=False)
+        return rules
+
+    def quote(self, db: Session, wizard_id: UUID, selected_option_ids: Iterable[UUID]) -> Dict:
+        """Price of a set of selected options, without a run."""
+        rules = self.get_rules(db, wizard_id)
+        selected_by_set: Dict[UUID, List[UUID]] = defaultdict(list)
+        for option_id in set(selected_option_ids):
+            if option_id in rules.option_set_of:
+                selected_by_set[rules.option_set_of[option_id]].append(option_id)
+
+        option_sets = {
+            option_set_id: rules.contribution(option_ids)
+            for option_set_id, option_ids in selected_by_set.items()
+        }
+        return {
+            "calculated_price": rules.total(option_sets.values()),
+            "option_sets": {
+                option_set_id: {"amount": amount, "multiplier": multiplier}
+                for option_set_id, (amount, multiplier) in option_sets.items()
+            },
+        }
+
+    def _stored_contributions(self, db: Session, run_id: UUID, rules: PriceRules) -> Dict[str, List[float]]:
+        contributions = {}
+        responses = db.query(WizardRunOptionSetResponse.option_set_id, WizardRunOptionSetResponse.selected_options)\
+            .filter(WizardRunOptionSetResponse.run_id == run_id).all()
+        for option_set_id, selected_options in responses:
+            contribution = rules.contribution(selected_options)
+            if contribution is not None:
+                contributions[str(option_set_id)] = list(contribution)
+        return contributions
+
+    def apply_response_changes(self, db: Session, run: WizardRun, changes: Dict[UUID, Optional[List[UUID]]]) -> None:
+        """
+        Fold changed option set responses into the run's price breakdown.
+
+        Args:
+            db: Database session
+            run: The run whose responses changed
+            changes: option_set_id -> new selected_options (None when the response was deleted)
+        """
+        rules = self.get_rules(db, run.wizard_id)
+        breakdown = run.price_breakdown or {}
+        if breakdown.get("version") == rules.version:
+            contributions = dict(breakdown.get("option_sets", {}))
+        else:
+            # Missing or priced with older rules: start over from the stored responses;
+            # the pending changes are not flushed yet and are applied on top
+            contributions = self._stored_contributions(db, run.id, rules)
+
+        for option_set_id, selected_options in changes.items():
+            contribution = rules.contribution(selected_options) if selected_options is not None else None
+            if contribution is None:
+                contributions.pop(str(option_set_id), None)
+            else:
+                contributions[str(option_set_id)] = list(contribution)
+
+        run.price_breakdown = {"version": rules.version, "option_sets": contributions}
+        run.calculated_price = rules.total(contributions.values())
+
+    def recompute_wizard(self, db: Session, wizard_id: UUID) -> int:
+        """
+        Recompute the price of every run of a wizard in one vectorized pass.
+
+        Returns:
+            Number of runs updated
+        """
+        rules = self.get_rules(db, wizard_id)
+        run_ids = [run_id for (run_id,) in db.query(WizardRun.id).filter(WizardRun.wizard_id == wizard_id)]
+        if not run_ids:
+            return 0
+        run_index = {run_id: i for i, run_id in enumerate(run_ids)}
+
+        # One (group, option) pair per priced selection; a group is one response (run, option set)
+        groups: Dict[Tuple[int, UUID], int] = {}
+        pair_group: List[int] = []
+        pair_option: List[int] = []
+        responses = db.query(
+            WizardRunOptionSetResponse.run_id,
+            WizardRunOptionSetResponse.option_set_id,
+            WizardRunOptionSetResponse.selected_options,
+        ).join(WizardRun, WizardRun.id == WizardRunOptionSetResponse.run_id)\
+            .filter(WizardRun.wizard_id == wizard_id)\
+            .yield_per(RECOMPUTE_WRITE_BATCH_SIZE)
+        for run_id, option_set_id, selected_options in responses:
+            for option_id in set(selected_options or []):
+                position = rules.position.get(option_id)
+                if position is None:
+                    continue
+                group = groups.setdefault((run_index[run_id], option_set_id), len(groups))
+                pair_group.append(group)
+                pair_option.append(position)
+
+        pair_group_array = np.array(pair_group, dtype=np.int64)
+        pair_option_array = np.array(pair_option, dtype=np.int64)
+        group_run = np.array([run_position for run_position, _ in groups], dtype=np.int64)
+
+        group_amounts = np.bincount(pair_group_array, weights=rules.amounts[pair_option_array], minlength=len(groups))
+        group_multipliers = np.ones(len(groups), dtype=np.float64)
+        np.multiply.at(group_multipliers, pair_group_array, rules.multipliers[pair_option_array])
+        run_amounts = np.bincount(group_run, weights=group_amounts, minlength=len(run_ids))
+        run_multipliers = np.ones(len(run_ids), dtype=np.float64)
+        np.multiply.at(run_multipliers, group_run, group_multipliers)
+
+        contributions: Dict[int, Dict[str, List[float]]] = defaultdict(dict)
+        for (run_position, option_set_id), group in groups.items():
+            contributions[run_position][str(option_set_id)] = [float(group_amounts[group]), float(group_multipliers[group])]
+
+        rows = [
+            {
+                "id": run_id,
+                "calculated_price": _to_price(float(run_amounts[i]), float(run_multipliers[i])) if rules.is_priced else None,
+                "price_breakdown": {"version": rules.version, "option_sets": contributions.get(i, {})},
+            }
+            for i, run_id in enumerate(run_ids)
+        ]
+        for start in range(0, len(rows), RECOMPUTE_WRITE_BATCH_SIZE):
+            db.execute(update(WizardRun), rows[start:start + RECOMPUTE_WRITE_BATCH_SIZE])
+        db.commit()
+        return len(rows)
+
+
+pricing_engine = PricingEngine(max_wizards=PRICING_CACHE_MAX_WIZARDS)
+
+
+def _collect_price_changes(session: Session, flush_context, instances) -> None:
+    """Reprice runs whose option set responses are created, changed or deleted in this flush."""
+    changes: Dict[UUID, Dict[UUID, Optional[List[UUID]]]] = defaultdict(dict)
+
+    for obj in session.new:
+        if isinstance(obj, WizardRunOptionSetResponse) and obj.run_id and obj.option_set_id:
+            changes[obj.run_id][obj.option_set_id] = list(obj.selected_options or [])
+
+    for obj in session.dirty:
+        if isinstance(obj, WizardRunOptionSetResponse) and get_history(obj, "selected_options").has_changes():
+            changes[obj.run_id][obj.option_set_id] = list(obj.selected_options or [])
+
+    for obj in session.deleted:
+        if isinstance(obj, WizardRunOptionSetResponse):
+            changes[obj.run_id].setdefault(obj.option_set_id, None)
+
+    if not changes:
+        return
+
+    with session.no_autoflush:
+        for run_id, run_changes in changes.items():
+            run = session.get(WizardRun, run_id)
+            if run is None or run in session.deleted:
+                continue
+            pricing_engine.apply_response_changes(session, run, run_changes)
+
+
+event.listen(SessionLocal, "before_flush", _collect_price_changes)
@@ -0,0 +1,334 @@
+"""
+Run Archive
+
+Moves old completed and abandoned runs out of the hot run tables into
+wizard_run_archives, one JSONB document per run (compressed by TOAST, lz4):
+1. A background pass picks runs not accessed for RUN_ARCHIVE_AFTER_DAYS with
+   FOR UPDATE SKIP LOCKED, so several workers never archive the same run
+2. Each batch serializes its runs with their responses, uploads and shares, inserts
+   the documents and deletes the runs in one transaction
+3. Reads (get_wizard_run, share links) fall through to the archive; writes move
+   the run back into the hot tables first (restore)
+
+Stored and favorite runs are never archived, so the lists users keep stay complete.
+Archived runs still count in the wizard's run counters and option popularity:
+archiving and restoring are bulk statements that bypass the flush hooks on purpose.
+"""
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy import ARRAY, DateTime, Numeric, Uuid, delete, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.user import User
+from app.models.wizard import Step, OptionSet
+from app.models.wizard_run import (
+    WizardRun,
+    WizardRunStepResponse,
+    WizardRunOptionSetResponse,
+    WizardRunFileUpload,
+    WizardRunShare,
+    WizardRunArchive,
+)
+
+ARCHIVABLE_STATUSES = ("completed", "abandoned")
+
+# Document sections, in foreign key (insert) order
+CHILD_SECTIONS = (
+    ("step_responses", WizardRunStepResponse),
+    ("option_set_responses", WizardRunOptionSetResponse),
+    ("file_uploads", WizardRunFileUpload),
+    ("shares", WizardRunShare),
+)
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, (UUID, Decimal)):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(column_type, value: Any) -> Any:
+    if value is None:
+        return None
+    if isinstance(column_type, ARRAY):
+        return [_decode(column_type.item_type, item) for item in value]
+    if isinstance(column_type, Uuid):
+        return UUID(value)
+    if isinstance(column_type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column_type, Numeric):
+        return Decimal(value)
+    return value  # JSONB, text, integers and booleans are stored as is
+
+
+def _encode_row(table, row) -> Dict[str, Any]:
+    """Table row -> JSON object keyed by column name."""
+    return {column.name: _encode(row._mapping[column.name]) for column in table.columns}
+
+
+def _decode_row(table, data: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON object -> column values, typed by the table's current columns."""
+    return {column.name: _decode(column.type, data[column.name]) for column in table.columns if column.name in data}
+
+
+def _entity(model, data: Dict[str, Any]):
+    """Transient (never added to a session) model instance for read-only responses."""
+    mapper = inspect(model)
+    values = _decode_row(model.__table__, data)
+    return model(**{mapper.get_property_by_column(model.__table__.c[name]).key: value for name, value in values.items()})
+
+
+def _live_ids(db: Session, column, ids: Set[UUID]) -> Set[UUID]:
+    if not ids:
+        return set()
+    return {value for (value,) in db.query(column).filter(column.in_(ids))}
+
+
+def _response_day(created_at: Optional[str]) -> date:
+    moment = datetime.fromisoformat(created_at) if created_at else datetime.now(timezone.utc)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).date()
+
+
+def archived_selections(document: Dict) -> Dict[Tuple[UUID, date], int]:
+    """Per-option/day selection counts held by an archived run (to release when it is deleted)."""
+    selections: Dict[Tuple[UUID, date], int] = defaultdict(int)
+    for response in document.get("option_set_responses", []):
+        day = _response_day(response.get("created_at"))
+        for option_id in set(response.get("selected_options") or []):
+            selections[(UUID(option_id), day)] += 1
+    return selections
+
+
+@dataclass
+class ArchivedRun:
+    """An archived run rebuilt as transient model instances."""
+    run: WizardRun
+    step_responses: List[WizardRunStepResponse] = field(default_factory=list)
+    option_set_responses: List[WizardRunOptionSetResponse] = field(default_factory=list)
+    file_uploads: List[WizardRunFileUpload] = field(default_factory=list)
+
+    @classmethod
+    def from_document(cls, document: Dict) -> "ArchivedRun":
+        archived = cls(run=_entity(WizardRun, document["run"]))
+        archived.step_responses = sorted(
+            (_entity(WizardRunStepResponse, data) for data in document.get("step_responses", [])),
+            key=lambda response: response.step_index,
+        )
+        archived.option_set_responses = [
+            _entity(WizardRunOptionSetResponse, data) for data in document.get("option_set_responses", [])
+        ]
+        archived.file_uploads = sorted(
+            (_entity(WizardRunFileUpload, data) for data in document.get("file_uploads", [])),
+            key=lambda upload: upload.uploaded_at or datetime.min.replace(tzinfo=timezone.utc),
+            reverse=True,
+        )
+        return archived
+
+
+class RunArchiveService:
+    """Archives old runs in the background and serves and restores archived runs."""
+
+    def __init__(self, archive_after_days: int, batch_size: int, interval: float):
+        self.archive_after_days = archive_after_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Archiving
+    # ------------------------------------------------------------------
+
+    def archive_batch(self, db: Session, cutoff: datetime) -> int:
+        """
+        Archive up to batch_size runs last accessed before cutoff, in one transaction.
+
+        Returns:
+            Number of runs archived
+        """
+        runs_table = WizardRun.__table__
+        runs = db.execute(
+            select(runs_table)
+            .where(
+                WizardRun.status.in_(ARCHIVABLE_STATUSES),
+                WizardRun.last_accessed_at < cutoff,
+                WizardRun.is_stored.isnot(True),
+                WizardRun.is_favorite.isnot(True),
+            )
+            .order_by(WizardRun.last_accessed_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not runs:
+            db.rollback()
+            return 0
+
+        run_ids = [run.id for run in runs]
+        documents = {
+            run.id: {"run": _encode_row(runs_table, run), **{section: [] for section, _ in CHILD_SECTIONS}}
+            for run in runs
+        }
+        for section, model in CHILD_SECTIONS:
+            table = model.__table__
+            for row in db.execute(select(table).where(table.c.run_id.in_(run_ids))):
+                documents[row.run_id][section].append(_encode_row(table, row))
+
+        now = datetime.now(timezone.utc)
+        db.execute(insert(WizardRunArchive), [
+            {
+                "id": run.id,
+                "wizard_id": run.wizard_id,
+                "user_id": run.user_id,
+                "status": run.status,
+                "started_at": run.started_at,
+                "completed_at": run.completed_at,
+                "last_accessed_at": run.last_accessed_at,
+                "archived_at": now,
+                "share_tokens": [share["share_token"] for share in documents[run.id]["shares"]] or None,
+                "document": documents[run.id],
+            }
+            for run in runs
+        ])
+        # Responses, uploads and shares go with their run (ON DELETE CASCADE); files stay on disk
+        db.execute(delete(WizardRun).where(WizardRun.id.in_(run_ids)))
+        db.commit()
+        return len(run_ids)
+
+    def archive_due(self) -> int:
+        """Archive every run older than the configured age, batch by batch."""
+        if self.archive_after_days <= 0:
+            return 0
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.archive_after_days)
+        db = SessionLocal()
+        archived = 0
+        try:
+            while not self._stop_event.is_set():
+                count = self.archive_batch(db, cutoff)
+                archived += count
+                if count < self.batch_size:
+                    break
+        except Exception as e:
+            db.rollback()
+            print(f"[WARN] Run archiving failed: {e}")
+        finally:
+            db.close()
+        return archived
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def get_archived_run(self, db: Session, run_id: UUID) -> Optional[ArchivedRun]:
+        """An archived run with its responses, or None if the run is not archived."""
+        document = db.query(WizardRunArchive.document).filter(WizardRunArchive.id == run_id).scalar()
+        return ArchivedRun.from_document(document) if document else None
+
+    def get_archived_run_by_share_token(self, db: Session, share_token: str) -> Optional[ArchivedRun]:
+        """An archived run shared under an active share token."""
+        document = db.query(WizardRunArchive.document)\
+            .filter(WizardRunArchive.share_tokens.contains([share_token]))\
+            .limit(1)\
+            .scalar()
+        if not document:
+            return None
+        share = next((s for s in document.get("shares", []) if s.get("share_token") == share_token), None)
+        if share is None or not share.get("is_active"):
+            return None
+        return ArchivedRun.from_document(document)
+
+    # ------------------------------------------------------------------
+    # Restore
+    # ------------------------------------------------------------------
+
+    def _restorable_rows(self, db: Session, document: Dict) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Decode a document into insertable rows, dropping rows whose parents were deleted
+        while the run was archived, as ON DELETE CASCADE / SET NULL would have.
+        """
+        rows = {section: [_decode_row(model.__table__, data) for data in document.get(section, [])]
+                for section, model in CHILD_SECTIONS}
+        run = _decode_row(WizardRun.__table__, document["run"])
+
+        users = _live_ids(db, User.id, {run["user_id"]} - {None} | {share["shared_by"] for share in rows["shares"]})
+        if run.get("user_id") not in users:
+            run["user_id"] = None
+        steps = _live_ids(db, Step.id, {response["step_id"] for response in rows["step_responses"]})
+        option_sets = _live_ids(db, OptionSet.id, {response["option_set_id"] for response in rows["option_set_responses"]})
+
+        rows["step_responses"] = [r for r in rows["step_responses"] if r["step_id"] in steps]
+        step_response_ids = {r["id"] for r in rows["step_responses"]}
+        rows["option_set_responses"] = [
+            r for r in rows["option_set_responses"]
+            if r["option_set_id"] in option_sets and r["step_response_id"] in step_response_ids
+        ]
+        option_set_response_ids = {r["id"] for r in rows["option_set_responses"]}
+        rows["file_uploads"] = [r for r in rows["file_uploads"] if r["option_set_response_id"] in option_set_response_ids]
+        rows["shares"] = [r for r in rows["shares"] if r["shared_by"] in users]
+        return {"run": [run], **rows}
+
+    def restore(self, db: Session, run_id: UUID) -> bool:
+        """
+        Move an archived run back into the hot tables (commits).
+
+        Returns:
+            True if the run was archived and is now restored, False if it was not archived
+        """
+        document = db.execute(
+            delete(WizardRunArchive)
+            .where(WizardRunArchive.id == run_id)
+            .returning(WizardRunArchive.document)
+        ).scalar()
+        if document is None:
+            return False
+
+        rows = self._restorable_rows(db, document)
+        db.execute(insert(WizardRun.__table__), rows["run"])
+        for section, model in CHILD_SECTIONS:
+            if rows[section]:
+                db.execute(insert(model.__table__), rows[section])
+        db.commit()
+        return True
+
+    # ------------------------------------------------------------------
+    # Background worker
+    # ------------------------------------------------------------------
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.archive_due()
+
+    def start(self) -> None:
+        """Start the periodic archive thread (no-op when archiving is disabled)."""
+        if self.archive_after_days <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="run-archive", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop after the current batch."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+            self._thread = None
+
+
+run_archive_service = RunArchiveService(
+    archive_after_days=settings.RUN_ARCHIVE_AFTER_DAYS,
+    batch_size=settings.RUN_ARCHIVE_BATCH_SIZE,
+    interval=settings.RUN_ARCHIVE_INTERVAL,
+)
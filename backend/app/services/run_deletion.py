@@ -0,0 +1,287 @@
+"""
+Run Deletion Jobs
+
+Deletes all runs of a wizard in the background instead of one long transaction:
+1. A background_jobs row records the request and its progress, so the status can
+   be read from any worker
+2. A worker thread deletes runs in primary key order (keyset over id), one short
+   transaction per batch, pausing between batches
+3. Archived runs of the wizard (wizard_run_archives) are deleted the same way
+   once no hot run is left
+4. Upload files of a batch are removed from disk once the batch has committed
+
+Bulk deletes bypass the flush hooks, so every batch releases its option selection
+counts and applies its lifecycle counter deltas itself. Deleting is idempotent:
+a job interrupted by stop() is put back to pending and resumed on the next start,
+and the worker periodically re-queues jobs left "running" by a crashed process or a
+failed status write once they are stale.
+"""
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from uuid import UUID
+
+from sqlalchemy import delete, or_, and_
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.analytics import BackgroundJob
+from app.models.wizard import Wizard
+from app.models.wizard_run import WizardRun, WizardRunFileUpload, WizardRunArchive
+from app.services.option_popularity import release_run_selections, apply_selection_deltas
+from app.services.run_archive import archived_selections
+from app.services.wizard_lifecycle import apply_lifecycle_deltas
+
+JOB_TYPE_DELETE_WIZARD_RUNS = "delete_wizard_runs"
+MIN_RUN_ID = UUID(int=0)
+RESUME_SCAN_INTERVAL = 60  # seconds between scans for pending or stale jobs while idle
+
+
+def _remove_files(paths: List[str]) -> None:
+    """Delete upload files and their (then empty) per-run directories; missing files are ignored."""
+    directories = set()
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[WARN] Could not remove upload {path}: {e}")
+        directories.add(os.path.dirname(path))
+    for directory in directories:
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass  # Not empty or already gone
+
+
+class RunDeletionService:
+    """Queues run deletion jobs and executes them on a background thread."""
+
+    def __init__(self, batch_size: int, batch_pause: float, stale_after: int):
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.stale_after = stale_after
+        self._queue: "queue.Queue[UUID]" = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule_wizard_runs(self, db: Session, wizard_id: UUID, requested_by: Optional[UUID] = None) -> BackgroundJob:
+        """Create a job deleting every run of a wizard and queue it."""
+        total = db.query(Wizard.run_count).filter(Wizard.id == wizard_id).scalar() or 0
+        job = BackgroundJob(
+            job_type=JOB_TYPE_DELETE_WIZARD_RUNS,
+            params={"wizard_id": str(wizard_id)},
+            total=total,
+            created_by=requested_by,
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        self._queue.put(job.id)
+        return job
+
+    def get_job(self, db: Session, job_id: UUID) -> Optional[BackgroundJob]:
+        return db.query(BackgroundJob).filter(BackgroundJob.id == job_id).first()
+
+    def _claim(self, db: Session, job_id: UUID) -> Optional[BackgroundJob]:
+        """Atomically take a pending (or abandoned running) job."""
+        now = datetime.now(timezone.utc)
+        claimed = db.query(BackgroundJob).filter(
+            BackgroundJob.id == job_id,
+            or_(
+                BackgroundJob.status == "pending",
+                and_(BackgroundJob.status == "running", BackgroundJob.updated_at < now - timedelta(seconds=self.stale_after)),
+            ),
+        ).update({"status": "running", "started_at": now, "updated_at": now}, synchronize_session=False)
+        db.commit()
+        return self.get_job(db, job_id) if claimed else None
+
+    def _delete_batch(self, db: Session, job: BackgroundJob, wizard_id: UUID, after: UUID) -> Optional[UUID]:
+        """Delete the next batch of runs after a key. Returns the last deleted key, or None when done."""
+        run_ids = [
+            run_id for (run_id,) in
+            db.query(WizardRun.id)
+            .filter(WizardRun.wizard_id == wizard_id, WizardRun.id > after)
+            .order_by(WizardRun.id)
+            .limit(self.batch_size)
+        ]
+        if not run_ids:
+            return None
+
+        file_paths = [
+            path for (path,) in
+            db.query(WizardRunFileUpload.file_path).filter(WizardRunFileUpload.run_id.in_(run_ids))
+        ]
+        release_run_selections(db, run_ids)
+
+        # Responses, uploads and shares go with their run (ON DELETE CASCADE)
+        deleted = db.execute(
+            delete(WizardRun).where(WizardRun.id.in_(run_ids)).returning(WizardRun.status, WizardRun.is_stored)
+        ).all()
+        apply_lifecycle_deltas(db.connection(), {wizard_id: {
+            "runs": -len(deleted),
+            "stored": -sum(1 for run in deleted if run.is_stored),
+            "in_progress": -sum(1 for run in deleted if run.status == "in_progress"),
+            "completed": -sum(1 for run in deleted if run.status == "completed"),
+        }})
+
+        db.query(BackgroundJob).filter(BackgroundJob.id == job.id).update({
+            "processed": BackgroundJob.processed + len(deleted),
+            "updated_at": datetime.now(timezone.utc),
+        }, synchronize_session=False)
+        db.commit()
+
+        _remove_files(file_paths)
+        return run_ids[-1]
+
+    def _delete_archived_batch(self, db: Session, job: BackgroundJob, wizard_id: UUID, after: UUID) -> Optional[UUID]:
+        """Delete the next batch of archived runs after a key. Returns the last deleted key, or None when done."""
+        archive_ids = [
+            run_id for (run_id,) in
+            db.query(WizardRunArchive.id)
+            .filter(WizardRunArchive.wizard_id == wizard_id, WizardRunArchive.id > after)
+            .order_by(WizardRunArchive.id)
+            .limit(self.batch_size)
+        ]
+        if not archive_ids:
+            return None
+
+        deleted = db.execute(
+            delete(WizardRunArchive)
+            .where(WizardRunArchive.id.in_(archive_ids))
+            .returning(WizardRunArchive.status, WizardRunArchive.document)
+        ).all()
+
+        # Archived runs still hold their selection counts and count as runs of the wizard
+        selections = defaultdict(int)
+        file_paths = []
+        for archived in deleted:
+            for key, count in archived_selections(archived.document).items():
+                selections[key] -= count
+            file_paths.extend(upload["file_path"] for upload in archived.document.get("file_uploads", []))
+        apply_selection_deltas(db.connection(), selections)
+        apply_lifecycle_deltas(db.connection(), {wizard_id: {
+            "runs": -len(deleted),
+            "stored": 0,
+            "in_progress": -sum(1 for run in deleted if run.status == "in_progress"),
+            "completed": -sum(1 for run in deleted if run.status == "completed"),
+        }})
+
+        db.query(BackgroundJob).filter(BackgroundJob.id == job.id).update({
+            "processed": BackgroundJob.processed + len(deleted),
+            "updated_at": datetime.now(timezone.utc),
+        }, synchronize_session=False)
+        db.commit()
+
+        _remove_files(file_paths)
+        return archive_ids[-1]
+
+    def run_job(self, job_id: UUID) -> None:
+        """Execute a job to completion (or until the service stops)."""
+        db = SessionLocal()
+        try:
+            job = self._claim(db, job_id)
+            if job is None:
+                return
+            wizard_id = UUID(job.params["wizard_id"])
+
+            for delete_batch in (self._delete_batch, self._delete_archived_batch):
+                after = MIN_RUN_ID
+                while not self._stop_event.is_set():
+                    after = delete_batch(db, job, wizard_id, after)
+                    if after is None:
+                        break
+                    # Yield to foreground traffic between batches
+                    self._stop_event.wait(self.batch_pause)
+                if self._stop_event.is_set():
+                    # Stopped mid-job: hand it back so the next start resumes it right away
+                    db.query(BackgroundJob).filter(BackgroundJob.id == job.id).update({
+                        "status": "pending",
+                        "updated_at": datetime.now(timezone.utc),
+                    }, synchronize_session=False)
+                    db.commit()
+                    return
+
+            db.query(BackgroundJob).filter(BackgroundJob.id == job.id).update({
+                "status": "completed",
+                "finished_at": datetime.now(timezone.utc),
+                "updated_at": datetime.now(timezone.utc),
+            }, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"[WARN] Run deletion job {job_id} failed: {e}")
+            try:
+                db.query(BackgroundJob).filter(BackgroundJob.id == job_id).update({
+                    "status": "failed",
+                    "error": str(e)[:2000],
+                    "finished_at": datetime.now(timezone.utc),
+                }, synchronize_session=False)
+                db.commit()
+            except Exception as status_error:
+                # Database unavailable: keep the worker alive; the job stays "running"
+                # until a periodic scan finds it stale and re-queues it
+                db.rollback()
+                print(f"[WARN] Could not mark run deletion job {job_id} failed: {status_error}")
+        finally:
+            db.close()
+
+    def _resume_jobs(self) -> None:
+        """Queue jobs left pending or abandoned by a previous process."""
+        db = SessionLocal()
+        try:
+            stale_before = datetime.now(timezone.utc) - timedelta(seconds=self.stale_after)
+            job_ids = db.query(BackgroundJob.id).filter(
+                BackgroundJob.job_type == JOB_TYPE_DELETE_WIZARD_RUNS,
+                or_(
+                    BackgroundJob.status == "pending",
+                    and_(BackgroundJob.status == "running", BackgroundJob.updated_at < stale_before),
+                ),
+            ).order_by(BackgroundJob.created_at).all()
+            for (job_id,) in job_ids:
+                self._queue.put(job_id)
+        except Exception as e:
+            print(f"[WARN] Could not resume run deletion jobs: {e}")
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        self._resume_jobs()
+        last_scan = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                job_id = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                if time.monotonic() - last_scan >= RESUME_SCAN_INTERVAL:
+                    self._resume_jobs()
+                    last_scan = time.monotonic()
+                continue
+            self.run_job(job_id)
+
+    def start(self) -> None:
+        """Start the background worker thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="run-deletion", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop after the current batch; an interrupted job is set back to pending and resumes on the next start."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+            self._thread = None
+
+
+run_deletion_service = RunDeletionService(
+    batch_size=settings.RUN_DELETION_BATCH_SIZE,
+    batch_pause=settings.RUN_DELETION_BATCH_PAUSE,
+    stale_after=settings.RUN_DELETION_STALE_AFTER,
+)
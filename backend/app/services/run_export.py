@@ -0,0 +1,267 @@
+"""
+Wizard Run Export Service
+
+Streams wizard runs as NDJSON or CSV with constant memory:
+1. Runs are read through a server-side cursor in fixed-size batches
+2. Responses for each batch are loaded with one IN query per table
+3. Each batch is serialized, yielded and dropped before the next is read
+4. Archived runs matching the same filters follow the hot runs, decoded from
+   their archive documents in batches of the same size
+"""
+import csv
+import io
+import json
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.services.run_archive import ArchivedRun
+from app.models.wizard_run import (
+    WizardRun,
+    WizardRunStepResponse,
+    WizardRunOptionSetResponse,
+    WizardRunFileUpload,
+    WizardRunArchive,
+)
+from app.schemas.wizard_run import (
+    WizardRunResponse,
+    WizardRunStepResponseDetail,
+    WizardRunOptionSetResponseDetail,
+    WizardRunFileUploadResponse,
+)
+
+EXPORT_BATCH_SIZE = 500
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+CSV_RUN_COLUMNS = [
+    "run_id", "wizard_id", "user_id", "run_name", "status", "progress_percentage",
+    "started_at", "completed_at", "calculated_price", "is_stored",
+]
+CSV_METADATA_COLUMNS = ["tags", "metadata"]
+CSV_RESPONSE_COLUMNS = [
+    "step_index", "step_name", "option_set_id", "option_set_name",
+    "selection_type", "response_value", "selected_options",
+]
+CSV_FILE_COLUMNS = ["files"]
+
+
+def _iter_run_batches(
+    db: Session,
+    run_id: Optional[UUID],
+    user_id: Optional[UUID],
+    wizard_id: Optional[UUID],
+) -> Iterator[List[WizardRun]]:
+    """Yield batches of runs read through a server-side cursor."""
+    stmt = select(WizardRun)
+    if run_id:
+        stmt = stmt.where(WizardRun.id == run_id)
+    if user_id:
+        stmt = stmt.where(WizardRun.user_id == user_id)
+    if wizard_id:
+        stmt = stmt.where(WizardRun.wizard_id == wizard_id)
+    stmt = stmt.order_by(WizardRun.started_at, WizardRun.id).execution_options(
+        yield_per=EXPORT_BATCH_SIZE
+    )
+
+    for batch in db.execute(stmt).scalars().partitions():
+        yield batch
+
+
+def _iter_archived_batches(
+    db: Session,
+    run_id: Optional[UUID],
+    user_id: Optional[UUID],
+    wizard_id: Optional[UUID],
+) -> Iterator[List[ArchivedRun]]:
+    """Yield batches of archived runs read through a server-side cursor."""
+    stmt = select(WizardRunArchive.document)
+    if run_id:
+        stmt = stmt.where(WizardRunArchive.id == run_id)
+    if user_id:
+        stmt = stmt.where(WizardRunArchive.user_id == user_id)
+    if wizard_id:
+        stmt = stmt.where(WizardRunArchive.wizard_id == wizard_id)
+    stmt = stmt.order_by(WizardRunArchive.started_at, WizardRunArchive.id).execution_options(
+        yield_per=EXPORT_BATCH_SIZE
+    )
+
+    for batch in db.execute(stmt).scalars().partitions():
+        yield [ArchivedRun.from_document(document) for document in batch]
+
+
+def _archived_batch_responses(archived_runs: List[ArchivedRun], include_files: bool) -> Dict[str, Dict]:
+    """Responses of a batch of archived runs, grouped and ordered like _load_batch_responses."""
+    responses = {
+        "step_responses": defaultdict(list),
+        "option_set_responses": defaultdict(list),
+        "file_uploads": defaultdict(list),
+    }
+    for archived in archived_runs:
+        run_id = archived.run.id
+        responses["step_responses"][run_id] = archived.step_responses
+        responses["option_set_responses"][run_id] = sorted(
+            archived.option_set_responses, key=lambda response: response.created_at or _EPOCH
+        )
+        if include_files:
+            responses["file_uploads"][run_id] = sorted(
+                archived.file_uploads, key=lambda upload: upload.uploaded_at or _EPOCH
+            )
+    return responses
+
+
+def _load_batch_responses(db: Session, run_ids: List[UUID], include_files: bool) -> Dict[str, Dict]:
+    """Load step, option set and file responses for a batch of runs, grouped by run."""
+    step_responses = defaultdict(list)
+    for response in db.query(WizardRunStepResponse)\
+            .filter(WizardRunStepResponse.run_id.in_(run_ids))\
+            .order_by(WizardRunStepResponse.step_index):
+        step_responses[response.run_id].append(response)
+
+    option_set_responses = defaultdict(list)
+    for response in db.query(WizardRunOptionSetResponse)\
+            .filter(WizardRunOptionSetResponse.run_id.in_(run_ids))\
+            .order_by(WizardRunOptionSetResponse.created_at):
+        option_set_responses[response.run_id].append(response)
+
+    file_uploads = defaultdict(list)
+    if include_files:
+        for upload in db.query(WizardRunFileUpload)\
+                .filter(WizardRunFileUpload.run_id.in_(run_ids))\
+                .order_by(WizardRunFileUpload.uploaded_at):
+            file_uploads[upload.run_id].append(upload)
+
+    return {
+        "step_responses": step_responses,
+        "option_set_responses": option_set_responses,
+        "file_uploads": file_uploads,
+    }
+
+
+def _serialize_run(run: WizardRun, responses: Dict[str, Dict], include_metadata: bool, include_files: bool) -> Dict:
+    data = WizardRunResponse.model_validate(run).model_dump(mode="json", by_alias=True)
+    if not include_metadata:
+        data.pop("metadata", None)
+        data.pop("tags", None)
+    data["step_responses"] = [
+        WizardRunStepResponseDetail.model_validate(r).model_dump(mode="json")
+        for r in responses["step_responses"][run.id]
+    ]
+    data["option_set_responses"] = [
+        WizardRunOptionSetResponseDetail.model_validate(r).model_dump(mode="json")
+        for r in responses["option_set_responses"][run.id]
+    ]
+    if include_files:
+        data["file_uploads"] = [
+            WizardRunFileUploadResponse.model_validate(f).model_dump(mode="json")
+            for f in responses["file_uploads"][run.id]
+        ]
+    return data
+
+
+def _export_batches(
+    run_id: Optional[UUID],
+    user_id: Optional[UUID],
+    wizard_id: Optional[UUID],
+    include_files: bool,
+) -> Iterator[tuple]:
+    """
+    Yield (runs, responses) batches from a dedicated session: hot runs, then archived runs.
+    The session lives as long as the stream, independent of the request scope.
+    """
+    db = SessionLocal()
+    try:
+        for batch in _iter_run_batches(db, run_id, user_id, wizard_id):
+            responses = _load_batch_responses(db, [run.id for run in batch], include_files)
+            yield batch, responses
+            # Drop the batch from the identity map so memory stays flat
+            db.expunge_all()
+        for archived_batch in _iter_archived_batches(db, run_id, user_id, wizard_id):
+            yield [archived.run for archived in archived_batch], _archived_batch_responses(archived_batch, include_files)
+    finally:
+        db.close()
+
+
+def stream_runs_ndjson(
+    *,
+    run_id: Optional[UUID] = None,
+    user_id: Optional[UUID] = None,
+    wizard_id: Optional[UUID] = None,
+    include_metadata: bool = True,
+    include_files: bool = False,
+) -> Iterator[str]:
+    """Stream runs as JSON Lines, one run document with its responses per line."""
+    for batch, responses in _export_batches(run_id, user_id, wizard_id, include_files):
+        yield "".join(
+            json.dumps(_serialize_run(run, responses, include_metadata, include_files)) + "\n"
+            for run in batch
+        )
+
+
+def stream_runs_csv(
+    *,
+    run_id: Optional[UUID] = None,
+    user_id: Optional[UUID] = None,
+    wizard_id: Optional[UUID] = None,
+    include_metadata: bool = True,
+    include_files: bool = False,
+) -> Iterator[str]:
+    """Stream runs as CSV, one row per option set response (or per run without responses)."""
+    columns = list(CSV_RUN_COLUMNS)
+    if include_metadata:
+        columns += CSV_METADATA_COLUMNS
+    columns += CSV_RESPONSE_COLUMNS
+    if include_files:
+        columns += CSV_FILE_COLUMNS
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    for batch, responses in _export_batches(run_id, user_id, wizard_id, include_files):
+        for run in batch:
+            run_row = [
+                run.id, run.wizard_id, run.user_id or "", run.run_name or "", run.status,
+                run.progress_percentage, run.started_at.isoformat() if run.started_at else "",
+                run.completed_at.isoformat() if run.completed_at else "",
+                run.calculated_price if run.calculated_price is not None else "", run.is_stored,
+            ]
+            if include_metadata:
+                run_row += [";".join(run.tags or []), json.dumps(run.run_metadata) if run.run_metadata else ""]
+
+            steps_by_id = {r.id: r for r in responses["step_responses"][run.id]}
+            files_by_response = defaultdict(list)
+            for upload in responses["file_uploads"][run.id]:
+                files_by_response[upload.option_set_response_id].append(upload.file_path)
+
+            option_set_responses = responses["option_set_responses"][run.id]
+            if not option_set_responses:
+                writer.writerow(run_row + [""] * (len(columns) - len(run_row)))
+                continue
+
+            for response in option_set_responses:
+                step = steps_by_id.get(response.step_response_id)
+                row = run_row + [
+                    step.step_index if step else "",
+                    step.step_name if step else "",
+                    response.option_set_id,
+                    response.option_set_name or "",
+                    response.selection_type or "",
+                    json.dumps(response.response_value),
+                    ";".join(str(o) for o in response.selected_options or []),
+                ]
+                if include_files:
+                    row.append(";".join(files_by_response[response.id]))
+                writer.writerow(row)
+
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+    # Header-only export when nothing matched
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,137 @@
+"""
+Stale Run Sweeper
+
+Marks in-progress runs abandoned once they have not been accessed for their
+wizard's abandon_after_hours (or RUN_ABANDON_AFTER_HOURS when the wizard sets none):
+1. Candidates are read from the partial index on in-progress runs by last access,
+   bounded by the smallest threshold in use
+2. Each batch locks its runs with FOR UPDATE SKIP LOCKED and updates them in one
+   statement, so any number of workers can sweep at the same time without
+   blocking each other or a client saving the run
+3. The batch applies its lifecycle counter deltas and commits before the next one
+
+The bulk UPDATE bypasses the flush hooks, hence the explicit counter deltas.
+"""
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import text, bindparam, func, Integer
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.wizard import Wizard
+from app.services.wizard_lifecycle import apply_lifecycle_deltas
+
+# The bound on r.last_accessed_at (smallest threshold) lets the partial index narrow the scan
+SWEEP_BATCH_SQL = text("""
+    WITH due AS (
+        SELECT r.id
+        FROM wizard_runs r
+        JOIN wizards w ON w.id = r.wizard_id
+        WHERE r.status = 'in_progress'
+          AND r.last_accessed_at < :now - make_interval(hours => :min_hours)
+          AND r.last_accessed_at < :now - make_interval(hours => COALESCE(w.abandon_after_hours, NULLIF(:default_hours, 0)))
+        ORDER BY r.last_accessed_at
+        LIMIT :batch_size
+        FOR UPDATE OF r SKIP LOCKED
+    )
+    UPDATE wizard_runs r
+    SET status = 'abandoned'
+    FROM due
+    WHERE r.id = due.id
+    RETURNING r.wizard_id
+""").bindparams(
+    bindparam("min_hours", type_=Integer),
+    bindparam("default_hours", type_=Integer),
+    bindparam("batch_size", type_=Integer),
+)
+
+
+class StaleRunSweeper:
+    """Periodically abandons inactive in-progress runs in small batches."""
+
+    def __init__(self, default_hours: int, batch_size: int, interval: float):
+        self.default_hours = default_hours
+        self.batch_size = batch_size
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _min_hours(self, db: Session) -> Optional[int]:
+        """Smallest threshold in use, or None if no wizard is subject to sweeping."""
+        thresholds = [db.query(func.min(Wizard.abandon_after_hours)).scalar()]
+        if self.default_hours > 0:
+            thresholds.append(self.default_hours)
+        thresholds = [hours for hours in thresholds if hours]
+        return min(thresholds) if thresholds else None
+
+    def sweep_batch(self, db: Session, now: datetime, min_hours: int) -> int:
+        """
+        Abandon the next batch of stale runs, in one transaction.
+
+        Returns:
+            Number of runs abandoned
+        """
+        wizard_ids = db.execute(SWEEP_BATCH_SQL, {
+            "now": now,
+            "min_hours": min_hours,
+            "default_hours": self.default_hours,
+            "batch_size": self.batch_size,
+        }).scalars().all()
+
+        apply_lifecycle_deltas(db.connection(), {
+            wizard_id: {"runs": 0, "stored": 0, "in_progress": -count, "completed": 0}
+            for wizard_id, count in Counter(wizard_ids).items()
+        })
+        db.commit()
+        return len(wizard_ids)
+
+    def sweep(self) -> int:
+        """Abandon every run that is stale now, batch by batch."""
+        db = SessionLocal()
+        abandoned = 0
+        try:
+            min_hours = self._min_hours(db)
+            if min_hours is None:
+                return 0
+            now = datetime.now(timezone.utc)
+            while not self._stop_event.is_set():
+                count = self.sweep_batch(db, now, min_hours)
+                abandoned += count
+                if count < self.batch_size:
+                    break
+        except Exception as e:
+            db.rollback()
+            print(f"[WARN] Stale run sweep failed: {e}")
+        finally:
+            db.close()
+        return abandoned
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.sweep()
+
+    def start(self) -> None:
+        """Start the periodic sweep thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="stale-run-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop after the current batch."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+            self._thread = None
+
+
+stale_run_sweeper = StaleRunSweeper(
+    default_hours=settings.RUN_ABANDON_AFTER_HOURS,
+    batch_size=settings.RUN_SWEEP_BATCH_SIZE,
+    interval=settings.RUN_SWEEP_INTERVAL,
+)
@@ -0,0 +1,76 @@
+"""
+Template Feed Cache
+
+Caches the public template gallery feeds (popular, top-rated, per category and
+the unfiltered list) as pre-serialized JSON bytes:
+1. Entries are keyed by feed and its parameters (limit, page, category)
+2. Template, rating and usage-count writes invalidate every entry
+3. A short TTL bounds staleness across worker processes
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Tuple
+
+from app.config import settings
+
+
+class TemplateFeedCache:
+    """Process-local LRU of serialized feed responses with generation-based invalidation."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[bytes, float]]" = OrderedDict()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            body, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return body
+
+    def get_or_build(self, key: Hashable, build: Callable[[], bytes]) -> bytes:
+        """
+        Return the cached body for key, building (and caching) it on a miss.
+
+        A body built while an invalidation happened is returned but not cached,
+        so a concurrent write can never be masked by a stale entry.
+        """
+        body = self._lookup(key)
+        if body is not None:
+            self.hits += 1
+            return body
+
+        self.misses += 1
+        generation = self._generation
+        body = build()
+
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (body, time.monotonic() + self.ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return body
+
+    def invalidate(self) -> None:
+        """Drop every cached feed."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+template_feed_cache = TemplateFeedCache(
+    ttl=settings.TEMPLATE_FEED_CACHE_TTL,
+    max_entries=settings.TEMPLATE_FEED_CACHE_MAX_ENTRIES,
+)
@@ -0,0 +1,326 @@
+"""
+Template Similarity Service
+
+Maintains the precomputed "similar templates" neighbor table:
+1. Each active template is hashed into a fixed-size feature vector (tags, category,
+   difficulty, step/option set counts and name/description tokens)
+2. Cosine similarities are vectorized NumPy matrix products, computed in row blocks
+3. A template change only recomputes the neighbor lists it can affect, on a
+   background thread; the feature matrix is cached and only changed templates
+   (by updated_at) are re-hashed, so writes never pay for a full load
+
+Features are hashed with fixed weights and no corpus statistics, so adding or
+editing one template never changes the vectors of the others and incremental
+refreshes give the same result as a full rebuild.
+"""
+import math
+import queue
+import re
+import threading
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.wizard_template import WizardTemplate, WizardTemplateSimilarity
+
+FEATURE_DIMENSIONS = 1024
+BLOCK_SIZE = 512
+
+# Relative weight of each feature group (groups are L2-normalized before weighting)
+GROUP_WEIGHTS = {"tag": 1.0, "category": 1.0, "difficulty": 0.5, "text": 0.75}
+SIZE_WEIGHT = 0.5
+SIZE_SCALE = math.log1p(50)  # structures with 50+ steps/option sets saturate
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]{3,}")
+STOPWORDS = {
+    "and", "the", "for", "with", "your", "you", "this", "that", "from", "are",
+    "all", "any", "can", "into", "our", "out", "use", "using", "will",
+}
+
+
+def _feature_weights(row) -> Dict[str, float]:
+    groups = {
+        "tag": {f"tag:{tag.strip().lower()}": 1.0 for tag in row.tags or [] if tag and tag.strip()},
+        "category": {f"category:{row.category.strip().lower()}": 1.0} if row.category else {},
+        "difficulty": {f"difficulty:{row.difficulty_level}": 1.0} if row.difficulty_level else {},
+        "text": {},
+    }
+    text = f"{row.template_name or ''} {row.template_description or ''}".lower()
+    for token in TOKEN_PATTERN.findall(text):
+        if token not in STOPWORDS:
+            groups["text"][f"text:{token}"] = groups["text"].get(f"text:{token}", 0.0) + 1.0
+
+    weights: Dict[str, float] = {}
+    for group, values in groups.items():
+        norm = math.sqrt(sum(v * v for v in values.values()))
+        for feature, value in values.items():
+            weights[feature] = GROUP_WEIGHTS[group] * value / norm
+
+    weights["size:steps"] = SIZE_WEIGHT * min(math.log1p(row.step_count or 0) / SIZE_SCALE, 1.0)
+    weights["size:option_sets"] = SIZE_WEIGHT * min(math.log1p(row.option_set_count or 0) / SIZE_SCALE, 1.0)
+    return weights
+
+
+def _feature_matrix(rows: Sequence) -> np.ndarray:
+    """Row-normalized hashed feature matrix (one row per template)."""
+    matrix = np.zeros((len(rows), FEATURE_DIMENSIONS), dtype=np.float32)
+    for i, row in enumerate(rows):
+        for feature, weight in _feature_weights(row).items():
+            # crc32 is stable across processes, unlike hash()
+            matrix[i, zlib.crc32(feature.encode("utf-8")) % FEATURE_DIMENSIONS] += weight
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+FEATURE_COLUMNS = (
+    WizardTemplate.id,
+    WizardTemplate.template_name,
+    WizardTemplate.template_description,
+    WizardTemplate.category,
+    WizardTemplate.difficulty_level,
+    WizardTemplate.tags,
+    WizardTemplate.step_count,
+    WizardTemplate.option_set_count,
+    WizardTemplate.updated_at,
+)
+
+
+class TemplateSimilarityIndex:
+    """Builds and incrementally maintains wizard_template_similarities."""
+
+    def __init__(self, top_k: int):
+        self.top_k = top_k
+        # Cached feature matrix, one row per active template (row i belongs to _ids[i])
+        self._ids: List[UUID] = []
+        self._matrix = np.zeros((0, FEATURE_DIMENSIONS), dtype=np.float32)
+        self._stamps: Dict[UUID, datetime] = {}  # updated_at each cached row was hashed from
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[UUID]" = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _active(self, db: Session):
+        return db.query(*FEATURE_COLUMNS).filter(WizardTemplate.is_active == True)
+
+    def _load(self, db: Session) -> Tuple[List[UUID], np.ndarray]:
+        """Hash every active template and replace the cached matrix."""
+        rows = self._active(db).order_by(WizardTemplate.id).all()
+        self._ids = [row.id for row in rows]
+        self._matrix = _feature_matrix(rows)
+        self._stamps = {row.id: row.updated_at for row in rows}
+        return self._ids, self._matrix
+
+    def _sync(self, db: Session) -> Tuple[List[UUID], np.ndarray]:
+        """
+        Bring the cached matrix up to date, hashing only templates added or changed
+        since the last sync (by any worker process); deactivated ones are dropped.
+        """
+        stamps = dict(db.query(WizardTemplate.id, WizardTemplate.updated_at).filter(WizardTemplate.is_active == True))
+        changed = [template_id for template_id, stamp in stamps.items() if self._stamps.get(template_id) != stamp]
+        rows = self._active(db).filter(WizardTemplate.id.in_(changed)).all() if changed else []
+
+        # All reads are done: update the cache in one go so a failed read leaves it intact
+        keep = np.array([template_id in stamps for template_id in self._ids], dtype=bool)
+        if not keep.all():
+            self._matrix = self._matrix[keep]
+            self._ids = [template_id for template_id, kept in zip(self._ids, keep) if kept]
+        if rows:
+            vectors = _feature_matrix(rows)
+            position_of = {template_id: i for i, template_id in enumerate(self._ids)}
+            added = []
+            for row, vector in zip(rows, vectors):
+                if row.id in position_of:
+                    self._matrix[position_of[row.id]] = vector
+                else:
+                    added.append((row.id, vector))
+            if added:
+                self._ids = self._ids + [template_id for template_id, _ in added]
+                self._matrix = np.vstack([self._matrix, np.array([vector for _, vector in added])])
+        self._stamps = {
+            template_id: self._stamps[template_id] for template_id in self._ids if template_id in self._stamps
+        }
+        self._stamps.update((row.id, row.updated_at) for row in rows)
+        return self._ids, self._matrix
+
+    def _neighbor_rows(self, ids: List[UUID], matrix: np.ndarray, positions: np.ndarray) -> List[Dict]:
+        """Top-k neighbors for the templates at the given positions, in blocks of BLOCK_SIZE."""
+        k = min(self.top_k, len(ids) - 1)
+        if k <= 0:
+            return []
+
+        rows = []
+        for start in range(0, len(positions), BLOCK_SIZE):
+            block = positions[start:start + BLOCK_SIZE]
+            scores = matrix[block] @ matrix.T
+            scores[np.arange(len(block)), block] = -1.0  # never your own neighbor
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+            order = np.argsort(-candidate_scores, axis=1)
+            neighbors = np.take_along_axis(candidates, order, axis=1)
+            neighbor_scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+            for row_index, position in enumerate(block):
+                rank = 0
+                for neighbor, score in zip(neighbors[row_index], neighbor_scores[row_index]):
+                    if score <= 0:
+                        break
+                    rank += 1
+                    rows.append({
+                        "template_id": ids[position],
+                        "similar_template_id": ids[neighbor],
+                        "rank": rank,
+                        "score": round(float(score), 6),
+                    })
+        return rows
+
+    def _replace(self, db: Session, template_ids: Sequence[UUID], rows: List[Dict]) -> None:
+        db.query(WizardTemplateSimilarity)\
+            .filter(WizardTemplateSimilarity.template_id.in_(template_ids))\
+            .delete(synchronize_session=False)
+        if rows:
+            db.execute(insert(WizardTemplateSimilarity), rows)
+
+    def rebuild(self, db: Session) -> int:
+        """
+        Recompute the neighbor lists of every active template.
+
+        Returns:
+            Number of neighbor rows written
+        """
+        with self._lock:
+            ids, matrix = self._load(db)
+            rows = self._neighbor_rows(ids, matrix, np.arange(len(ids)))
+        db.query(WizardTemplateSimilarity).delete(synchronize_session=False)
+        if rows:
+            db.execute(insert(WizardTemplateSimilarity), rows)
+        db.commit()
+        return len(rows)
+
+    def refresh_templates(self, db: Session, template_ids: Set[UUID]) -> None:
+        """
+        Update the index after templates were created, edited, deactivated or deleted.
+
+        Only the changed templates are re-hashed (see _sync). Recomputes their own lists
+        and the lists of templates that:
+        - currently list one of them (it may have changed or disappeared),
+        - one of them now beats the weakest stored neighbor of, or
+        - hold fewer than k neighbors (e.g. after a neighbor was deleted).
+        """
+        try:
+            with self._lock:
+                ids, matrix = self._sync(db)
+                position_of = {template_id: i for i, template_id in enumerate(ids)}
+                k = min(self.top_k, len(ids) - 1)
+
+                affected = set(template_ids)
+                affected.update(
+                    source_id for (source_id,) in
+                    db.query(WizardTemplateSimilarity.template_id)
+                    .filter(WizardTemplateSimilarity.similar_template_id.in_(template_ids))
+                )
+
+                # Weakest stored score per template (0 when its list is not full)
+                thresholds = np.zeros(len(ids), dtype=np.float32)
+                stored = db.query(
+                    WizardTemplateSimilarity.template_id,
+                    func.count(WizardTemplateSimilarity.similar_template_id),
+                    func.min(WizardTemplateSimilarity.score),
+                ).group_by(WizardTemplateSimilarity.template_id).all()
+                for source_id, count, min_score in stored:
+                    if source_id in position_of and count >= k:
+                        thresholds[position_of[source_id]] = min_score
+
+                changed = np.array([position_of[t] for t in template_ids if t in position_of], dtype=np.int64)
+                if len(changed):
+                    scores = matrix[changed] @ matrix.T
+                    scores[np.arange(len(changed)), changed] = -1.0
+                    candidates = np.nonzero((scores > thresholds).any(axis=0))[0]
+                    affected.update(ids[i] for i in candidates)
+
+                rows = self._neighbor_rows(
+                    ids, matrix, np.array([position_of[t] for t in affected if t in position_of], dtype=np.int64)
+                )
+            self._replace(db, list(affected), rows)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"[WARN] Failed to refresh similar templates for {len(template_ids)} template(s): {e}")
+
+    def schedule_refresh(self, template_id: UUID) -> None:
+        """Queue a refresh after a template change; the background thread applies it."""
+        self._queue.put(template_id)
+
+    def _drain(self, timeout: Optional[float]) -> Set[UUID]:
+        """Every queued template ID (changes made in quick succession share one refresh)."""
+        template_ids: Set[UUID] = set()
+        try:
+            if timeout is not None:
+                template_ids.add(self._queue.get(timeout=timeout))
+            while True:
+                template_ids.add(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return template_ids
+
+    def _refresh_queued(self, timeout: Optional[float]) -> None:
+        template_ids = self._drain(timeout)
+        if not template_ids:
+            return
+        db = SessionLocal()
+        try:
+            self.refresh_templates(db, template_ids)
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            self._refresh_queued(timeout=1.0)
+
+    def start(self) -> None:
+        """Start the background refresh thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="template-similarity", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the refresh thread and apply refreshes still queued."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+            self._thread = None
+        self._refresh_queued(timeout=None)
+
+    def ensure_built(self) -> None:
+        """Build the index on startup if it has never been built."""
+        db = SessionLocal()
+        try:
+            if not db.query(WizardTemplateSimilarity.template_id).first():
+                written = self.rebuild(db)
+                print(f"Similar templates index built ({written} neighbor rows)")
+        except Exception as e:
+            db.rollback()
+            print(f"[WARN] Failed to build similar templates index: {e}")
+        finally:
+            db.close()
+
+    def get_similar(self, db: Session, template_id: UUID, limit: int) -> List[Tuple[WizardTemplate, float]]:
+        """Stored neighbors of a template, most similar first (index lookup only)."""
+        return db.query(WizardTemplate, WizardTemplateSimilarity.score)\
+            .join(WizardTemplateSimilarity, WizardTemplateSimilarity.similar_template_id == WizardTemplate.id)\
+            .filter(WizardTemplateSimilarity.template_id == template_id, WizardTemplate.is_active == True)\
+            .order_by(WizardTemplateSimilarity.rank)\
+            .limit(limit)\
+            .all()
+
+
+template_similarity_index = TemplateSimilarityIndex(top_k=settings.TEMPLATE_SIMILAR_TOP_K)
@@ -0,0 +1,316 @@
+"""
+Wizard Bundle Service
+
+Bulk export and import of templates and wizards as gzip-compressed NDJSON bundles:
+1. Export streams one {"kind", "data"} document per line through a streaming gzip encoder
+2. Import decompresses and parses incrementally, validating records in batches
+3. Each batch is loaded with bulk inserts and committed on its own
+
+Imports are idempotent by natural key: templates by template_name, wizards by
+the name of an active wizard. Records whose key already exists are skipped, so a
+bundle can be re-applied safely.
+"""
+import gzip
+import json
+import zlib
+from collections import defaultdict
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from pydantic import ValidationError
+from sqlalchemy import insert, or_, select
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.wizard import Wizard, WizardCategory, Step, OptionSet, Option, OptionDependency
+from app.models.wizard_template import WizardTemplate
+from app.schemas.wizard import WizardBase, StepBase, OptionSetBase, OptionBase, WizardCreate
+from app.schemas.wizard_template import WizardTemplateBase, WizardTemplateCreate
+from app.services.template_feed_cache import template_feed_cache
+from app.services.template_similarity import template_similarity_index
+from app.services.wizard_materializer import materialize_wizards
+from app.services.wizard_versions import checkout_tree
+
+BUNDLE_FORMAT = "wizard-bundle"
+BUNDLE_VERSION = 1
+BUNDLE_BATCH_SIZE = 200
+MAX_REPORTED_ERRORS = 100
+
+TEMPLATE_EXPORT_FIELDS = list(WizardTemplateBase.model_fields) + ["is_system_template", "created_by"]
+
+
+def _line(kind: str, data: Dict[str, Any]) -> bytes:
+    return (json.dumps({"kind": kind, "data": data}, default=str) + "\n").encode("utf-8")
+
+
+def _fields(obj, schema) -> Dict[str, Any]:
+    return {field: getattr(obj, field) for field in schema.model_fields}
+
+
+# ============================================================================
+# Export
+# ============================================================================
+
+def _iter_template_lines(db: Session) -> Iterator[bytes]:
+    stmt = select(WizardTemplate).where(WizardTemplate.is_active == True)\
+        .order_by(WizardTemplate.template_name)\
+        .execution_options(yield_per=BUNDLE_BATCH_SIZE)
+    for batch in db.execute(stmt).scalars().partitions():
+        yield b"".join(
+            _line("template", {field: getattr(t, field) for field in TEMPLATE_EXPORT_FIELDS})
+            for t in batch
+        )
+        db.expunge_all()
+
+
+def _serialize_wizard_batch(db: Session, wizards: List[Wizard]) -> bytes:
+    """Serialize a batch of wizards with one flat query per tree level."""
+    wizard_ids = [w.id for w in wizards]
+    steps = db.query(Step).filter(Step.wizard_id.in_(wizard_ids)).order_by(Step.step_order).all()
+    option_sets = db.query(OptionSet).filter(OptionSet.step_id.in_([s.id for s in steps]))\
+        .order_by(OptionSet.display_order).all() if steps else []
+    options = db.query(Option).filter(Option.option_set_id.in_([os.id for os in option_sets]))\
+        .order_by(Option.display_order).all() if option_sets else []
+    dependencies = db.query(OptionDependency).filter(OptionDependency.option_id.in_([o.id for o in options]))\
+        .all() if options else []
+    category_names = dict(
+        db.query(WizardCategory.id, WizardCategory.name)
+        .filter(WizardCategory.id.in_({w.category_id for w in wizards if w.category_id}))
+        .all()
+    )
+
+    steps_by_wizard, sets_by_step, options_by_set, deps_by_option = (defaultdict(list) for _ in range(4))
+    for step in steps:
+        steps_by_wizard[step.wizard_id].append(step)
+    for option_set in option_sets:
+        sets_by_step[option_set.step_id].append(option_set)
+    for option in options:
+        options_by_set[option.option_set_id].append(option)
+    for dependency in dependencies:
+        deps_by_option[dependency.option_id].append({
+            "depends_on_option_id": dependency.depends_on_option_id,
+            "dependency_type": dependency.dependency_type,
+        })
+
+    lines = []
+    for wizard in wizards:
+        data = _fields(wizard, WizardBase)
+        data["category_name"] = category_names.get(wizard.category_id)
+        data["steps"] = [
+            {
+                **_fields(step, StepBase),
+                "id": step.id,
+                "option_sets": [
+                    {
+                        **_fields(option_set, OptionSetBase),
+                        "id": option_set.id,
+                        "options": [
+                            {**_fields(option, OptionBase), "id": option.id, "dependencies": deps_by_option[option.id]}
+                            for option in options_by_set[option_set.id]
+                        ],
+                    }
+                    for option_set in sets_by_step[step.id]
+                ],
+            }
+            for step in steps_by_wizard[wizard.id]
+        ]
+        lines.append(_line("wizard", data))
+    return b"".join(lines)
+
+
+def _iter_wizard_lines(db: Session) -> Iterator[bytes]:
+    # New versions nobody has opened yet have no step rows until checked out
+    pending = db.query(Wizard.id).filter(Wizard.is_active == True, Wizard.pending_version_id.isnot(None)).all()
+    for (wizard_id,) in pending:
+        checkout_tree(db, wizard_id)
+
+    stmt = select(Wizard).where(Wizard.is_active == True)\
+        .order_by(Wizard.created_at, Wizard.id)\
+        .execution_options(yield_per=BUNDLE_BATCH_SIZE)
+    for batch in db.execute(stmt).scalars().partitions():
+        yield _serialize_wizard_batch(db, batch)
+        db.expunge_all()
+
+
+def stream_bundle(include_templates: bool = True, include_wizards: bool = True) -> Iterator[bytes]:
+    """
+    Stream a gzip-compressed NDJSON bundle.
+    Uses its own session, which lives as long as the stream.
+    """
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    db = SessionLocal()
+    try:
+        yield compressor.compress(_line("bundle", {"format": BUNDLE_FORMAT, "version": BUNDLE_VERSION}))
+        if include_templates:
+            for chunk in _iter_template_lines(db):
+                yield compressor.compress(chunk)
+        if include_wizards:
+            for chunk in _iter_wizard_lines(db):
+                yield compressor.compress(chunk)
+        yield compressor.flush()
+    finally:
+        db.close()
+
+
+# ============================================================================
+# Import
+# ============================================================================
+
+def _open_lines(stream: BinaryIO) -> Iterator[bytes]:
+    """Iterate lines of a gzip-compressed or plain NDJSON stream without reading it whole."""
+    magic = stream.read(2)
+    stream.seek(0)
+    return gzip.GzipFile(fileobj=stream, mode="rb") if magic == b"\x1f\x8b" else stream
+
+
+class _BundleImporter:
+    def __init__(self, db: Session, owner_id: UUID, batch_size: int):
+        self.db = db
+        self.owner_id = owner_id
+        self.batch_size = batch_size
+        self.pending: Dict[str, List[tuple]] = {"template": [], "wizard": []}
+        self.stats = {
+            "templates": {"created": 0, "skipped": 0},
+            "wizards": {"created": 0, "skipped": 0},
+            "errors": [],
+            "error_count": 0,
+        }
+
+    def _error(self, line_number: int, message: str) -> None:
+        self.stats["error_count"] += 1
+        if len(self.stats["errors"]) < MAX_REPORTED_ERRORS:
+            self.stats["errors"].append({"line": line_number, "error": message})
+
+    def add(self, line_number: int, line: bytes) -> None:
+        if not line.strip():
+            return
+        try:
+            record = json.loads(line)
+            kind, data = record["kind"], record["data"]
+        except (ValueError, KeyError, TypeError) as e:
+            self._error(line_number, f"Malformed record: {e}")
+            return
+
+        if kind == "bundle":
+            if data.get("format") != BUNDLE_FORMAT or data.get("version") != BUNDLE_VERSION:
+                raise ValueError(f"Unsupported bundle header: {data}")
+            return
+        if kind not in self.pending:
+            self._error(line_number, f"Unknown record kind '{kind}'")
+            return
+
+        self.pending[kind].append((line_number, data))
+        if len(self.pending[kind]) >= self.batch_size:
+            self.flush(kind)
+
+    def flush(self, kind: Optional[str] = None) -> None:
+        for pending_kind in ([kind] if kind else list(self.pending)):
+            batch, self.pending[pending_kind] = self.pending[pending_kind], []
+            if not batch:
+                continue
+            if pending_kind == "template":
+                self._load_templates(batch)
+            else:
+                self._load_wizards(batch)
+
+    def _validate(self, batch: List[tuple], schema) -> List[tuple]:
+        valid = []
+        for line_number, data in batch:
+            try:
+                valid.append((line_number, schema.model_validate(data), data))
+            except ValidationError as e:
+                self._error(line_number, str(e))
+        return valid
+
+    def _load_templates(self, batch: List[tuple]) -> None:
+        valid = self._validate(batch, WizardTemplateCreate)
+        names = {template_in.template_name for _, template_in, _ in valid}
+        existing = {
+            name for (name,) in
+            self.db.query(WizardTemplate.template_name).filter(WizardTemplate.template_name.in_(names))
+        }
+
+        rows = []
+        for _, template_in, _ in valid:
+            if template_in.template_name in existing:
+                self.stats["templates"]["skipped"] += 1
+                continue
+            existing.add(template_in.template_name)  # Duplicates within the bundle
+            steps = template_in.wizard_structure.get("steps", [])
+            rows.append({
+                **template_in.model_dump(),
+                "step_count": len(steps),
+                "option_set_count": sum(len(step.get("option_sets", [])) for step in steps),
+            })
+
+        if rows:
+            self.db.execute(insert(WizardTemplate), rows)
+            self.db.commit()
+            template_feed_cache.invalidate()
+            self.stats["templates"]["created"] += len(rows)
+
+    def _resolve_categories(self, batch: List[tuple]) -> Dict[Any, UUID]:
+        """Map exported category names (preferred) and IDs to categories of this database."""
+        names = {data.get("category_name") for _, data in batch if data.get("category_name")}
+        ids = set()
+        for _, data in batch:
+            try:
+                ids.add(UUID(str(data["category_id"])))
+            except (KeyError, ValueError, TypeError):
+                pass
+        if not names and not ids:
+            return {}
+        categories = self.db.query(WizardCategory.id, WizardCategory.name)\
+            .filter(or_(WizardCategory.name.in_(names), WizardCategory.id.in_(ids)))\
+            .all()
+        mapping = {}
+        for category_id, name in categories:
+            mapping[name] = category_id
+            mapping[str(category_id)] = category_id
+        return mapping
+
+    def _load_wizards(self, batch: List[tuple]) -> None:
+        categories = self._resolve_categories(batch)
+        for _, data in batch:
+            data["category_id"] = categories.get(data.get("category_name")) or categories.get(str(data.get("category_id")))
+
+        valid = self._validate(batch, WizardCreate)
+        names = {wizard_in.name for _, wizard_in, _ in valid}
+        existing = {
+            name for (name,) in
+            self.db.query(Wizard.name).filter(Wizard.name.in_(names), Wizard.is_active == True)
+        }
+
+        items = []
+        for _, wizard_in, data in valid:
+            if wizard_in.name in existing:
+                self.stats["wizards"]["skipped"] += 1
+                continue
+            existing.add(wizard_in.name)
+            items.append((wizard_in, data))
+
+        if items:
+            materialize_wizards(self.db, items, self.owner_id)
+            self.stats["wizards"]["created"] += len(items)
+
+
+def import_bundle(db: Session, stream: BinaryIO, owner_id: UUID, batch_size: int = BUNDLE_BATCH_SIZE) -> Dict:
+    """
+    Import a (gzip-compressed) NDJSON bundle of templates and wizards.
+
+    Args:
+        db: Database session
+        stream: Seekable binary stream with the bundle
+        owner_id: UUID of the user who will own imported wizards
+        batch_size: Records validated and inserted per batch
+
+    Returns:
+        Created/skipped counts per kind and per-line errors (first 100)
+    """
+    importer = _BundleImporter(db, owner_id, batch_size)
+    for line_number, line in enumerate(_open_lines(stream), start=1):
+        importer.add(line_number, line)
+    importer.flush()
+    if importer.stats["templates"]["created"]:
+        template_similarity_index.rebuild(db)
+    return importer.stats
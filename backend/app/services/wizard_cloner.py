@@ -0,0 +1,186 @@
+"""
+Wizard Cloner
+
+Copies a wizard's whole tree inside PostgreSQL without loading it into the ORM:
+1. A temporary table maps every source step/option set/option ID to a new UUID
+2. Each level is copied with one INSERT ... SELECT joined through that map
+3. Option dependencies are remapped on both ends in a final INSERT ... SELECT
+
+Used for plain clones; the whole copy is one transaction. New wizard versions only
+copy the wizard row and take their tree from the source's snapshot (wizard_versions).
+"""
+import uuid
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import text, bindparam, Integer
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.orm import Session
+
+from app.models.wizard import Wizard
+from app.services import audit_log
+
+
+CREATE_ID_MAP_SQL = text("""
+    CREATE TEMP TABLE IF NOT EXISTS wizard_clone_id_map (
+        kind CHAR(1) NOT NULL,
+        old_id UUID NOT NULL,
+        new_id UUID NOT NULL,
+        PRIMARY KEY (kind, old_id)
+    ) ON COMMIT DROP
+""")
+
+# Another clone earlier in the same transaction may have left rows behind
+CLEAR_ID_MAP_SQL = text("DELETE FROM wizard_clone_id_map")
+
+CLONE_WIZARD_SQL = text("""
+    INSERT INTO wizards (
+        id, name, description, category_id, created_by, icon, cover_image,
+        is_published, is_active, allow_templates, require_login, allow_anonymous,
+        auto_save, auto_save_interval, abandon_after_hours, estimated_time, difficulty_level, tags,
+        total_sessions, completed_sessions, lifecycle_state, is_archived,
+        version_number, parent_wizard_id, created_at, updated_at
+    )
+    SELECT
+        :new_id, :new_name, COALESCE(:new_description, description), category_id, :created_by, icon, cover_image,
+        FALSE, TRUE, allow_templates, require_login, allow_anonymous,
+        auto_save, auto_save_interval, abandon_after_hours, estimated_time, difficulty_level, tags,
+        0, 0, 'draft', FALSE,
+        :version_number, :parent_wizard_id, now(), now()
+    FROM wizards
+    WHERE id = :source_id
+""").bindparams(
+    bindparam("new_id", type_=PG_UUID(as_uuid=True)),
+    bindparam("source_id", type_=PG_UUID(as_uuid=True)),
+    bindparam("created_by", type_=PG_UUID(as_uuid=True)),
+    bindparam("parent_wizard_id", type_=PG_UUID(as_uuid=True)),
+    bindparam("version_number", type_=Integer),
+)
+
+MAP_IDS_SQL = text("""
+    INSERT INTO wizard_clone_id_map (kind, old_id, new_id)
+    SELECT 's', s.id, gen_random_uuid() FROM steps s WHERE s.wizard_id = :source_id
+    UNION ALL
+    SELECT 'o', os.id, gen_random_uuid()
+    FROM option_sets os JOIN steps s ON s.id = os.step_id
+    WHERE s.wizard_id = :source_id
+    UNION ALL
+    SELECT 'p', o.id, gen_random_uuid()
+    FROM options o JOIN option_sets os ON os.id = o.option_set_id JOIN steps s ON s.id = os.step_id
+    WHERE s.wizard_id = :source_id
+""").bindparams(bindparam("source_id", type_=PG_UUID(as_uuid=True)))
+
+CLONE_STEPS_SQL = text("""
+    INSERT INTO steps (
+        id, wizard_id, name, description, help_text, step_order, is_required, is_skippable,
+        allow_back_navigation, layout, custom_styles, validation_rules, created_at, updated_at
+    )
+    SELECT
+        m.new_id, :new_id, s.name, s.description, s.help_text, s.step_order, s.is_required, s.is_skippable,
+        s.allow_back_navigation, s.layout, s.custom_styles, s.validation_rules, now(), now()
+    FROM steps s
+    JOIN wizard_clone_id_map m ON m.kind = 's' AND m.old_id = s.id
+""").bindparams(bindparam("new_id", type_=PG_UUID(as_uuid=True)))
+
+CLONE_OPTION_SETS_SQL = text("""
+    INSERT INTO option_sets (
+        id, step_id, name, description, selection_type, is_required, min_selections, max_selections,
+        min_value, max_value, regex_pattern, custom_validation, display_order, placeholder, help_text,
+        step_increment, created_at, updated_at
+    )
+    SELECT
+        m.new_id, ms.new_id, os.name, os.description, os.selection_type, os.is_required,
+        os.min_selections, os.max_selections, os.min_value, os.max_value, os.regex_pattern,
+        os.custom_validation, os.display_order, os.placeholder, os.help_text, os.step_increment, now(), now()
+    FROM option_sets os
+    JOIN wizard_clone_id_map m ON m.kind = 'o' AND m.old_id = os.id
+    JOIN wizard_clone_id_map ms ON ms.kind = 's' AND ms.old_id = os.step_id
+""")
+
+CLONE_OPTIONS_SQL = text("""
+    INSERT INTO options (
+        id, option_set_id, label, value, description, display_order, icon, image_url,
+        is_default, is_recommended, is_active, metadata, created_at, updated_at
+    )
+    SELECT
+        m.new_id, mo.new_id, o.label, o.value, o.description, o.display_order, o.icon, o.image_url,
+        o.is_default, o.is_recommended, o.is_active, o.metadata, now(), now()
+    FROM options o
+    JOIN wizard_clone_id_map m ON m.kind = 'p' AND m.old_id = o.id
+    JOIN wizard_clone_id_map mo ON mo.kind = 'o' AND mo.old_id = o.option_set_id
+""")
+
+# Dependencies on options of another wizard have no mapped target and are not copied
+CLONE_DEPENDENCIES_SQL = text("""
+    INSERT INTO option_dependencies (id, option_id, depends_on_option_id, dependency_type, created_at)
+    SELECT gen_random_uuid(), mo.new_id, md.new_id, d.dependency_type, now()
+    FROM option_dependencies d
+    JOIN wizard_clone_id_map mo ON mo.kind = 'p' AND mo.old_id = d.option_id
+    JOIN wizard_clone_id_map md ON md.kind = 'p' AND md.old_id = d.depends_on_option_id
+""")
+
+
+def clone_wizard_tree(
+    db: Session,
+    source_wizard_id: UUID,
+    new_name: str,
+    created_by: UUID,
+    *,
+    new_description: Optional[str] = None,
+    parent_wizard_id: Optional[UUID] = None,
+    version_number: int = 1,
+    copy_tree: bool = True,
+    commit: bool = True,
+) -> Optional[UUID]:
+    """
+    Clone a wizard with all steps, option sets, options and dependencies using set-based SQL.
+
+    Args:
+        db: Database session
+        source_wizard_id: UUID of the wizard to copy
+        new_name: Name for the new wizard
+        created_by: UUID of the owner of the new wizard
+        new_description: Optional description override
+        parent_wizard_id: Set when the clone is a new version of another wizard
+        version_number: Version number of the new wizard
+        copy_tree: Copy steps, option sets, options and dependencies (False copies only the wizard row)
+        commit: Commit the transaction (callers composing a larger unit pass False)
+
+    Returns:
+        ID of the new wizard, or None if the source wizard does not exist
+    """
+    new_id = uuid.uuid4()
+    created = db.execute(CLONE_WIZARD_SQL, {
+        "new_id": new_id,
+        "new_name": new_name,
+        "new_description": new_description,
+        "created_by": created_by,
+        "parent_wizard_id": parent_wizard_id,
+        "version_number": version_number,
+        "source_id": source_wizard_id,
+    })
+    if created.rowcount == 0:
+        return None
+
+    if copy_tree:
+        db.execute(CREATE_ID_MAP_SQL)
+        db.execute(CLEAR_ID_MAP_SQL)
+        db.execute(MAP_IDS_SQL, {"source_id": source_wizard_id})
+        db.execute(CLONE_STEPS_SQL, {"new_id": new_id})
+        db.execute(CLONE_OPTION_SETS_SQL)
+        db.execute(CLONE_OPTIONS_SQL)
+        db.execute(CLONE_DEPENDENCIES_SQL)
+
+    # Raw SQL bypasses the flush hooks, so record the clone explicitly
+    audit_log.record(db, "create", Wizard.__tablename__, new_id, new_values={
+        "name": new_name,
+        "created_by": created_by,
+        "cloned_from": source_wizard_id,
+        "parent_wizard_id": parent_wizard_id,
+        "version_number": version_number,
+    })
+
+    if commit:
+        db.commit()
+    return new_id
+
@@ -0,0 +1,120 @@
+"""
+Wizard Run Counter Service
+
+Maintains Wizard.total_sessions, completed_sessions and average_completion_time
+without read-modify-write races:
+1. Run creation/completion only records a delta in memory
+2. A background thread periodically flushes all deltas in one transaction
+3. Each flush is an atomic UPDATE wizards SET x = x + n per wizard
+"""
+import threading
+from typing import Dict, Optional
+from uuid import UUID
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import SessionLocal
+
+
+# Running average is folded in using the pre-update column values, which
+# PostgreSQL guarantees for every expression in the SET list.
+FLUSH_COUNTERS_SQL = text("""
+    UPDATE wizards
+    SET total_sessions = COALESCE(total_sessions, 0) + :started,
+        completed_sessions = COALESCE(completed_sessions, 0) + :completed,
+        average_completion_time = CASE
+            WHEN :completed > 0 THEN ROUND(
+                (COALESCE(average_completion_time, 0) * COALESCE(completed_sessions, 0) + :completion_seconds)
+                / (COALESCE(completed_sessions, 0) + :completed)
+            )
+            ELSE average_completion_time
+        END
+    WHERE id = :wizard_id
+""")
+
+
+class WizardCounterService:
+    """Buffers per-wizard counter deltas and flushes them as atomic UPDATEs."""
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._deltas: Dict[UUID, Dict[str, int]] = {}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _delta(self, wizard_id: UUID) -> Dict[str, int]:
+        delta = self._deltas.get(wizard_id)
+        if delta is None:
+            delta = {"started": 0, "completed": 0, "completion_seconds": 0}
+            self._deltas[wizard_id] = delta
+        return delta
+
+    def record_run_started(self, wizard_id: UUID) -> None:
+        """Count a newly started run."""
+        with self._lock:
+            self._delta(wizard_id)["started"] += 1
+
+    def record_run_completed(self, wizard_id: UUID, completion_seconds: int) -> None:
+        """Count a completed run and its duration."""
+        with self._lock:
+            delta = self._delta(wizard_id)
+            delta["completed"] += 1
+            delta["completion_seconds"] += max(int(completion_seconds), 0)
+
+    def flush(self) -> int:
+        """
+        Write all buffered deltas to the database in a single transaction.
+
+        Returns:
+            Number of wizards updated
+        """
+        with self._lock:
+            if not self._deltas:
+                return 0
+            pending, self._deltas = self._deltas, {}
+
+        params = [{"wizard_id": wizard_id, **delta} for wizard_id, delta in pending.items()]
+        db = SessionLocal()
+        try:
+            db.execute(FLUSH_COUNTERS_SQL, params)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self._requeue(pending)
+            print(f"[WARN] Wizard counter flush failed, will retry: {e}")
+            return 0
+        finally:
+            db.close()
+        return len(params)
+
+    def _requeue(self, pending: Dict[UUID, Dict[str, int]]) -> None:
+        with self._lock:
+            for wizard_id, delta in pending.items():
+                current = self._delta(wizard_id)
+                for key, value in delta.items():
+                    current[key] += value
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def start(self) -> None:
+        """Start the background flush thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="wizard-counter-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread and flush whatever is still buffered."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+        self.flush()
+
+
+wizard_counter_service = WizardCounterService(flush_interval=settings.WIZARD_COUNTER_FLUSH_INTERVAL)
@@ -0,0 +1,141 @@
+"""
+Wizard Edit Impact Analyzer
+
+Computes which runs and responses a proposed wizard update would orphan or invalidate:
+1. The incoming step tree is matched against the stored one exactly as the
+   reconciler would (dry run), yielding removed, moved and retyped IDs
+2. Stored responses are diffed against those ID sets with a few set-based
+   queries (IN lists and array overlap on selected_options), never per run
+3. Counts are returned with a small sample of affected runs for the editor
+
+Orphaned responses are deleted with their step or option set (ON DELETE CASCADE).
+Invalidated responses survive but reference options that are removed or moved
+to another option set, or answer an option set whose selection_type changes.
+"""
+from typing import Dict, Set
+from uuid import UUID
+
+from sqlalchemy import and_, false, func, not_, or_, select, union
+from sqlalchemy.orm import Session
+
+from app.models.wizard import Step, OptionSet
+from app.models.wizard_run import WizardRun, WizardRunStepResponse, WizardRunOptionSetResponse
+from app.schemas.wizard import WizardUpdate
+from app.services.wizard_reconciler import plan_reconciliation
+from app.services.wizard_versions import checkout_tree
+
+IMPACT_SAMPLE_SIZE = 10
+
+
+def _in(column, ids: Set[UUID]):
+    return column.in_(ids) if ids else false()
+
+
+def _empty_impact() -> Dict:
+    return {
+        "structure_changed": False,
+        "structure": {
+            "steps": {"removed": 0, "moved": 0},
+            "option_sets": {"removed": 0, "moved": 0, "retyped": 0},
+            "options": {"removed": 0, "moved": 0},
+        },
+        "responses": {
+            "orphaned_step_responses": 0,
+            "orphaned_option_set_responses": 0,
+            "invalidated_option_set_responses": 0,
+        },
+        "runs": {"affected": 0, "stored": 0, "in_progress": 0, "completed": 0},
+        "sample_runs": [],
+    }
+
+
+def analyze_edit_impact(db: Session, wizard_id: UUID, wizard_in: WizardUpdate, sample_size: int = IMPACT_SAMPLE_SIZE) -> Dict:
+    """
+    Impact of applying wizard_in to a wizard, without applying it.
+
+    Args:
+        db: Database session
+        wizard_id: UUID of the wizard being edited
+        wizard_in: Proposed update (only its step tree can affect runs)
+        sample_size: Maximum number of affected runs to list
+
+    Returns:
+        Dictionary with structural diff counts, orphaned/invalidated response counts,
+        affected run counts by status and a sample of affected runs
+    """
+    impact = _empty_impact()
+    if wizard_in.steps is None:
+        return impact
+
+    checkout_tree(db, wizard_id)
+    plan = plan_reconciliation(db, wizard_id, wizard_in.steps)
+    impact["structure_changed"] = any(ids for level in plan.values() for ids in level.values())
+    for level, changes in plan.items():
+        impact["structure"][level] = {change: len(ids) for change, ids in changes.items()}
+
+    removed_steps = plan["steps"]["removed"]
+    removed_option_sets = plan["option_sets"]["removed"]
+    lost_options = plan["options"]["removed"] | plan["options"]["moved"]
+    if not (removed_steps or removed_option_sets or lost_options or plan["option_sets"]["retyped"]):
+        return impact
+
+    # Option set responses are cascaded with a removed option set, or with their step response
+    orphaned_step_response_ids = select(WizardRunStepResponse.id)\
+        .where(_in(WizardRunStepResponse.step_id, removed_steps))
+    orphaned = or_(
+        _in(WizardRunOptionSetResponse.option_set_id, removed_option_sets),
+        WizardRunOptionSetResponse.step_response_id.in_(orphaned_step_response_ids) if removed_steps else false(),
+    )
+    invalidated = and_(not_(orphaned), or_(
+        WizardRunOptionSetResponse.selected_options.overlap(list(lost_options)) if lost_options else false(),
+        _in(WizardRunOptionSetResponse.option_set_id, plan["option_sets"]["retyped"]),
+    ))
+    wizard_option_sets = select(OptionSet.id).join(Step).where(Step.wizard_id == wizard_id)
+    affected_option_set_responses = and_(
+        WizardRunOptionSetResponse.option_set_id.in_(wizard_option_sets),
+        or_(orphaned, invalidated),
+    )
+
+    orphaned_step_responses = db.query(func.count(WizardRunStepResponse.id))\
+        .filter(WizardRunStepResponse.step_id.in_(removed_steps))\
+        .scalar() if removed_steps else 0
+    orphaned_count, invalidated_count = db.query(
+        func.count().filter(orphaned),
+        func.count().filter(invalidated),
+    ).select_from(WizardRunOptionSetResponse).filter(affected_option_set_responses).one()
+    impact["responses"] = {
+        "orphaned_step_responses": orphaned_step_responses,
+        "orphaned_option_set_responses": orphaned_count,
+        "invalidated_option_set_responses": invalidated_count,
+    }
+
+    affected_runs = union(
+        select(WizardRunStepResponse.run_id).where(_in(WizardRunStepResponse.step_id, removed_steps)),
+        select(WizardRunOptionSetResponse.run_id).where(affected_option_set_responses),
+    ).subquery()
+    totals = db.query(
+        func.count(WizardRun.id),
+        func.count(WizardRun.id).filter(WizardRun.is_stored == True),
+        func.count(WizardRun.id).filter(WizardRun.status == "in_progress"),
+        func.count(WizardRun.id).filter(WizardRun.status == "completed"),
+    ).join(affected_runs, affected_runs.c.run_id == WizardRun.id).one()
+    impact["runs"] = dict(zip(("affected", "stored", "in_progress", "completed"), totals))
+
+    if impact["runs"]["affected"]:
+        samples = db.query(
+            WizardRun.id, WizardRun.run_name, WizardRun.status, WizardRun.is_stored, WizardRun.last_accessed_at,
+        ).join(affected_runs, affected_runs.c.run_id == WizardRun.id)\
+            .order_by(WizardRun.last_accessed_at.desc().nullslast())\
+            .limit(sample_size)\
+            .all()
+        impact["sample_runs"] = [
+            {
+                "run_id": run.id,
+                "run_name": run.run_name,
+                "status": run.status,
+                "is_stored": run.is_stored,
+                "last_accessed_at": run.last_accessed_at,
+            }
+            for run in samples
+        ]
+    return impact
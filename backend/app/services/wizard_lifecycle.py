@@ -0,0 +1,160 @@
+"""
+Wizard Lifecycle Tracking
+
+Keeps Wizard.lifecycle_state, its run counters and first_run_at/first_stored_run_at
+current inside the transaction that changes runs:
+1. A before_flush hook diffs created, deleted and changed (status, is_stored) runs
+   into per-wizard counter deltas
+2. An after_flush hook applies them with one conditional UPDATE per wizard on the
+   flush connection, deriving the new state from the updated counters
+3. Readers (protection checks, wizard lists) then read plain columns
+
+Bulk statements on wizard_runs bypass the hooks and must call
+apply_lifecycle_deltas or recompute_lifecycle themselves. Archived runs
+(wizard_run_archives) keep counting until they are deleted.
+"""
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict
+from uuid import UUID
+
+from sqlalchemy import event, text, bindparam, Integer
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from app.database import SessionLocal
+from app.models.wizard_run import WizardRun
+
+COUNTERS = ("runs", "stored", "in_progress", "completed")
+
+# Every expression in SET sees the pre-update row, so the new counts are spelled out
+APPLY_LIFECYCLE_SQL = text("""
+    UPDATE wizards
+    SET run_count = GREATEST(run_count + :runs, 0),
+        stored_run_count = GREATEST(stored_run_count + :stored, 0),
+        in_progress_run_count = GREATEST(in_progress_run_count + :in_progress, 0),
+        completed_run_count = GREATEST(completed_run_count + :completed, 0),
+        lifecycle_state = CASE
+            WHEN run_count + :runs <= 0 THEN 'draft'
+            WHEN stored_run_count + :stored > 0 THEN 'published'
+            ELSE 'in_use'
+        END,
+        first_run_at = CASE
+            WHEN run_count + :runs <= 0 THEN NULL
+            ELSE COALESCE(first_run_at, :now)
+        END,
+        first_stored_run_at = CASE
+            WHEN run_count + :runs <= 0 THEN NULL
+            WHEN stored_run_count + :stored > 0 THEN COALESCE(first_stored_run_at, :now)
+            ELSE first_stored_run_at
+        END
+    WHERE id = :wizard_id
+""").bindparams(
+    bindparam("wizard_id", type_=PG_UUID(as_uuid=True)),
+    bindparam("runs", type_=Integer),
+    bindparam("stored", type_=Integer),
+    bindparam("in_progress", type_=Integer),
+    bindparam("completed", type_=Integer),
+)
+
+RECOMPUTE_LIFECYCLE_SQL = text("""
+    UPDATE wizards w
+    SET run_count = c.runs,
+        stored_run_count = c.stored,
+        in_progress_run_count = c.in_progress,
+        completed_run_count = c.completed,
+        lifecycle_state = CASE
+            WHEN c.runs = 0 THEN 'draft'
+            WHEN c.stored > 0 THEN 'published'
+            ELSE 'in_use'
+        END,
+        first_run_at = c.first_run_at,
+        first_stored_run_at = CASE WHEN c.runs = 0 THEN NULL ELSE COALESCE(w.first_stored_run_at, c.first_stored_run_at) END
+    FROM (
+        SELECT COUNT(r.id) AS runs,
+               COUNT(r.id) FILTER (WHERE r.is_stored) AS stored,
+               COUNT(r.id) FILTER (WHERE r.status = 'in_progress') AS in_progress,
+               COUNT(r.id) FILTER (WHERE r.status = 'completed') AS completed,
+               MIN(r.started_at) AS first_run_at,
+               MIN(r.completed_at) FILTER (WHERE r.is_stored) AS first_stored_run_at
+        FROM (
+            SELECT id, is_stored, status, started_at, completed_at
+            FROM wizard_runs WHERE wizard_id = :wizard_id
+            UNION ALL
+            SELECT id, FALSE, status, started_at, completed_at
+            FROM wizard_run_archives WHERE wizard_id = :wizard_id
+        ) r
+    ) c
+    WHERE w.id = :wizard_id
+""").bindparams(bindparam("wizard_id", type_=PG_UUID(as_uuid=True)))
+
+_PENDING_KEY = "wizard_lifecycle_deltas"
+
+
+def _committed(obj, attr: str):
+    """Value of an attribute as last loaded from the database."""
+    history = get_history(obj, attr)
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(obj, attr)
+
+
+def _add(deltas: Dict, wizard_id: UUID, status, is_stored, sign: int) -> None:
+    delta = deltas[wizard_id]
+    delta["runs"] += sign
+    delta["stored"] += sign if is_stored else 0
+    delta["in_progress"] += sign if (status or "in_progress") == "in_progress" else 0
+    delta["completed"] += sign if status == "completed" else 0
+
+
+def _collect_deltas(session: Session, flush_context, instances) -> None:
+    deltas = session.info.setdefault(_PENDING_KEY, defaultdict(lambda: dict.fromkeys(COUNTERS, 0)))
+
+    for obj in session.new:
+        if isinstance(obj, WizardRun) and obj.wizard_id:
+            _add(deltas, obj.wizard_id, obj.status, obj.is_stored, +1)
+
+    for obj in session.dirty:
+        if not isinstance(obj, WizardRun):
+            continue
+        if not (get_history(obj, "status").has_changes() or get_history(obj, "is_stored").has_changes()):
+            continue
+        _add(deltas, obj.wizard_id, _committed(obj, "status"), _committed(obj, "is_stored"), -1)
+        _add(deltas, obj.wizard_id, obj.status, obj.is_stored, +1)
+
+    for obj in session.deleted:
+        if isinstance(obj, WizardRun):
+            _add(deltas, obj.wizard_id, _committed(obj, "status"), _committed(obj, "is_stored"), -1)
+
+
+def apply_lifecycle_deltas(connection, deltas: Dict[UUID, Dict[str, int]]) -> None:
+    """Apply per-wizard counter deltas with one conditional UPDATE per wizard."""
+    now = datetime.now(timezone.utc)
+    params = [
+        {"wizard_id": wizard_id, "now": now, **delta}
+        for wizard_id, delta in deltas.items()
+        if any(delta.values())
+    ]
+    if params:
+        connection.execute(APPLY_LIFECYCLE_SQL, params)
+
+
+def _apply_deltas(session: Session, flush_context) -> None:
+    deltas = session.info.pop(_PENDING_KEY, None)
+    if deltas:
+        apply_lifecycle_deltas(session.connection(), deltas)
+
+
+def _discard_deltas(session: Session, *args) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+event.listen(SessionLocal, "before_flush", _collect_deltas)
+event.listen(SessionLocal, "after_flush", _apply_deltas)
+event.listen(SessionLocal, "after_rollback", _discard_deltas)
+
+
+def recompute_lifecycle(db: Session, wizard_id: UUID) -> None:
+    """Rebuild a wizard's run counters and lifecycle state from its hot and archived runs (repair / after bulk statements)."""
+    db.execute(RECOMPUTE_LIFECYCLE_SQL, {"wizard_id": wizard_id})
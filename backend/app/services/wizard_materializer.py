@@ -0,0 +1,154 @@
+"""
+Wizard Materializer
+
+Creates a complete wizard tree (steps, option sets, options, dependencies) from a
+WizardCreate payload or a template's wizard_structure in a few round trips
+(several wizards can be materialized together):
+1. All primary keys are generated client-side, so no flush is needed to learn parent IDs
+2. Each table is written with one multi-row INSERT (wizard, steps, option sets, options, dependencies)
+3. Everything runs in the caller's transaction and is committed once
+
+Template options may carry their original "id" and a "dependencies" list of
+{"depends_on_option_id", "dependency_type"}; dependency targets are remapped to
+the new option IDs, and dependencies on options outside the structure are dropped.
+"""
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models.wizard import Wizard, Step, OptionSet, Option, OptionDependency
+from app.schemas.wizard import WizardCreate
+from app.services import audit_log
+
+DEPENDENCY_TYPES = {"show_if", "hide_if", "require_if", "disable_if"}
+
+
+def _raw_children(raw: Optional[Dict[str, Any]], key: str, count: int) -> List[Dict[str, Any]]:
+    """Raw JSON children aligned with their validated counterparts (empty dicts if absent)."""
+    children = [child if isinstance(child, dict) else {} for child in (raw or {}).get(key) or []]
+    return (children + [{}] * count)[:count]
+
+
+def _collect_rows(
+    wizard_in: WizardCreate,
+    created_by: UUID,
+    raw_structure: Optional[Dict[str, Any]],
+    rows: Dict[type, List[Dict[str, Any]]],
+) -> Tuple[UUID, Dict[str, int]]:
+    """Append the rows of one wizard tree to the per-table row lists."""
+    wizard_id = uuid.uuid4()
+    raw_dependencies: List[tuple] = []
+    option_id_map: Dict[str, UUID] = {}
+    counts = {"steps": 0, "option_sets": 0, "options": 0, "dependencies": 0}
+
+    rows[Wizard].append({**wizard_in.model_dump(exclude={"steps"}), "id": wizard_id, "created_by": created_by})
+
+    raw_steps = _raw_children(raw_structure, "steps", len(wizard_in.steps))
+    for step_in, raw_step in zip(wizard_in.steps, raw_steps):
+        step_id = uuid.uuid4()
+        rows[Step].append({**step_in.model_dump(exclude={"id", "option_sets"}), "id": step_id, "wizard_id": wizard_id})
+        counts["steps"] += 1
+
+        raw_option_sets = _raw_children(raw_step, "option_sets", len(step_in.option_sets))
+        for option_set_in, raw_option_set in zip(step_in.option_sets, raw_option_sets):
+            option_set_id = uuid.uuid4()
+            rows[OptionSet].append({
+                **option_set_in.model_dump(exclude={"id", "options"}), "id": option_set_id, "step_id": step_id
+            })
+            counts["option_sets"] += 1
+
+            raw_options = _raw_children(raw_option_set, "options", len(option_set_in.options))
+            for option_in, raw_option in zip(option_set_in.options, raw_options):
+                option_id = uuid.uuid4()
+                rows[Option].append({**option_in.model_dump(exclude={"id"}), "id": option_id, "option_set_id": option_set_id})
+                counts["options"] += 1
+                source_option_id = option_in.id or raw_option.get("id")
+                if source_option_id:
+                    option_id_map[str(source_option_id)] = option_id
+                for dependency in raw_option.get("dependencies") or []:
+                    raw_dependencies.append((option_id, dependency))
+
+    for option_id, dependency in raw_dependencies:
+        if not isinstance(dependency, dict):
+            continue
+        depends_on = option_id_map.get(str(dependency.get("depends_on_option_id")))
+        if depends_on and dependency.get("dependency_type") in DEPENDENCY_TYPES:
+            rows[OptionDependency].append({
+                "id": uuid.uuid4(),
+                "option_id": option_id,
+                "depends_on_option_id": depends_on,
+                "dependency_type": dependency["dependency_type"],
+            })
+            counts["dependencies"] += 1
+
+    return wizard_id, counts
+
+
+def materialize_wizards(
+    db: Session,
+    items: List[Tuple[WizardCreate, Optional[Dict[str, Any]]]],
+    created_by: UUID,
+    *,
+    commit: bool = True,
+) -> List[UUID]:
+    """
+    Insert several wizards and their trees with one multi-row INSERT per table.
+
+    Args:
+        db: Database session
+        items: (validated payload, raw JSON it was validated from) pairs; the raw
+            JSON is only used to carry option IDs and dependencies
+        created_by: UUID of the owning user
+        commit: Commit the transaction (callers composing a larger unit pass False)
+
+    Returns:
+        IDs of the new wizards, in input order
+    """
+    # Parents first; each list becomes a single multi-row INSERT
+    rows: Dict[type, List[Dict[str, Any]]] = {
+        Wizard: [], Step: [], OptionSet: [], Option: [], OptionDependency: []
+    }
+    wizard_ids = []
+    for wizard_in, raw_structure in items:
+        wizard_id, counts = _collect_rows(wizard_in, created_by, raw_structure, rows)
+        wizard_ids.append(wizard_id)
+        # Bulk inserts bypass the flush hooks, so record the wizard creation explicitly
+        audit_log.record(db, "create", Wizard.__tablename__, wizard_id, new_values={
+            "name": wizard_in.name, "created_by": created_by, **counts
+        })
+
+    for model, model_rows in rows.items():
+        if model_rows:
+            db.execute(insert(model), model_rows)
+
+    if commit:
+        db.commit()
+    return wizard_ids
+
+
+def materialize_wizard(
+    db: Session,
+    wizard_in: WizardCreate,
+    created_by: UUID,
+    *,
+    raw_structure: Optional[Dict[str, Any]] = None,
+    commit: bool = True,
+) -> UUID:
+    """
+    Insert a wizard and its whole tree with one multi-row INSERT per table.
+
+    Args:
+        db: Database session
+        wizard_in: Validated wizard payload including nested steps/option sets/options
+        created_by: UUID of the creating user
+        raw_structure: Original JSON the payload was validated from; only used to
+            carry option IDs and dependencies, which WizardCreate does not model
+        commit: Commit the transaction (callers composing a larger unit pass False)
+
+    Returns:
+        ID of the new wizard
+    """
+    return materialize_wizards(db, [(wizard_in, raw_structure)], created_by, commit=commit)[0]
@@ -10,10 +10,11 @@ from typing import Dict, Optional
 from uuid import UUID
 from datetime import datetime, timezone
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import event, func
 
+from app.database import SessionLocal
 from app.models.wizard import Wizard
-from app.models.wizard_run import WizardRun
+from app.schemas.wizard import WizardUpdate
 
 
 class WizardState:
@@ -23,20 +24,56 @@ class WizardState:
     PUBLISHED = "published"
 
 
+_STATE_CACHE_KEY = "wizard_protection_state"
+
+
+def _clear_state_cache(session: Session, *args) -> None:
+    session.info.pop(_STATE_CACHE_KEY, None)
+
+
+# Run counts change with any write, so memoized states only live until the next flush or commit
+event.listen(SessionLocal, "after_flush", _clear_state_cache)
+event.listen(SessionLocal, "after_commit", _clear_state_cache)
+event.listen(SessionLocal, "after_rollback", _clear_state_cache)
+
+
 class WizardProtectionService:
     """Service for managing wizard lifecycle protection"""
 
     @staticmethod
-    def get_wizard_state(db: Session, wizard_id: UUID) -> Dict:
+    def _run_summary(db: Session, wizard_id: UUID) -> Optional[Dict]:
+        """
+        Wizard flags, lifecycle state and run counters (plain columns kept current by
+        app.services.wizard_lifecycle), memoized on the session (one session per request).
+        Returns None if the wizard does not exist.
+        """
+        cache = db.info.setdefault(_STATE_CACHE_KEY, {})
+        if wizard_id in cache:
+            return cache[wizard_id]
+
+        row = db.query(
+            Wizard.is_archived,
+            Wizard.lifecycle_state,
+            Wizard.run_count.label("total_runs"),
+            Wizard.stored_run_count.label("stored_runs"),
+            Wizard.in_progress_run_count.label("in_progress_runs"),
+            Wizard.completed_run_count.label("completed_runs"),
+        ).filter(Wizard.id == wizard_id).first()
+
+        cache[wizard_id] = dict(row._mapping) if row else None
+        return cache[wizard_id]
+
+    @staticmethod
+    def get_wizard_state(db: Session, wizard_id: UUID) -> Optional[Dict]:
         """
-        Determine the lifecycle state of a wizard based on run activity.
+        Lifecycle state of a wizard, read from its maintained lifecycle columns.
 
         Args:
             db: Database session
             wizard_id: UUID of the wizard to check
 
         Returns:
-            Dictionary containing:
+            None if the wizard does not exist, otherwise a dictionary containing:
             - state: current lifecycle state (draft, in_use, published)
             - can_edit: whether editing is allowed
             - can_delete: whether deletion is allowed
@@ -47,16 +84,16 @@ class WizardProtectionService:
             - message: user-friendly message explaining the state
             - actions: list of available actions
         """
-        # Query run statistics
-        runs_query = db.query(WizardRun).filter(WizardRun.wizard_id == wizard_id)
+        summary = WizardProtectionService._run_summary(db, wizard_id)
+        if summary is None:
+            return None
 
-        total_runs = runs_query.count()
-        stored_runs = runs_query.filter(WizardRun.is_stored == True).count()
-        in_progress_runs = runs_query.filter(WizardRun.status == 'in_progress').count()
-        completed_runs = runs_query.filter(WizardRun.status == 'completed').count()
+        total_runs = summary["total_runs"]
+        stored_runs = summary["stored_runs"]
+        in_progress_runs = summary["in_progress_runs"]
+        completed_runs = summary["completed_runs"]
 
-        # Determine state based on run activity
-        if total_runs == 0:
+        if summary["lifecycle_state"] == WizardState.DRAFT:
             # State 1: Draft - Never been run
             state = WizardState.DRAFT
             can_edit = True
@@ -64,7 +101,7 @@ class WizardProtectionService:
             message = "This wizard has never been run. All modifications and deletions are allowed."
             actions = ["edit", "delete", "publish", "test"]
 
-        elif stored_runs > 0:
+        elif summary["lifecycle_state"] == WizardState.PUBLISHED:
             # State 3: Published - Has stored runs (read-only)
             state = WizardState.PUBLISHED
             can_edit = False
@@ -106,15 +143,13 @@ class WizardProtectionService:
         Returns:
             Tuple of (can_modify: bool, reason: str)
         """
-        wizard = db.query(Wizard).filter(Wizard.id == wizard_id).first()
-        if not wizard:
+        state = WizardProtectionService.get_wizard_state(db, wizard_id)
+        if state is None:
             return False, "Wizard not found"
 
-        if wizard.is_archived:
+        if WizardProtectionService._run_summary(db, wizard_id)["is_archived"]:
             return False, "Cannot modify archived wizard"
 
-        state = WizardProtectionService.get_wizard_state(db, wizard_id)
-
         if state["state"] == WizardState.PUBLISHED:
             return False, f"Wizard has {state['stored_runs']} stored runs and is read-only"
 
@@ -123,6 +158,18 @@ class WizardProtectionService:
 
         return True, None  # Draft state
 
+    @staticmethod
+    def analyze_edit_impact(db: Session, wizard_id: UUID, wizard_in: WizardUpdate) -> Dict:
+        """
+        Compute exactly which runs and responses a proposed update would orphan or invalidate.
+
+        Returns:
+            Impact report (see app.services.wizard_edit_impact.analyze_edit_impact)
+        """
+        from app.services.wizard_edit_impact import analyze_edit_impact
+
+        return analyze_edit_impact(db, wizard_id, wizard_in)
+
     @staticmethod
     def can_delete_wizard(db: Session, wizard_id: UUID) -> tuple[bool, Optional[str]]:
         """
@@ -131,11 +178,9 @@ class WizardProtectionService:
         Returns:
             Tuple of (can_delete: bool, reason: str)
         """
-        wizard = db.query(Wizard).filter(Wizard.id == wizard_id).first()
-        if not wizard:
-            return False, "Wizard not found"
-
         state = WizardProtectionService.get_wizard_state(db, wizard_id)
+        if state is None:
+            return False, "Wizard not found"
 
         if state["state"] == WizardState.PUBLISHED:
             return False, f"Cannot delete wizard with {state['stored_runs']} stored runs. Archive instead."
@@ -146,74 +191,35 @@ class WizardProtectionService:
         return True, None  # Draft state
 
     @staticmethod
-    def update_lifecycle_state(db: Session, wizard_id: UUID) -> str:
+    def update_lifecycle_state(db: Session, wizard_id: UUID) -> Optional[str]:
         """
-        Update the wizard's lifecycle_state field based on current run activity.
-        This should be called after run creation or state changes.
+        Recompute the wizard's lifecycle state and run counters from its runs.
+        Run writes keep them current automatically; this is a repair for drifted rows.
 
         Returns:
-            The new lifecycle state
+            The new lifecycle state, or None if the wizard does not exist
         """
-        wizard = db.query(Wizard).filter(Wizard.id == wizard_id).first()
-        if not wizard:
-            return None
+        from app.services.wizard_lifecycle import recompute_lifecycle
+
+        recompute_lifecycle(db, wizard_id)
+        db.commit()
 
         state_info = WizardProtectionService.get_wizard_state(db, wizard_id)
-        new_state = state_info["state"]
-
-        # Update wizard lifecycle state if changed
-        if wizard.lifecycle_state != new_state:
-            wizard.lifecycle_state = new_state
-
-            # Set first_run_at if transitioning from draft
-            if new_state in [WizardState.IN_USE, WizardState.PUBLISHED] and not wizard.first_run_at:
-                first_run = (
-                    db.query(WizardRun)
-                    .filter(WizardRun.wizard_id == wizard_id)
-                    .order_by(WizardRun.started_at)
-                    .first()
-                )
-                if first_run:
-                    wizard.first_run_at = first_run.started_at
-
-            # Set first_stored_run_at if transitioning to published
-            if new_state == WizardState.PUBLISHED and not wizard.first_stored_run_at:
-                first_stored_run = (
-                    db.query(WizardRun)
-                    .filter(WizardRun.wizard_id == wizard_id, WizardRun.is_stored == True)
-                    .order_by(WizardRun.completed_at)
-                    .first()
-                )
-                if first_stored_run:
-                    wizard.first_stored_run_at = first_stored_run.completed_at
-
-            db.commit()
-
-        return new_state
+        return state_info["state"] if state_info else None
 
     @staticmethod
-    def delete_all_runs_for_wizard(db: Session, wizard_id: UUID) -> int:
+    def delete_all_runs_for_wizard(db: Session, wizard_id: UUID, requested_by: Optional[UUID] = None):
         """
-        Delete all runs for a wizard (used when user confirms in-use modification).
+        Schedule deletion of all runs for a wizard (used when user confirms in-use modification).
+        Runs are deleted in the background in small batches; the wizard returns to draft
+        once the last batch is gone.
 
         Returns:
-            Number of runs deleted
+            The BackgroundJob tracking the deletion
         """
-        count = db.query(WizardRun).filter(WizardRun.wizard_id == wizard_id).count()
-
-        # Delete all runs (cascade will handle responses and uploads)
-        db.query(WizardRun).filter(WizardRun.wizard_id == wizard_id).delete()
-        db.commit()
+        from app.services.run_deletion import run_deletion_service
 
-        # Reset wizard to draft state
-        wizard = db.query(Wizard).filter(Wizard.id == wizard_id).first()
-        if wizard:
-            wizard.lifecycle_state = WizardState.DRAFT
-            wizard.first_run_at = None
-            wizard.first_stored_run_at = None
-            db.commit()
-
-        return count
+        return run_deletion_service.schedule_wizard_runs(db, wizard_id, requested_by)
 
     @staticmethod
     def archive_wizard(db: Session, wizard_id: UUID) -> bool:
@@ -256,21 +262,26 @@ class WizardProtectionService:
 
     @staticmethod
     def create_wizard_version(
-        db: Session, wizard_id: UUID, new_name: Optional[str] = None
+        db: Session, wizard_id: UUID, new_name: Optional[str] = None, created_by: Optional[UUID] = None
     ) -> Optional[Wizard]:
         """
         Create a new version of an existing wizard.
         Links to parent via parent_wizard_id, increments version_number.
+        The source is snapshotted and the new version starts from that snapshot: only
+        its wizard row and root node are written, and its step rows are created when
+        the draft is first read or edited (wizard_versions.checkout_tree).
 
         Args:
             db: Database session
             wizard_id: UUID of the wizard to version
             new_name: Optional new name for the version
+            created_by: User creating the version (recorded on the snapshots)
 
         Returns:
-            The new wizard version, or None if failed
+            The new wizard version (steps not written yet), or None if failed
         """
-        from app.crud.wizard import wizard_crud
+        from app.services.wizard_cloner import clone_wizard_tree
+        from app.services.wizard_versions import snapshot_wizard, branch_version
 
         original_wizard = db.query(Wizard).filter(Wizard.id == wizard_id).first()
         if not original_wizard:
@@ -292,20 +303,29 @@ class WizardProtectionService:
         if not new_name:
             new_name = f"{original_wizard.name} v{new_version_number}"
 
-        # Create the clone with version metadata
-        cloned_wizard = wizard_crud.clone_wizard(
-            db=db,
-            wizard_id=wizard_id,
-            new_name=new_name,
-            created_by=original_wizard.created_by,
+        # Snapshot the source (only steps changed since its last snapshot are hashed),
+        # then create the new wizard row on that snapshot without copying any steps
+        source_version = snapshot_wizard(
+            db, wizard_id,
+            label=f"v{original_wizard.version_number or 1}",
+            created_by=created_by,
+            commit=False,
+        )
+        new_wizard_id = clone_wizard_tree(
+            db,
+            wizard_id,
+            new_name,
+            original_wizard.created_by,
+            parent_wizard_id=wizard_id,
+            version_number=new_version_number,
+            copy_tree=False,
+            commit=False,
         )
+        if not new_wizard_id:
+            db.rollback()
+            return None
 
-        if cloned_wizard:
-            # Set version metadata
-            cloned_wizard.parent_wizard_id = wizard_id
-            cloned_wizard.version_number = new_version_number
-            cloned_wizard.lifecycle_state = WizardState.DRAFT  # New version starts as draft
-            db.commit()
-            db.refresh(cloned_wizard)
+        branch_version(db, new_wizard_id, source_version, label=f"v{new_version_number}", created_by=created_by)
+        db.commit()
 
-        return cloned_wizard
+        return db.get(Wizard, new_wizard_id)
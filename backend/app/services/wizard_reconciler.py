@@ -0,0 +1,250 @@
+"""
+Wizard Structure Reconciler
+
+Applies an edited step tree to a stored wizard without recreating it:
+1. The stored steps, option sets and options are loaded with one flat query each
+2. Incoming nodes are matched by ID, falling back to a natural key among unmatched
+   siblings (step_order for steps, name for option sets, value for options);
+   the edit impact dry run uses the same matcher (match_tree)
+3. Only changed rows are updated, new rows inserted and missing rows deleted,
+   all in the caller's transaction; steps whose order changes are first moved
+   below the used orders, as UNIQUE(wizard_id, step_order) is not deferrable
+
+Matched rows keep their IDs, so run responses and option dependencies that
+reference them survive structural edits.
+"""
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set
+from uuid import UUID
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.models.wizard import Step, OptionSet, Option
+from app.schemas.wizard import StepCreate
+from app.services import audit_log
+
+LEVELS = ("steps", "option_sets", "options")  # Parents first
+MODELS = {"steps": Step, "option_sets": OptionSet, "options": Option}
+PARENT_ATTRS = {"steps": "wizard_id", "option_sets": "step_id", "options": "option_set_id"}
+KEY_ATTRS = {"steps": "step_order", "option_sets": "name", "options": "value"}  # Fallback natural keys
+NODE_EXCLUDE = {"steps": {"id", "option_sets"}, "option_sets": {"id", "options"}, "options": {"id"}}
+
+
+def _incoming_ids(steps_in: List[StepCreate]) -> Set[UUID]:
+    ids = set()
+    for step_in in steps_in:
+        ids.add(step_in.id)
+        for option_set_in in step_in.option_sets:
+            ids.add(option_set_in.id)
+            ids.update(option_in.id for option_in in option_set_in.options)
+    ids.discard(None)
+    return ids
+
+
+def _fallback_index(stored: Iterable, parent_attr: str, key_attr: str, explicit_ids: Set[UUID]) -> Dict:
+    """Stored rows not claimed by an explicit incoming ID, grouped by (parent, natural key)."""
+    index = defaultdict(list)
+    for obj in stored:
+        if obj.id not in explicit_ids:
+            index[(getattr(obj, parent_attr), getattr(obj, key_attr))].append(obj)
+    return index
+
+
+def _resolve(node_id: Optional[UUID], stored: Dict, fallback: Dict, fallback_key: tuple, claimed: Set[UUID]):
+    obj = stored.get(node_id) if node_id else None
+    if obj is None or obj.id in claimed:
+        obj = None
+        for candidate in fallback.get(fallback_key, []):
+            if candidate.id not in claimed:
+                obj = candidate
+                break
+    if obj is not None:
+        claimed.add(obj.id)
+    return obj
+
+
+def _park_reordered_steps(db: Session, plan: "ReconciliationPlan", stored_steps: Dict[UUID, Step]) -> None:
+    """
+    Move steps out of the way of the new step orders before they are written.
+
+    UNIQUE(wizard_id, step_order) is not deferrable, so swapping two steps or inserting
+    one ahead of others would collide row by row. Every step whose order changes, or
+    that is removed while its order is reused, is first shifted below all current and
+    new orders in one statement; the flush then writes the final orders.
+    """
+    final_orders = {match.row_id: match.node.step_order for match in plan.matches if match.level == "steps"}
+    taken = set(final_orders.values())
+    parked = [
+        step.id for step in stored_steps.values()
+        if (final_orders[step.id] != step.step_order if step.id in final_orders else step.step_order in taken)
+    ]
+    if not parked:
+        return
+    orders = [step.step_order for step in stored_steps.values()] + list(taken)
+    # Bypasses the session so the loaded rows keep their original order for change
+    # detection (and the audit log records original -> final)
+    db.execute(
+        update(Step)
+        .where(Step.id.in_(parked))
+        .values(step_order=Step.step_order - (max(orders) - min(orders) + 1))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _changed_values(obj, values: Dict) -> Dict:
+    """Only the attributes whose value differs, so unchanged rows produce no UPDATE."""
+    return {name: value for name, value in values.items() if getattr(obj, name) != value}
+
+
+@dataclass
+class NodeMatch:
+    """An incoming node and the stored row it is applied to."""
+    level: str
+    node: Any  # StepCreate, OptionSetCreate or OptionCreate
+    row_id: UUID  # ID of the matched stored row, or a new ID to insert under
+    parent_id: UUID
+    stored: Optional[Any] = None  # Matched stored row; None for an insert
+
+
+@dataclass
+class ReconciliationPlan:
+    """Result of matching an incoming step tree against the stored rows."""
+    matches: List[NodeMatch] = field(default_factory=list)  # Parents before their children
+    # Per level, the stored IDs that are "removed" and "moved" (option sets also "retyped")
+    changes: Dict[str, Dict[str, Set[UUID]]] = field(default_factory=lambda: {
+        "steps": {"removed": set(), "moved": set()},
+        "option_sets": {"removed": set(), "moved": set(), "retyped": set()},
+        "options": {"removed": set(), "moved": set()},
+    })
+
+
+def match_tree(wizard_id: UUID, steps_in: List[StepCreate], stored: Dict[str, Dict[UUID, Any]]) -> ReconciliationPlan:
+    """
+    Match an incoming step tree against stored rows; shared by the dry run and the write.
+
+    Args:
+        wizard_id: UUID of the wizard being edited
+        steps_in: Complete new step tree
+        stored: Per level, stored rows by ID (ORM objects or rows with the match columns)
+
+    Returns:
+        ReconciliationPlan with one match per incoming node and the structural changes
+    """
+    explicit_ids = _incoming_ids(steps_in)
+    fallback = {
+        level: _fallback_index(stored[level].values(), PARENT_ATTRS[level], KEY_ATTRS[level], explicit_ids)
+        for level in LEVELS
+    }
+    claimed: Set[UUID] = set()
+    plan = ReconciliationPlan()
+
+    def _match(level, node, parent_id, key) -> NodeMatch:
+        row = _resolve(node.id, stored[level], fallback[level], (parent_id, key), claimed)
+        if row is not None and getattr(row, PARENT_ATTRS[level]) != parent_id:
+            plan.changes[level]["moved"].add(row.id)
+        # New nodes get their ID now, so their children can only match by explicit ID
+        match = NodeMatch(level, node, row.id if row is not None else uuid.uuid4(), parent_id, row)
+        plan.matches.append(match)
+        return match
+
+    for step_in in steps_in:
+        step = _match("steps", step_in, wizard_id, step_in.step_order)
+        for option_set_in in step_in.option_sets:
+            option_set = _match("option_sets", option_set_in, step.row_id, option_set_in.name)
+            if option_set.stored is not None and option_set.stored.selection_type != option_set_in.selection_type:
+                plan.changes["option_sets"]["retyped"].add(option_set.row_id)
+            for option_in in option_set_in.options:
+                _match("options", option_in, option_set.row_id, option_in.value)
+
+    for level in LEVELS:
+        plan.changes[level]["removed"] = {row_id for row_id in stored[level] if row_id not in claimed}
+    return plan
+
+
+def plan_reconciliation(db: Session, wizard_id: UUID, steps_in: List[StepCreate]) -> Dict[str, Dict[str, Set[UUID]]]:
+    """
+    Dry run of reconcile_wizard_steps: which stored rows an incoming tree would keep,
+    move to another parent or delete. Reads only IDs and match keys and writes nothing.
+
+    Returns:
+        Per level, the sets of "removed" and "moved" stored IDs; option sets also
+        report "retyped" (selection_type changes)
+    """
+    stored = {
+        "steps": {
+            row.id: row for row in
+            db.query(Step.id, Step.wizard_id, Step.step_order).filter(Step.wizard_id == wizard_id)
+        },
+        "option_sets": {
+            row.id: row for row in
+            db.query(OptionSet.id, OptionSet.step_id, OptionSet.name, OptionSet.selection_type)
+            .join(Step).filter(Step.wizard_id == wizard_id)
+        },
+        "options": {
+            row.id: row for row in
+            db.query(Option.id, Option.option_set_id, Option.value)
+            .join(OptionSet).join(Step).filter(Step.wizard_id == wizard_id)
+        },
+    }
+    return match_tree(wizard_id, steps_in, stored).changes
+
+
+def reconcile_wizard_steps(db: Session, wizard_id: UUID, steps_in: List[StepCreate]) -> Dict[str, Dict[str, int]]:
+    """
+    Reconcile a wizard's stored steps/option sets/options with an incoming tree.
+    Flushes but does not commit.
+
+    Args:
+        db: Database session
+        wizard_id: UUID of the wizard being edited
+        steps_in: Complete new step tree; nodes may carry the ID of an existing row
+
+    Returns:
+        Counts of inserted, updated and deleted rows per level
+    """
+    stored = {
+        "steps": {s.id: s for s in db.query(Step).filter(Step.wizard_id == wizard_id)},
+        "option_sets": {
+            os.id: os for os in db.query(OptionSet).join(Step).filter(Step.wizard_id == wizard_id)
+        },
+        "options": {
+            o.id: o for o in db.query(Option).join(OptionSet).join(Step).filter(Step.wizard_id == wizard_id)
+        },
+    }
+    plan = match_tree(wizard_id, steps_in, stored)
+    stats = {level: {"inserted": 0, "updated": 0, "deleted": 0} for level in LEVELS}
+    _park_reordered_steps(db, plan, stored["steps"])
+
+    for match in plan.matches:
+        values = {
+            **match.node.model_dump(exclude=NODE_EXCLUDE[match.level]),
+            PARENT_ATTRS[match.level]: match.parent_id,
+        }
+        if match.stored is None:
+            db.add(MODELS[match.level](id=match.row_id, **values))
+            stats[match.level]["inserted"] += 1
+            continue
+        changes = _changed_values(match.stored, values)
+        if changes:
+            for field_name, value in changes.items():
+                setattr(match.stored, field_name, value)
+            stats[match.level]["updated"] += 1
+
+    # Write moves and inserts before deleting, so rows re-parented away from a
+    # removed step or option set are not taken by its ON DELETE CASCADE
+    db.flush()
+
+    for level in reversed(LEVELS):
+        removed = plan.changes[level]["removed"]
+        if not removed:
+            continue
+        model = MODELS[level]
+        stats[level]["deleted"] = db.query(model).filter(model.id.in_(removed)).delete(synchronize_session=False)
+        # Bulk deletes bypass the flush hooks
+        for row_id in removed:
+            audit_log.record(db, "delete", model.__tablename__, row_id)
+
+    return stats
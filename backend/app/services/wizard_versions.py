@@ -0,0 +1,422 @@
+"""
+Wizard Version Store
+
+Immutable, content-addressed snapshots of wizard trees that share unchanged
+subtrees between versions:
+1. Every node (wizard, step, option set, option) is stored once under the SHA-256 of
+   its kind, fields and child hashes (a Merkle tree). Row IDs are not part of the
+   content, so identical subtrees of different versions and cloned wizards share nodes
+2. A snapshot only loads and hashes steps whose subtree stamp (row counts and latest
+   update times) changed since the wizard's previous snapshot, and only inserts nodes
+   that are not stored yet, so its cost follows the changed nodes
+3. Diffs compare hashes top down and only load the nodes of differing subtrees
+4. A new wizard version starts as a snapshot that shares the source's step nodes;
+   its step rows are written from the nodes when the draft is first read or edited
+
+An option's dependencies are part of its node and name their target by its step
+order, option set name and leaf hash (its fields without dependencies), which
+survives cloning and identifies the target when rows are written from the nodes.
+"""
+import hashlib
+import json
+import uuid
+from collections import Counter, defaultdict
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import text, bindparam, insert
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID, insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.models.wizard import Wizard, Step, OptionSet, Option, OptionDependency, WizardTreeNode, WizardVersion
+from app.services import audit_log
+
+WIZARD_FIELDS = (
+    "name", "description", "category_id", "icon", "cover_image", "allow_templates", "require_login",
+    "allow_anonymous", "auto_save", "auto_save_interval", "abandon_after_hours", "estimated_time",
+    "difficulty_level", "tags",
+)
+STEP_FIELDS = (
+    "name", "description", "help_text", "step_order", "is_required", "is_skippable",
+    "allow_back_navigation", "layout", "custom_styles", "validation_rules",
+)
+OPTION_SET_FIELDS = (
+    "name", "description", "selection_type", "is_required", "min_selections", "max_selections",
+    "min_value", "max_value", "regex_pattern", "custom_validation", "display_order", "placeholder",
+    "help_text", "step_increment",
+)
+OPTION_FIELDS = (
+    "label", "value", "description", "display_order", "icon", "image_url", "is_default",
+    "is_recommended", "is_active", "option_metadata",
+)
+# Numeric columns are stored as strings in node content
+DECIMAL_FIELDS = {"min_value", "max_value", "step_increment"}
+
+# Children are matched by these fields when a diff pairs changed nodes
+MATCH_FIELD = {"step": "name", "option_set": "name", "option": "value"}
+CHILD_KIND = {"wizard": "step", "step": "option_set", "option_set": "option"}
+
+# Anything that changes a step's subtree (or a dependency target) changes its stamp
+STEP_STAMPS_SQL = text("""
+    SELECT s.id, s.step_order,
+           concat_ws('|', s.updated_at, os.n, os.latest, o.n, o.latest, d.n, d.latest, d.target_latest) AS stamp
+    FROM steps s
+    LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS n, MAX(x.updated_at) AS latest
+        FROM option_sets x WHERE x.step_id = s.id
+    ) os ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS n, MAX(p.updated_at) AS latest
+        FROM options p JOIN option_sets x ON x.id = p.option_set_id
+        WHERE x.step_id = s.id
+    ) o ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS n, MAX(dep.created_at) AS latest,
+               GREATEST(MAX(t.updated_at), MAX(tx.updated_at), MAX(ts.updated_at)) AS target_latest
+        FROM option_dependencies dep
+        JOIN options p ON p.id = dep.option_id
+        JOIN option_sets x ON x.id = p.option_set_id
+        JOIN options t ON t.id = dep.depends_on_option_id
+        JOIN option_sets tx ON tx.id = t.option_set_id
+        JOIN steps ts ON ts.id = tx.step_id
+        WHERE x.step_id = s.id
+    ) d ON TRUE
+    WHERE s.wizard_id = :wizard_id
+    ORDER BY s.step_order, s.id
+""").bindparams(bindparam("wizard_id", type_=PG_UUID(as_uuid=True)))
+
+
+def _fields(obj, names: Sequence[str]) -> Dict[str, Any]:
+    return {name: getattr(obj, name) for name in names}
+
+
+def _node(kind: str, content: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """Hash a node; returns (hash, JSON content as stored)."""
+    payload = json.dumps({"kind": kind, **content}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest(), json.loads(payload)
+
+
+def _leaf_hash(content: Dict[str, Any]) -> str:
+    """Hash of an option's own fields, by which dependencies name their target."""
+    return _node("option", {name: content.get(name) for name in OPTION_FIELDS})[0]
+
+
+def _row_values(content: Dict[str, Any], names: Sequence[str]) -> Dict[str, Any]:
+    """Column values of a row written from node content."""
+    return {
+        name: Decimal(content[name]) if name in DECIMAL_FIELDS and content.get(name) is not None else content.get(name)
+        for name in names
+    }
+
+
+class _TreeHasher:
+    """Hashes the subtrees of a set of steps of one wizard, collecting the nodes it creates."""
+
+    def __init__(self, db: Session, wizard_id: UUID):
+        self.db = db
+        self.wizard_id = wizard_id
+        self.nodes: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+
+    def add(self, kind: str, content: Dict[str, Any]) -> str:
+        node_hash, stored = _node(kind, content)
+        self.nodes[node_hash] = (kind, stored)
+        return node_hash
+
+    def hash_steps(self, step_ids: List[UUID]) -> Dict[UUID, str]:
+        """Hashes of the given steps' subtrees, loaded with one query per level."""
+        if not step_ids:
+            return {}
+        steps = self.db.query(Step).filter(Step.id.in_(step_ids)).all()
+        option_sets = self.db.query(OptionSet).filter(OptionSet.step_id.in_(step_ids))\
+            .order_by(OptionSet.display_order, OptionSet.id).all()
+        options = self.db.query(Option).filter(Option.option_set_id.in_([o.id for o in option_sets]))\
+            .order_by(Option.display_order, Option.id).all() if option_sets else []
+        dependencies = self.db.query(
+            OptionDependency.option_id, OptionDependency.dependency_type, OptionDependency.depends_on_option_id,
+        ).filter(OptionDependency.option_id.in_([o.id for o in options])).all() if options else []
+
+        # Dependency targets may live in unchanged steps; targets in other wizards are left out, as clones drop them
+        targets = {
+            target.id: [step_order, option_set_name, _leaf_hash(_fields(target, OPTION_FIELDS))]
+            for target, option_set_name, step_order in self.db.query(Option, OptionSet.name, Step.step_order)
+            .join(OptionSet, OptionSet.id == Option.option_set_id).join(Step, Step.id == OptionSet.step_id)
+            .filter(Option.id.in_({d.depends_on_option_id for d in dependencies}), Step.wizard_id == self.wizard_id)
+        } if dependencies else {}
+
+        dependencies_of: Dict[UUID, List[list]] = defaultdict(list)
+        for dependency in dependencies:
+            if dependency.depends_on_option_id in targets:
+                dependencies_of[dependency.option_id].append([dependency.dependency_type, *targets[dependency.depends_on_option_id]])
+
+        options_of: Dict[UUID, List[str]] = defaultdict(list)
+        for option in options:
+            options_of[option.option_set_id].append(self.add("option", {
+                **_fields(option, OPTION_FIELDS),
+                "dependencies": sorted(dependencies_of.get(option.id, [])),
+            }))
+        option_sets_of: Dict[UUID, List[str]] = defaultdict(list)
+        for option_set in option_sets:
+            option_sets_of[option_set.step_id].append(self.add("option_set", {
+                **_fields(option_set, OPTION_SET_FIELDS), "children": options_of.get(option_set.id, []),
+            }))
+        return {
+            step.id: self.add("step", {**_fields(step, STEP_FIELDS), "children": option_sets_of.get(step.id, [])})
+            for step in steps
+        }
+
+
+def _store_nodes(db: Session, nodes: Dict[str, Tuple[str, Dict[str, Any]]]) -> int:
+    """Insert nodes that are not stored yet. Returns how many were new."""
+    if not nodes:
+        return 0
+    result = db.execute(
+        pg_insert(WizardTreeNode)
+        .values([{"hash": node_hash, "kind": kind, "content": content} for node_hash, (kind, content) in nodes.items()])
+        .on_conflict_do_nothing(index_elements=["hash"])
+        .returning(WizardTreeNode.hash)
+    )
+    return len(result.all())
+
+
+def latest_version(db: Session, wizard_id: UUID) -> Optional[WizardVersion]:
+    return db.query(WizardVersion).filter(WizardVersion.wizard_id == wizard_id)\
+        .order_by(WizardVersion.sequence.desc()).first()
+
+
+def snapshot_wizard(
+    db: Session,
+    wizard_id: UUID,
+    *,
+    label: Optional[str] = None,
+    created_by: Optional[UUID] = None,
+    commit: bool = True,
+) -> Optional[WizardVersion]:
+    """
+    Record a snapshot of a wizard's current tree.
+
+    Args:
+        db: Database session
+        wizard_id: UUID of the wizard
+        label: Optional label (e.g. "v2")
+        created_by: UUID of the user taking the snapshot
+        commit: Commit the transaction (callers composing a larger unit pass False)
+
+    Returns:
+        The new version, the previous one if nothing changed, or None if the wizard does not exist
+    """
+    checkout_tree(db, wizard_id, commit=False)
+    wizard = db.query(Wizard).filter(Wizard.id == wizard_id).first()
+    if wizard is None:
+        return None
+
+    previous = latest_version(db, wizard_id)
+    known = {UUID(step_id): entry for step_id, entry in ((previous.step_stamps or {}) if previous else {}).items()}
+    stamps = db.execute(STEP_STAMPS_SQL, {"wizard_id": wizard_id}).all()
+
+    step_hashes: Dict[UUID, str] = {}
+    changed: List[UUID] = []
+    for step in stamps:
+        if step.id in known and known[step.id]["stamp"] == step.stamp:
+            step_hashes[step.id] = known[step.id]["hash"]
+        else:
+            changed.append(step.id)
+
+    hasher = _TreeHasher(db, wizard_id)
+    step_hashes.update(hasher.hash_steps(changed))
+    root_hash = hasher.add("wizard", {
+        **_fields(wizard, WIZARD_FIELDS), "children": [step_hashes[step.id] for step in stamps],
+    })
+    step_stamps = {str(step.id): {"stamp": step.stamp, "hash": step_hashes[step.id]} for step in stamps}
+
+    if previous is not None and previous.root_hash == root_hash:
+        previous.step_stamps = step_stamps  # Same content, fresher stamps
+        if commit:
+            db.commit()
+        return previous
+
+    version = WizardVersion(
+        wizard_id=wizard_id,
+        sequence=(previous.sequence if previous else 0) + 1,
+        label=label,
+        root_hash=root_hash,
+        step_stamps=step_stamps,
+        new_node_count=_store_nodes(db, hasher.nodes),
+        created_by=created_by,
+    )
+    db.add(version)
+    if commit:
+        db.commit()
+        db.refresh(version)
+    else:
+        db.flush()
+    return version
+
+
+def branch_version(
+    db: Session,
+    wizard_id: UUID,
+    source_version: WizardVersion,
+    *,
+    label: Optional[str] = None,
+    created_by: Optional[UUID] = None,
+) -> WizardVersion:
+    """
+    Give a new wizard (a row without steps) the tree of another wizard's snapshot.
+
+    Only the new wizard's root node is stored; every step node is shared with the
+    source. No step rows are written: the wizard is marked pending and its rows are
+    created by checkout_tree when the tree is first needed. Does not commit.
+    """
+    wizard = db.query(Wizard).filter(Wizard.id == wizard_id).one()
+    children = _load_nodes(db, [source_version.root_hash])[source_version.root_hash]["children"]
+    root_hash, root = _node("wizard", {**_fields(wizard, WIZARD_FIELDS), "children": children})
+
+    version = WizardVersion(
+        wizard_id=wizard_id,
+        sequence=1,
+        label=label,
+        root_hash=root_hash,
+        step_stamps={},  # Filled in at checkout, once the steps have rows
+        new_node_count=_store_nodes(db, {root_hash: ("wizard", root)}),
+        created_by=created_by,
+    )
+    db.add(version)
+    db.flush()
+    wizard.pending_version_id = version.id
+    db.flush()
+    return version
+
+
+def checkout_tree(db: Session, wizard_id: UUID, *, commit: bool = True) -> bool:
+    """
+    Write the step, option set, option and dependency rows of a pending wizard
+    from its snapshot (one multi-row INSERT per table). A no-op for other wizards.
+
+    Args:
+        db: Database session
+        wizard_id: UUID of the wizard
+        commit: Commit the transaction (callers composing a larger unit pass False)
+
+    Returns:
+        True if rows were written
+    """
+    if db.query(Wizard.pending_version_id).filter(Wizard.id == wizard_id).scalar() is None:
+        return False
+    # Lock the wizard and re-read: a concurrent checkout may have finished meanwhile
+    version_id = db.query(Wizard.pending_version_id).filter(Wizard.id == wizard_id).with_for_update().scalar()
+    if version_id is None:
+        return False
+    version = db.get(WizardVersion, version_id)
+
+    step_hashes = _load_nodes(db, [version.root_hash])[version.root_hash]["children"]
+    step_nodes = _load_nodes(db, step_hashes)
+    set_nodes = _load_nodes(db, [h for node in step_nodes.values() for h in node["children"]])
+    option_nodes = _load_nodes(db, [h for node in set_nodes.values() for h in node["children"]])
+
+    rows: Dict[type, List[Dict[str, Any]]] = {Step: [], OptionSet: [], Option: [], OptionDependency: []}
+    hash_of_step: Dict[UUID, str] = {}
+    targets: Dict[str, List[Tuple[list, UUID]]] = defaultdict(list)  # leaf hash -> ([step order, set name], option id)
+    dependencies: List[Tuple[UUID, list]] = []
+    for step_hash in step_hashes:
+        step = step_nodes[step_hash]
+        step_id = uuid.uuid4()
+        hash_of_step[step_id] = step_hash
+        rows[Step].append({"id": step_id, "wizard_id": wizard_id, **_row_values(step, STEP_FIELDS)})
+        for set_hash in step["children"]:
+            option_set = set_nodes[set_hash]
+            option_set_id = uuid.uuid4()
+            rows[OptionSet].append({"id": option_set_id, "step_id": step_id, **_row_values(option_set, OPTION_SET_FIELDS)})
+            for option_hash in option_set["children"]:
+                option = option_nodes[option_hash]
+                option_id = uuid.uuid4()
+                rows[Option].append({"id": option_id, "option_set_id": option_set_id, **_row_values(option, OPTION_FIELDS)})
+                targets[_leaf_hash(option)].append(([step["step_order"], option_set["name"]], option_id))
+                dependencies.extend((option_id, reference) for reference in option.get("dependencies", []))
+
+    for option_id, (dependency_type, *position, leaf) in dependencies:
+        target_id = next((target for place, target in targets.get(leaf, []) if not position or place == position), None)
+        if target_id is not None:
+            rows[OptionDependency].append({
+                "id": uuid.uuid4(), "option_id": option_id, "depends_on_option_id": target_id,
+                "dependency_type": dependency_type,
+            })
+
+    for model, model_rows in rows.items():
+        if model_rows:
+            db.execute(insert(model), model_rows)
+
+    # The rows now hold exactly the snapshot, so the next snapshot skips every unchanged step
+    version.step_stamps = {
+        str(step.id): {"stamp": step.stamp, "hash": hash_of_step[step.id]}
+        for step in db.execute(STEP_STAMPS_SQL, {"wizard_id": wizard_id})
+    }
+    db.query(Wizard).filter(Wizard.id == wizard_id).update({Wizard.pending_version_id: None})
+
+    # Bulk inserts bypass the flush hooks, so record the checkout explicitly
+    audit_log.record(db, "update", Wizard.__tablename__, wizard_id, new_values={
+        "checked_out_version_id": version.id,
+        **{model.__tablename__: len(model_rows) for model, model_rows in rows.items()},
+    })
+
+    if commit:
+        db.commit()
+    return True
+
+
+def _load_nodes(db: Session, hashes) -> Dict[str, Dict[str, Any]]:
+    hashes = set(hashes)
+    if not hashes:
+        return {}
+    return {node.hash: node.content for node in db.query(WizardTreeNode.hash, WizardTreeNode.content).filter(WizardTreeNode.hash.in_(hashes))}
+
+
+def _changed_fields(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    keys = (set(old) | set(new)) - {"kind", "children"}
+    return sorted(key for key in keys if old.get(key) != new.get(key))
+
+
+def _diff_children(db: Session, kind: str, old_hashes: List[str], new_hashes: List[str]) -> Dict[str, Any]:
+    """Diff two child lists: equal hashes are unchanged without loading them; the rest are paired by name/value."""
+    unchanged = Counter(old_hashes) & Counter(new_hashes)
+    old_rest = list((Counter(old_hashes) - unchanged).elements())
+    new_rest = list((Counter(new_hashes) - unchanged).elements())
+    nodes = _load_nodes(db, old_rest + new_rest)
+
+    match = MATCH_FIELD[kind]
+    unmatched_old: Dict[Any, List[str]] = defaultdict(list)
+    for node_hash in old_rest:
+        unmatched_old[nodes[node_hash].get(match)].append(node_hash)
+
+    diff = {"unchanged": sum(unchanged.values()), "added": [], "removed": [], "changed": []}
+    for node_hash in new_rest:
+        new = nodes[node_hash]
+        candidates = unmatched_old.get(new.get(match))
+        if not candidates:
+            diff["added"].append(new.get(match))
+            continue
+        old = nodes[candidates.pop(0)]
+        entry = {match: new.get(match), "fields": _changed_fields(old, new)}
+        if kind in CHILD_KIND:
+            entry[CHILD_KIND[kind] + "s"] = _diff_children(db, CHILD_KIND[kind], old.get("children", []), new.get("children", []))
+        diff["changed"].append(entry)
+    diff["removed"] = [key for key, remaining in unmatched_old.items() for _ in remaining]
+    return diff
+
+
+def diff_versions(db: Session, from_version: WizardVersion, to_version: WizardVersion) -> Dict[str, Any]:
+    """
+    Structural diff between two snapshots (of the same or different wizards).
+
+    Returns:
+        {"identical", "wizard_fields", "steps": {"unchanged", "added", "removed", "changed": [...]}};
+        changed entries nest option_sets and options the same way
+    """
+    roots = _load_nodes(db, [from_version.root_hash, to_version.root_hash])
+    old, new = roots[from_version.root_hash], roots[to_version.root_hash]
+    return {
+        "identical": from_version.root_hash == to_version.root_hash,
+        "wizard_fields": _changed_fields(old, new),
+        "steps": _diff_children(db, "step", old.get("children", []), new.get("children", [])),
+    }
+
@@ -0,0 +1,29 @@
+-- Migration: Background Jobs
+-- Purpose: Progress tracking for chunked background run deletion (delete-all-runs)
+-- Created: 2026-10-19
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS background_jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    job_type VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    params JSONB DEFAULT '{}',
+    total INTEGER,
+    processed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_by UUID REFERENCES users(id) ON DELETE SET NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    started_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS idx_background_jobs_status ON background_jobs(status);
+
+COMMIT;
+
+-- Rollback script (save for reference)
+-- BEGIN;
+-- DROP TABLE IF EXISTS background_jobs;
+-- COMMIT;
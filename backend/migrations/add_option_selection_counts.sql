@@ -0,0 +1,39 @@
+-- Migration: Option Popularity Index
+-- Purpose: GIN index on selected_options and incrementally maintained per-option/day selection counts
+-- Created: 2026-10-19
+
+BEGIN;
+
+-- Containment lookups on selected option arrays (selected_options @> ARRAY[...])
+CREATE INDEX IF NOT EXISTS idx_wizard_run_option_set_responses_selected_options
+    ON wizard_run_option_set_responses USING GIN (selected_options);
+
+-- Per-option, per-day selection counts (day = UTC day the response was created)
+CREATE TABLE IF NOT EXISTS option_selection_counts (
+    option_id UUID NOT NULL REFERENCES options(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    option_set_id UUID NOT NULL REFERENCES option_sets(id) ON DELETE CASCADE,
+    selection_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (option_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_option_selection_counts_option_set_day
+    ON option_selection_counts(option_set_id, day);
+
+-- Backfill from existing responses
+INSERT INTO option_selection_counts (option_id, option_set_id, day, selection_count)
+SELECT o.id, o.option_set_id, (r.created_at AT TIME ZONE 'UTC')::date, COUNT(*)
+FROM wizard_run_option_set_responses r
+CROSS JOIN LATERAL unnest(r.selected_options) AS sel(option_id)
+JOIN options o ON o.id = sel.option_id
+GROUP BY o.id, o.option_set_id, (r.created_at AT TIME ZONE 'UTC')::date
+ON CONFLICT (option_id, day) DO UPDATE
+SET selection_count = EXCLUDED.selection_count;
+
+COMMIT;
+
+-- Rollback script (save for reference)
+-- BEGIN;
+-- DROP TABLE IF EXISTS option_selection_counts;
+-- DROP INDEX IF EXISTS idx_wizard_run_option_set_responses_selected_options;
+-- COMMIT;
@@ -0,0 +1,38 @@
+-- Migration: Run Archive
+-- Purpose: Cold tier for old completed/abandoned wizard runs (one JSONB document per run)
+-- Created: 2026-10-19
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS wizard_run_archives (
+    id UUID PRIMARY KEY,
+    wizard_id UUID NOT NULL REFERENCES wizards(id) ON DELETE CASCADE,
+    user_id UUID REFERENCES users(id) ON DELETE SET NULL,
+    status VARCHAR(20) NOT NULL,
+    started_at TIMESTAMP WITH TIME ZONE,
+    completed_at TIMESTAMP WITH TIME ZONE,
+    last_accessed_at TIMESTAMP WITH TIME ZONE,
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    share_tokens TEXT[],
+    document JSONB NOT NULL
+);
+
+-- Documents are large and rarely read: compress them with lz4 (PostgreSQL 14+)
+ALTER TABLE wizard_run_archives ALTER COLUMN document SET COMPRESSION lz4;
+
+CREATE INDEX IF NOT EXISTS idx_wizard_run_archives_wizard_id ON wizard_run_archives(wizard_id);
+CREATE INDEX IF NOT EXISTS idx_wizard_run_archives_share_tokens ON wizard_run_archives USING GIN (share_tokens);
+
+-- Archive candidates: completed/abandoned runs by last access
+CREATE INDEX IF NOT EXISTS idx_wizard_runs_archive_candidates
+    ON wizard_runs(last_accessed_at)
+    WHERE status IN ('completed', 'abandoned');
+
+COMMIT;
+
+-- Rollback script (save for reference)
+-- Restore archived runs first (RunArchiveService.restore), or they are lost.
+-- BEGIN;
+-- DROP INDEX IF EXISTS idx_wizard_runs_archive_candidates;
+-- DROP TABLE IF EXISTS wizard_run_archives;
+-- COMMIT;
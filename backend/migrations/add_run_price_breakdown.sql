@@ -0,0 +1,18 @@
+-- Migration: Run Price Breakdown
+-- Purpose: Per option set price contributions behind incremental WizardRun.calculated_price updates
+-- Created: 2026-10-19
+
+BEGIN;
+
+ALTER TABLE wizard_runs
+    ADD COLUMN IF NOT EXISTS price_breakdown JSONB;
+
+-- Existing runs get a breakdown on their next saved response, or all at once via
+-- POST /api/v1/wizards/{wizard_id}/recompute-prices
+
+COMMIT;
+
+-- Rollback script (save for reference)
+-- BEGIN;
+-- ALTER TABLE wizard_runs DROP COLUMN IF EXISTS price_breakdown;
+-- COMMIT;
@@ -0,0 +1,19 @@
+-- Migration: Stale Run Sweeper
+-- Purpose: Per-wizard inactivity threshold and partial index for abandoning stale in-progress runs
+-- Created: 2026-10-19
+
+BEGIN;
+
+ALTER TABLE wizards ADD COLUMN IF NOT EXISTS abandon_after_hours INTEGER;
+
+CREATE INDEX IF NOT EXISTS idx_wizard_runs_in_progress_last_accessed
+    ON wizard_runs(last_accessed_at)
+    WHERE status = 'in_progress';
+
+COMMIT;
+
+-- Rollback script (save for reference)
+-- BEGIN;
+-- DROP INDEX IF EXISTS idx_wizard_runs_in_progress_last_accessed;
+-- ALTER TABLE wizards DROP COLUMN IF EXISTS abandon_after_hours;
+-- COMMIT;
@@ -0,0 +1,75 @@
+-- Migration: Incremental Template Rating Aggregates
+-- Purpose: Store rating count/sum/per-star buckets on wizard_templates so rating writes
+--          no longer recompute AVG over all ratings, and enforce one rating per user
+-- Created: 2026-10-19
+
+BEGIN;
+
+ALTER TABLE wizard_templates
+ADD COLUMN IF NOT EXISTS rating_sum INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN IF NOT EXISTS rating_count INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN IF NOT EXISTS rating_1_count INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN IF NOT EXISTS rating_2_count INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN IF NOT EXISTS rating_3_count INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN IF NOT EXISTS rating_4_count INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN IF NOT EXISTS rating_5_count INTEGER NOT NULL DEFAULT 0;
+
+-- Keep only the most recent rating per user and template before adding the constraint
+DELETE FROM wizard_template_ratings r
+USING wizard_template_ratings newer
+WHERE r.template_id = newer.template_id
+  AND r.user_id = newer.user_id
+  AND (r.created_at, r.id) < (newer.created_at, newer.id);
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint WHERE conname = 'uq_wizard_template_ratings_template_user'
+    ) THEN
+        ALTER TABLE wizard_template_ratings
+        ADD CONSTRAINT uq_wizard_template_ratings_template_user UNIQUE (template_id, user_id);
+    END IF;
+END $$;
+
+-- Backfill aggregates from existing ratings
+UPDATE wizard_templates t
+SET rating_count = COALESCE(a.rating_count, 0),
+    rating_sum = COALESCE(a.rating_sum, 0),
+    rating_1_count = COALESCE(a.rating_1_count, 0),
+    rating_2_count = COALESCE(a.rating_2_count, 0),
+    rating_3_count = COALESCE(a.rating_3_count, 0),
+    rating_4_count = COALESCE(a.rating_4_count, 0),
+    rating_5_count = COALESCE(a.rating_5_count, 0),
+    average_rating = CASE
+        WHEN COALESCE(a.rating_count, 0) > 0 THEN ROUND(a.rating_sum::numeric / a.rating_count, 2)
+        ELSE 0
+    END
+FROM wizard_templates t2
+LEFT JOIN (
+    SELECT template_id,
+           COUNT(*) AS rating_count,
+           SUM(rating) AS rating_sum,
+           COUNT(*) FILTER (WHERE rating = 1) AS rating_1_count,
+           COUNT(*) FILTER (WHERE rating = 2) AS rating_2_count,
+           COUNT(*) FILTER (WHERE rating = 3) AS rating_3_count,
+           COUNT(*) FILTER (WHERE rating = 4) AS rating_4_count,
+           COUNT(*) FILTER (WHERE rating = 5) AS rating_5_count
+    FROM wizard_template_ratings
+    GROUP BY template_id
+) a ON a.template_id = t2.id
+WHERE t.id = t2.id;
+
+COMMIT;
+
+-- Rollback script (save for reference)
+-- BEGIN;
+-- ALTER TABLE wizard_template_ratings DROP CONSTRAINT IF EXISTS uq_wizard_template_ratings_template_user;
+-- ALTER TABLE wizard_templates
+--     DROP COLUMN IF EXISTS rating_sum,
+--     DROP COLUMN IF EXISTS rating_count,
+--     DROP COLUMN IF EXISTS rating_1_count,
+--     DROP COLUMN IF EXISTS rating_2_count,
+--     DROP COLUMN IF EXISTS rating_3_count,
+--     DROP COLUMN IF EXISTS rating_4_count,
+--     DROP COLUMN IF EXISTS rating_5_count;
+-- COMMIT;
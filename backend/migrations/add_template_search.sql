@@ -0,0 +1,37 @@
+-- Migration: Full-Text and Fuzzy Template Search
+-- Purpose: Replace ILIKE '%term%' scans with a weighted tsvector (GIN) and pg_trgm name matching
+-- Created: 2026-10-19
+
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- array_to_string is only STABLE; generated columns need an IMMUTABLE expression
+CREATE OR REPLACE FUNCTION wizard_template_tags_text(text[]) RETURNS text
+    LANGUAGE sql IMMUTABLE AS $$ SELECT coalesce(array_to_string($1, ' '), '') $$;
+
+-- Weighted search document: name (A) > description (B) > category and tags (C)
+ALTER TABLE wizard_templates
+ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(template_name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(template_description, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(category, '')), 'C') ||
+    setweight(to_tsvector('english', wizard_template_tags_text(tags)), 'C')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_wizard_templates_search_vector
+    ON wizard_templates USING GIN (search_vector);
+
+-- Typo-tolerant name matching
+CREATE INDEX IF NOT EXISTS idx_wizard_templates_name_trgm
+    ON wizard_templates USING GIN (template_name gin_trgm_ops);
+
+COMMIT;
+
+-- Rollback script (save for reference)
+-- BEGIN;
+-- DROP INDEX IF EXISTS idx_wizard_templates_name_trgm;
+-- DROP INDEX IF EXISTS idx_wizard_templates_search_vector;
+-- ALTER TABLE wizard_templates DROP COLUMN IF EXISTS search_vector;
+-- DROP FUNCTION IF EXISTS wizard_template_tags_text(text[]);
+-- COMMIT;
@@ -0,0 +1,28 @@
+-- Migration: Similar Templates Index
+-- Purpose: Precomputed top-k neighbor table behind GET /wizard-templates/{id}/similar
+-- Created: 2026-10-19
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS wizard_template_similarities (
+    template_id UUID NOT NULL REFERENCES wizard_templates(id) ON DELETE CASCADE,
+    similar_template_id UUID NOT NULL REFERENCES wizard_templates(id) ON DELETE CASCADE,
+    rank INTEGER NOT NULL,
+    score DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (template_id, similar_template_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_wizard_template_similarities_rank
+    ON wizard_template_similarities(template_id, rank);
+
+CREATE INDEX IF NOT EXISTS idx_wizard_template_similarities_similar
+    ON wizard_template_similarities(similar_template_id);
+
+-- The table is filled on application startup when empty (full rebuild)
+
+COMMIT;
+
+-- Rollback script (save for reference)
+-- BEGIN;
+-- DROP TABLE IF EXISTS wizard_template_similarities;
+-- COMMIT;
@@ -0,0 +1,19 @@
+-- Migration: Lazy Version Checkout
+-- Purpose: New wizard versions reference their source snapshot until their step rows are first needed
+-- Created: 2026-10-19
+
+BEGIN;
+
+ALTER TABLE wizards
+    ADD COLUMN IF NOT EXISTS pending_version_id UUID REFERENCES wizard_versions(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS idx_wizards_pending_version ON wizards(pending_version_id)
+    WHERE pending_version_id IS NOT NULL;
+
+COMMIT;
+
+-- Rollback script (save for reference)
+-- BEGIN;
+-- DROP INDEX IF EXISTS idx_wizards_pending_version;
+-- ALTER TABLE wizards DROP COLUMN IF EXISTS pending_version_id;
+-- COMMIT;
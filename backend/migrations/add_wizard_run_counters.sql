@@ -0,0 +1,49 @@
+-- Migration: Wizard Run Counters
+-- Purpose: Run counters maintained with lifecycle_state in the run write transaction
+-- Created: 2026-10-19
+
+BEGIN;
+
+ALTER TABLE wizards
+    ADD COLUMN IF NOT EXISTS run_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS stored_run_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS in_progress_run_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS completed_run_count INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill counters and resynchronize lifecycle fields that drifted
+UPDATE wizards w
+SET run_count = c.runs,
+    stored_run_count = c.stored,
+    in_progress_run_count = c.in_progress,
+    completed_run_count = c.completed,
+    lifecycle_state = CASE
+        WHEN c.runs = 0 THEN 'draft'
+        WHEN c.stored > 0 THEN 'published'
+        ELSE 'in_use'
+    END,
+    first_run_at = c.first_run_at,
+    first_stored_run_at = CASE WHEN c.runs = 0 THEN NULL ELSE COALESCE(w.first_stored_run_at, c.first_stored_run_at) END
+FROM (
+    SELECT wz.id AS wizard_id,
+           COUNT(r.id) AS runs,
+           COUNT(r.id) FILTER (WHERE r.is_stored) AS stored,
+           COUNT(r.id) FILTER (WHERE r.status = 'in_progress') AS in_progress,
+           COUNT(r.id) FILTER (WHERE r.status = 'completed') AS completed,
+           MIN(r.started_at) AS first_run_at,
+           MIN(r.completed_at) FILTER (WHERE r.is_stored) AS first_stored_run_at
+    FROM wizards wz
+    LEFT JOIN wizard_runs r ON r.wizard_id = wz.id
+    GROUP BY wz.id
+) c
+WHERE w.id = c.wizard_id;
+
+COMMIT;
+
+-- Rollback script (save for reference)
+-- BEGIN;
+-- ALTER TABLE wizards
+-- DROP COLUMN IF EXISTS run_count,
+-- DROP COLUMN IF EXISTS stored_run_count,
+-- DROP COLUMN IF EXISTS in_progress_run_count,
+-- DROP COLUMN IF EXISTS completed_run_count;
+-- COMMIT;
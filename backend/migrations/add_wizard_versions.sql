@@ -0,0 +1,33 @@
+-- Migration: Wizard Version Store
+-- Purpose: Content-addressed wizard tree nodes shared between version snapshots
+-- Created: 2026-10-19
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS wizard_tree_nodes (
+    hash VARCHAR(64) PRIMARY KEY,
+    kind VARCHAR(20) NOT NULL CONSTRAINT check_tree_node_kind CHECK (kind IN ('wizard', 'step', 'option_set', 'option')),
+    content JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS wizard_versions (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    wizard_id UUID NOT NULL REFERENCES wizards(id) ON DELETE CASCADE,
+    sequence INTEGER NOT NULL,
+    label VARCHAR(255),
+    root_hash VARCHAR(64) NOT NULL REFERENCES wizard_tree_nodes(hash),
+    step_stamps JSONB DEFAULT '{}',
+    new_node_count INTEGER DEFAULT 0,
+    created_by UUID REFERENCES users(id) ON DELETE SET NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    CONSTRAINT uq_wizard_versions_wizard_sequence UNIQUE (wizard_id, sequence)
+);
+
+COMMIT;
+
+-- Rollback script (save for reference)
+-- BEGIN;
+-- DROP TABLE IF EXISTS wizard_versions;
+-- DROP TABLE IF EXISTS wizard_tree_nodes;
+-- COMMIT;
@@ -0,0 +1,71 @@
+"""
+Export or import a wizard bundle (gzip-compressed NDJSON of templates and wizards).
+
+Usage:
+    python wizard_bundle.py export bundle.ndjson.gz [--no-templates] [--no-wizards]
+    python wizard_bundle.py import bundle.ndjson.gz [--owner admin@wizardplatform.com]
+
+Imports skip templates and wizards whose name already exists, so they can be re-run.
+"""
+import argparse
+import json
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app.models.user import User, UserRole
+from app.services.wizard_bundle import stream_bundle, import_bundle
+
+
+def export_command(args):
+    with open(args.path, "wb") as f:
+        for chunk in stream_bundle(include_templates=args.templates, include_wizards=args.wizards):
+            f.write(chunk)
+    print(f"[OK] Bundle written to {args.path}")
+
+
+def import_command(args):
+    db = SessionLocal()
+    try:
+        query = db.query(User)
+        if args.owner:
+            owner = query.filter(User.email == args.owner).first()
+        else:
+            owner = query.join(UserRole)\
+                .filter(UserRole.name.in_(["admin", "super_admin"]))\
+                .order_by(User.created_at)\
+                .first()
+        if not owner:
+            print("[ERROR] Owner user not found (use --owner with an existing email)")
+            sys.exit(1)
+
+        with open(args.path, "rb") as f:
+            stats = import_bundle(db, f, owner_id=owner.id)
+        print(json.dumps(stats, indent=2, default=str))
+        print(f"[OK] Imported bundle {args.path} as {owner.email}")
+    except Exception as e:
+        db.rollback()
+        print(f"[ERROR] Import failed: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import wizard bundles")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Write a bundle of active templates and wizards")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--no-templates", dest="templates", action="store_false")
+    export_parser.add_argument("--no-wizards", dest="wizards", action="store_false")
+    export_parser.set_defaults(func=export_command)
+
+    import_parser = subparsers.add_parser("import", help="Load a bundle (idempotent by name)")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--owner", help="Email of the user who will own imported wizards (default: first admin)")
+    import_parser.set_defaults(func=import_command)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -234,7 +234,7 @@ const WizardBuilderPage: React.FC = () => {
       refetchProtection();
     },
     onError: (error: any) => {
-      setSnackbar({ open: true, message: error.response?.data?.detail || 'Failed to delete runs', severity: 'error' });
+      setSnackbar({ open: true, message: error.response?.data?.detail || error.message || 'Failed to delete runs', severity: 'error' });
     },
   });
 
@@ -1,6 +1,18 @@
 import api from './api';
 import { Wizard, WizardListItem, WizardCategory, OptionDependency, DependencyType } from '../types';
 
+export interface BackgroundJob {
+  id: string;
+  job_type: string;
+  status: 'pending' | 'running' | 'completed' | 'failed';
+  total?: number;
+  processed: number;
+  error?: string;
+  created_at: string;
+  started_at?: string;
+  finished_at?: string;
+}
+
 export const wizardService = {
   async getWizards(params?: {
     skip?: number;
@@ -104,10 +116,31 @@ export const wizardService = {
     await api.post(`/wizards/${wizardId}/unarchive`);
   },
 
-  async deleteAllWizardRuns(wizardId: string): Promise<{ message: string; count: number }> {
-    const response = await api.post(`/wizards/${wizardId}/delete-all-runs`, null, {
+  async getDeletionJob(jobId: string): Promise<BackgroundJob> {
+    const response = await api.get<BackgroundJob>(`/wizards/deletion-jobs/${jobId}`);
+    return response.data;
+  },
+
+  // Runs are deleted in the background; resolves once the job has finished and
+  // rejects if it is still unfinished after maxWaitMs (the job keeps running)
+  async deleteAllWizardRuns(wizardId: string, pollIntervalMs = 1000, maxWaitMs = 300000): Promise<BackgroundJob> {
+    const response = await api.post<BackgroundJob>(`/wizards/${wizardId}/delete-all-runs`, null, {
       params: { confirm: true },
     });
-    return response.data;
+    let job = response.data;
+    const deadline = Date.now() + maxWaitMs;
+    while (job.status === 'pending' || job.status === 'running') {
+      if (Date.now() >= deadline) {
+        throw new Error(
+          `Run deletion is still ${job.status} (${job.processed}${job.total != null ? ` of ${job.total}` : ''} deleted); check again later`
+        );
+      }
+      await new Promise((resolve) => setTimeout(resolve, pollIntervalMs));
+      job = await wizardService.getDeletionJob(job.id);
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Failed to delete runs');
+    }
+    return job;
   },
 };
@@ -102,6 +102,7 @@ export interface Wizard {
   allow_anonymous: boolean;
   auto_save: boolean;
   auto_save_interval: number;
+  abandon_after_hours?: number | null;
   estimated_time?: number;
   difficulty_level?: 'easy' | 'medium' | 'hard';
   tags: string[];